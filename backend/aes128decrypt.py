@@ -4,11 +4,25 @@ AES-128 decryption (translated from Go implementation in `aes128_decrypt.go`).
 Notes:
 - This mirrors the original Go logic (including the simplified key expansion used there).
 - No external AES libraries are used.
-- A small helper encryption implementation (matching the Go client) and a roundtrip test are included under `__main__`.
+- `aes128_decrypt` is table-driven: the key schedule is computed once per key, and
+  inverse shift rows + inverse S-box + inverse mix columns are merged into four
+  256-entry lookup tables of 32-bit column words. `aes128_decrypt_reference` keeps the
+  straightforward byte-by-byte version for comparison.
+- `aes128_decrypt_batch` runs the same table-driven rounds over the blocks of many
+  messages at once with NumPy.
+- `aes128_encrypt` / `aes128_encrypt_base64` are the matching encryptor (PKCS#7 padding),
+  used to build encrypted fixtures.
+- Running this file benchmarks every implementation:
+  `python aes128decrypt.py [--sizes 32,256] [--messages N]`. Roundtrip tests live in
+  tests/test_aes128.py.
 """
 
 import base64
-from typing import List
+import binascii
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
 
 # Inverse S-box (256 values)
 InvSBox: List[int] = [
@@ -140,19 +154,131 @@ def inv_mix_columns(data: bytearray) -> bytearray:
 	return data
 
 
-def remove_pad_from_data(data: bytearray) -> bytearray:
+def padding_length(data) -> int:
+	"""Number of trailing pad bytes `remove_pad_from_data` would strip (0 = none)."""
 	if not data:
-		return data
+		return 0
 	padding = data[-1]
 	if padding > 16 or padding == 0:
-		return data
+		return 0
 	# Note: the original Go function checked only first/last pad byte equality
 	if data[-1] != data[-padding]:
-		return data
-	return data[:-padding]
+		return 0
+	return padding
+
+
+def remove_pad_from_data(data: bytearray) -> bytearray:
+	padding = padding_length(data)
+	return data[:-padding] if padding else data
+
+
+# ---------------------------------------------------------------------------
+# Table-driven implementation
+# ---------------------------------------------------------------------------
+# The state of a block is row-major (byte 4 * row + col). It is held as four column
+# words, row 0 in the most significant byte.
+
+def _mul_table(factor: int) -> List[int]:
+	return [gf_mul(a, factor) for a in range(256)]
+
+
+MUL9 = _mul_table(0x09)
+MUL11 = _mul_table(0x0b)
+MUL13 = _mul_table(0x0d)
+MUL14 = _mul_table(0x0e)
+
+_MUL = {0x09: MUL9, 0x0b: MUL11, 0x0d: MUL13, 0x0e: MUL14}
+
+
+def _inv_mix_word(row: int, value: int) -> int:
+	"""Column word contributed by byte `value` sitting in `row`, after inverse mix columns."""
+	word = 0
+	for k in range(4):
+		word = (word << 8) | _MUL[invMixtureMatrix[k * 4 + row]][value]
+	return word
+
+
+# T_row[b]: inverse S-box then inverse mix columns of a byte in that row.
+# Inverse shift rows is applied by choosing which column word feeds each row.
+InvT0 = [_inv_mix_word(0, s) for s in InvSBox]
+InvT1 = [_inv_mix_word(1, s) for s in InvSBox]
+InvT2 = [_inv_mix_word(2, s) for s in InvSBox]
+InvT3 = [_inv_mix_word(3, s) for s in InvSBox]
+
+
+def _column_words(block: bytes) -> Tuple[int, int, int, int]:
+	return tuple(
+		(block[c] << 24) | (block[4 + c] << 16) | (block[8 + c] << 8) | block[12 + c]
+		for c in range(4)
+	)
+
+
+def _inv_mix_column_words(words: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+	return tuple(
+		_inv_mix_word(0, w >> 24) ^ _inv_mix_word(1, (w >> 16) & 0xff)
+		^ _inv_mix_word(2, (w >> 8) & 0xff) ^ _inv_mix_word(3, w & 0xff)
+		for w in words
+	)
+
+
+@lru_cache(maxsize=32)
+def _decrypt_schedule(key: bytes):
+	"""
+	Round keys in the form the table-driven rounds use:
+	- last round key as column words (initial AddRoundKey)
+	- rounds 9..1: InvMixColumns(round key), since mixing is linear and the key is
+	  added before mixing in the reference code
+	- round 0 key as plain bytes (final round has no mixing)
+	"""
+	ex = expand_key(key)
+	words = [_column_words(ex[r * 16:r * 16 + 16]) for r in range(11)]
+	middle = tuple(_inv_mix_column_words(words[r]) for r in range(9, 0, -1))
+	return words[10], middle, bytes(ex[0:16])
 
 
 def aes128_decrypt(data: bytearray, initial_key: bytearray = initialKey) -> bytearray:
+	"""
+	Bit-exact with `aes128_decrypt_reference`, without modifying `data`.
+	`data` may be any bytes-like object (bytes, bytearray, memoryview).
+	"""
+	n = len(data)
+	if n % 16:
+		raise ValueError("data length must be a multiple of 16")
+	k10, middle, k = _decrypt_schedule(bytes(initial_key))
+	t0, t1, t2, t3, inv = InvT0, InvT1, InvT2, InvT3, InvSBox
+
+	out = bytearray(n)
+	for i in range(0, n, 16):
+		d = data[i:i + 16]
+		c0 = ((d[0] << 24) | (d[4] << 16) | (d[8] << 8) | d[12]) ^ k10[0]
+		c1 = ((d[1] << 24) | (d[5] << 16) | (d[9] << 8) | d[13]) ^ k10[1]
+		c2 = ((d[2] << 24) | (d[6] << 16) | (d[10] << 8) | d[14]) ^ k10[2]
+		c3 = ((d[3] << 24) | (d[7] << 16) | (d[11] << 8) | d[15]) ^ k10[3]
+		for dk in middle:
+			c0, c1, c2, c3 = (
+				t0[c0 >> 24] ^ t1[(c3 >> 16) & 0xff] ^ t2[(c2 >> 8) & 0xff] ^ t3[c1 & 0xff] ^ dk[0],
+				t0[c1 >> 24] ^ t1[(c0 >> 16) & 0xff] ^ t2[(c3 >> 8) & 0xff] ^ t3[c2 & 0xff] ^ dk[1],
+				t0[c2 >> 24] ^ t1[(c1 >> 16) & 0xff] ^ t2[(c0 >> 8) & 0xff] ^ t3[c3 & 0xff] ^ dk[2],
+				t0[c3 >> 24] ^ t1[(c2 >> 16) & 0xff] ^ t2[(c1 >> 8) & 0xff] ^ t3[c0 & 0xff] ^ dk[3],
+			)
+		# Round 0: inverse shift rows + inverse S-box + round key, no mixing
+		out[i:i + 16] = (
+			inv[c0 >> 24] ^ k[0], inv[c1 >> 24] ^ k[1], inv[c2 >> 24] ^ k[2], inv[c3 >> 24] ^ k[3],
+			inv[(c3 >> 16) & 0xff] ^ k[4], inv[(c0 >> 16) & 0xff] ^ k[5],
+			inv[(c1 >> 16) & 0xff] ^ k[6], inv[(c2 >> 16) & 0xff] ^ k[7],
+			inv[(c2 >> 8) & 0xff] ^ k[8], inv[(c3 >> 8) & 0xff] ^ k[9],
+			inv[(c0 >> 8) & 0xff] ^ k[10], inv[(c1 >> 8) & 0xff] ^ k[11],
+			inv[c1 & 0xff] ^ k[12], inv[c2 & 0xff] ^ k[13], inv[c3 & 0xff] ^ k[14], inv[c0 & 0xff] ^ k[15],
+		)
+	# Strip padding in place instead of copying a slice
+	padding = padding_length(out)
+	if padding:
+		del out[-padding:]
+	return out
+
+
+def aes128_decrypt_reference(data: bytearray, initial_key: bytearray = initialKey) -> bytearray:
+	"""Original byte-by-byte implementation (decrypts `data` in place)."""
 	expanded_key = expand_key(initial_key)
 	# Work on a copy to avoid side effects unless caller expects in-place
 	if len(expanded_key) != 176:
@@ -170,9 +296,241 @@ def aes128_decrypt(data: bytearray, initial_key: bytearray = initialKey) -> byte
 	# remove padding as the Go code does
 	return remove_pad_from_data(data)
 
-def aes128_decrypt_base64(data: bytearray, initial_key: bytearray = initialKey) -> bytearray:
-    data_array = bytearray(base64.b64decode(str(data)))
-    return aes128_decrypt(data_array, initial_key)
+def _b64decode(data) -> bytes:
+	# Bytes-like (incl. memoryview) or ASCII str, decoded directly: no str() round trip.
+	# Same non-strict rules as base64.b64decode (characters outside the alphabet are skipped).
+	return binascii.a2b_base64(data)
+
+
+def aes128_decrypt_base64(data, initial_key: bytearray = initialKey) -> bytearray:
+	"""base64 text (bytes-like or str) -> decrypted, unpadded bytes."""
+	return aes128_decrypt(_b64decode(data), initial_key)
+
+
+# ---------------------------------------------------------------------------
+# Batch (NumPy) implementation
+# ---------------------------------------------------------------------------
+# Below this many blocks the per-call NumPy overhead outweighs vectorization
+BATCH_MIN_BLOCKS = 64
+
+_NP_INV_T = np.array([InvT0, InvT1, InvT2, InvT3], dtype=np.uint32)
+_NP_INV_SBOX = np.array(InvSBox, dtype=np.uint8)
+# Inverse shift rows: row r of output column j comes from input column (j - r) % 4
+_ROW1_SRC = np.array([3, 0, 1, 2])
+_ROW2_SRC = np.array([2, 3, 0, 1])
+_ROW3_SRC = np.array([1, 2, 3, 0])
+
+
+@lru_cache(maxsize=32)
+def _decrypt_schedule_np(key: bytes):
+	k10, middle, k0 = _decrypt_schedule(key)
+	return (
+		np.array(k10, dtype=np.uint32),
+		[np.array(dk, dtype=np.uint32) for dk in middle],
+		np.frombuffer(k0, dtype=np.uint8).reshape(4, 4),
+	)
+
+
+def decrypt_blocks_np(blocks: np.ndarray, initial_key: bytes = initialKey) -> np.ndarray:
+	"""(n, 16) uint8 ciphertext blocks -> (n, 16) uint8 plaintext blocks, no padding removal."""
+	k10, middle, k0 = _decrypt_schedule_np(bytes(initial_key))
+	t0, t1, t2, t3 = _NP_INV_T
+
+	d = blocks.reshape(-1, 4, 4).astype(np.uint32)  # [block, row, col]
+	c = ((d[:, 0] << 24) | (d[:, 1] << 16) | (d[:, 2] << 8) | d[:, 3]) ^ k10  # [block, col]
+	for dk in middle:
+		c = (
+			t0[c >> 24]
+			^ t1[((c >> 16) & 0xff)[:, _ROW1_SRC]]
+			^ t2[((c >> 8) & 0xff)[:, _ROW2_SRC]]
+			^ t3[(c & 0xff)[:, _ROW3_SRC]]
+			^ dk
+		)
+
+	inv = _NP_INV_SBOX
+	out = np.stack((
+		inv[c >> 24],
+		inv[((c >> 16) & 0xff)[:, _ROW1_SRC]],
+		inv[((c >> 8) & 0xff)[:, _ROW2_SRC]],
+		inv[(c & 0xff)[:, _ROW3_SRC]],
+	), axis=1)
+	out ^= k0
+	return out.reshape(-1, 16)
+
+
+def aes128_decrypt_batch(
+	messages: Sequence[bytes],
+	initial_key: bytearray = initialKey,
+) -> List[Optional[bytearray]]:
+	"""
+	Decrypt many messages at once; result i matches `aes128_decrypt(messages[i])`.
+	Messages whose length is not a multiple of 16 yield None instead of failing the batch.
+	"""
+	results: List[Optional[bytearray]] = [None] * len(messages)
+	valid = [i for i, m in enumerate(messages) if len(m) % 16 == 0]
+	total = sum(len(messages[i]) for i in valid)
+
+	if total < BATCH_MIN_BLOCKS * 16:
+		for i in valid:
+			results[i] = aes128_decrypt(messages[i], initial_key)
+		return results
+
+	blocks = np.frombuffer(b"".join(messages[i] for i in valid), dtype=np.uint8).reshape(-1, 16)
+	plain = memoryview(decrypt_blocks_np(blocks, initial_key).reshape(-1))
+	offset = 0
+	for i in valid:
+		end = offset + len(messages[i])
+		out = bytearray(plain[offset:end])
+		padding = padding_length(out)
+		if padding:
+			del out[-padding:]
+		results[i] = out
+		offset = end
+	return results
+
+
+def aes128_decrypt_base64_batch(
+	items: Sequence[bytes],
+	initial_key: bytearray = initialKey,
+) -> List[Optional[bytearray]]:
+	"""Batch counterpart of `aes128_decrypt_base64`; invalid base64 or lengths yield None."""
+	decoded: List[bytes] = []
+	index: List[int] = []
+	for i, item in enumerate(items):
+		try:
+			decoded.append(_b64decode(item))
+			index.append(i)
+		except ValueError:
+			continue
+	results: List[Optional[bytearray]] = [None] * len(items)
+	for i, plain in zip(index, aes128_decrypt_batch(decoded, initial_key)):
+		results[i] = plain
+	return results
+
+
+# ---------------------------------------------------------------------------
+# Encryption (inverse of the rounds above, for fixtures and roundtrip tests)
+# ---------------------------------------------------------------------------
+MUL2 = _mul_table(0x02)
+MUL3 = _mul_table(0x03)
+
+_MIX_MUL = {0x01: list(range(256)), 0x02: MUL2, 0x03: MUL3}
+
+
+def _mix_word(row: int, value: int) -> int:
+	"""Column word contributed by byte `value` sitting in `row`, after mix columns."""
+	word = 0
+	for k in range(4):
+		word = (word << 8) | _MIX_MUL[mixtureMatrix[k * 4 + row]][value]
+	return word
+
+
+# T_row[b]: S-box then mix columns; shift rows (left) picks the source column word
+T0 = [_mix_word(0, s) for s in SBox]
+T1 = [_mix_word(1, s) for s in SBox]
+T2 = [_mix_word(2, s) for s in SBox]
+T3 = [_mix_word(3, s) for s in SBox]
+
+
+@lru_cache(maxsize=32)
+def _encrypt_schedule(key: bytes):
+	ex = expand_key(key)
+	words = [_column_words(ex[r * 16:r * 16 + 16]) for r in range(11)]
+	return words[0], tuple(words[1:10]), bytes(ex[160:176])
+
+
+def pad_data(data: bytes) -> bytearray:
+	"""PKCS#7: always 1..16 bytes, so `remove_pad_from_data` strips it unambiguously."""
+	padding = 16 - len(data) % 16
+	return bytearray(data) + bytes([padding]) * padding
+
+
+def aes128_encrypt(data: bytes, initial_key: bytearray = initialKey) -> bytearray:
+	"""
+	Pad and encrypt `data`; `aes128_decrypt(aes128_encrypt(x)) == x`.
+	Decryption in reverse: AddRoundKey(0), then SubBytes, ShiftRows (left), MixColumns,
+	AddRoundKey(r) for r = 1..9, and a last round without MixColumns using key 10.
+	"""
+	padded = pad_data(data)
+	k0, middle, k = _encrypt_schedule(bytes(initial_key))
+	t0, t1, t2, t3, sbox = T0, T1, T2, T3, SBox
+
+	out = bytearray(len(padded))
+	for i in range(0, len(padded), 16):
+		d = padded[i:i + 16]
+		c0 = ((d[0] << 24) | (d[4] << 16) | (d[8] << 8) | d[12]) ^ k0[0]
+		c1 = ((d[1] << 24) | (d[5] << 16) | (d[9] << 8) | d[13]) ^ k0[1]
+		c2 = ((d[2] << 24) | (d[6] << 16) | (d[10] << 8) | d[14]) ^ k0[2]
+		c3 = ((d[3] << 24) | (d[7] << 16) | (d[11] << 8) | d[15]) ^ k0[3]
+		for rk in middle:
+			c0, c1, c2, c3 = (
+				t0[c0 >> 24] ^ t1[(c1 >> 16) & 0xff] ^ t2[(c2 >> 8) & 0xff] ^ t3[c3 & 0xff] ^ rk[0],
+				t0[c1 >> 24] ^ t1[(c2 >> 16) & 0xff] ^ t2[(c3 >> 8) & 0xff] ^ t3[c0 & 0xff] ^ rk[1],
+				t0[c2 >> 24] ^ t1[(c3 >> 16) & 0xff] ^ t2[(c0 >> 8) & 0xff] ^ t3[c1 & 0xff] ^ rk[2],
+				t0[c3 >> 24] ^ t1[(c0 >> 16) & 0xff] ^ t2[(c1 >> 8) & 0xff] ^ t3[c2 & 0xff] ^ rk[3],
+			)
+		out[i:i + 16] = (
+			sbox[c0 >> 24] ^ k[0], sbox[c1 >> 24] ^ k[1], sbox[c2 >> 24] ^ k[2], sbox[c3 >> 24] ^ k[3],
+			sbox[(c1 >> 16) & 0xff] ^ k[4], sbox[(c2 >> 16) & 0xff] ^ k[5],
+			sbox[(c3 >> 16) & 0xff] ^ k[6], sbox[(c0 >> 16) & 0xff] ^ k[7],
+			sbox[(c2 >> 8) & 0xff] ^ k[8], sbox[(c3 >> 8) & 0xff] ^ k[9],
+			sbox[(c0 >> 8) & 0xff] ^ k[10], sbox[(c1 >> 8) & 0xff] ^ k[11],
+			sbox[c3 & 0xff] ^ k[12], sbox[c0 & 0xff] ^ k[13], sbox[c1 & 0xff] ^ k[14], sbox[c2 & 0xff] ^ k[15],
+		)
+	return out
+
+
+def aes128_encrypt_base64(data, initial_key: bytearray = initialKey) -> str:
+	"""str (UTF-8) or bytes -> base64 text, as an encrypting device publishes it."""
+	if isinstance(data, str):
+		data = data.encode("utf-8")
+	return base64.b64encode(bytes(aes128_encrypt(data, initial_key))).decode("ascii")
+
+
+# ---------------------------------------------------------------------------
+# Throughput benchmark (python aes128decrypt.py); roundtrip tests: tests/test_aes128.py
+# ---------------------------------------------------------------------------
+def _benchmark(sizes: Sequence[int], messages: int) -> None:
+	import json
+	import os
+	import time
+
+	def run(fn, count: int, total_bytes: int, name: str, size: int) -> None:
+		started = time.perf_counter()
+		fn()
+		elapsed = time.perf_counter() - started
+		print(f"{size:>6} B  {name:<18} {count / elapsed:>12,.0f} msg/s  {total_bytes / elapsed / 1e6:>8.2f} MB/s")
+
+	print(f"{'size':>8}  {'variant':<18} {'throughput':>18}  {'ciphertext':>13}")
+	for size in sizes:
+		# Realistic plaintext: JSON of roughly `size` bytes
+		plain = [json.dumps({"ts": 1700000000 + i, "v": os.urandom(max(0, size - 40) // 2).hex()}).encode() for i in range(messages)]
+		cts = [bytes(aes128_encrypt(p)) for p in plain]
+		b64 = [base64.b64encode(ct).decode("ascii") for ct in cts]
+		total = sum(len(ct) for ct in cts)
+
+		# The reference is ~30x slower: time a subset
+		ref_count = max(1, min(messages, 20000 // max(size, 16)))
+		ref_bytes = sum(len(ct) for ct in cts[:ref_count])
+		run(lambda: [aes128_decrypt_reference(bytearray(ct)) for ct in cts[:ref_count]], ref_count, ref_bytes, "reference", size)
+		run(lambda: [aes128_decrypt(ct) for ct in cts], messages, total, "table", size)
+		run(lambda: aes128_decrypt_batch(cts), messages, total, "batch", size)
+		run(lambda: [aes128_decrypt_base64(s) for s in b64], messages, total, "table+base64", size)
+		run(lambda: aes128_decrypt_base64_batch(b64), messages, total, "batch+base64", size)
+		for chunk in (16, 64, 256):
+			run(
+				lambda: [aes128_decrypt_batch(cts[i:i + chunk]) for i in range(0, messages, chunk)],
+				messages, total, f"batch/{chunk}", size
+			)
+		run(lambda: [aes128_encrypt(p) for p in plain], messages, total, "encrypt", size)
+
 
 if __name__ == "__main__":
-	exit("Nothing to see here. Run tests instead.")
\ No newline at end of file
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Throughput benchmark for the custom AES-128")
+	parser.add_argument("--sizes", default="32,128,512,2048", help="plaintext sizes in bytes, comma separated")
+	parser.add_argument("--messages", type=int, default=2000, help="messages per size")
+	args = parser.parse_args()
+
+	_benchmark([int(s) for s in args.sizes.split(",")], args.messages)
\ No newline at end of file
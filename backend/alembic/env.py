@@ -10,7 +10,7 @@ import sys
 import os 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from app.models import Base  # Import Base chứa các models
+from app.models import data as model_data  # Migration chạy trên DATA DB (bảng dữ liệu cảm biến)
 from app.config import settings
 
 # this is the Alembic Config object, which provides
@@ -26,7 +26,7 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel 
 # target_metadata = mymodel.Base.metadata
-target_metadata = Base.metadata
+target_metadata = model_data.BaseData.metadata
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -35,7 +35,7 @@ target_metadata = Base.metadata
 
 
 def run_migrations_offline() -> None:
-    url = settings.DATABASE_URL 
+    url = settings.DATA_DB_URL
     
     context.configure(
         url=url,
@@ -77,7 +77,7 @@ async def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
 
     configuration = config.get_section(config.config_ini_section)
-    configuration["sqlalchemy.url"] = settings.DATABASE_URL
+    configuration["sqlalchemy.url"] = settings.DATA_DB_URL
     # -----------------------------------------------
 
     connectable = async_engine_from_config(
@@ -0,0 +1,59 @@
+"""sensor_rollups keyed per device
+
+Revision ID: 3f1c2a7d9b40
+Revises: 88c875be05eb
+Create Date: 2026-10-18 18:20:11.402315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a7d9b40'
+down_revision: Union[str, Sequence[str], None] = '88c875be05eb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BUCKET_COLUMNS = ['station_id', 'device_id', 'sensor_type', 'metric', 'resolution', 'bucket_start']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('sensor_rollups'):
+        op.create_table(
+            'sensor_rollups',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('station_id', sa.Integer(), nullable=False),
+            sa.Column('device_id', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('sensor_type', sa.String(), nullable=False),
+            sa.Column('metric', sa.String(), nullable=False),
+            sa.Column('resolution', sa.String(), nullable=False),
+            sa.Column('bucket_start', sa.BigInteger(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('min', sa.Float(), nullable=False),
+            sa.Column('max', sa.Float(), nullable=False),
+            sa.Column('sum', sa.Float(), nullable=False),
+            sa.Column('mean', sa.Float(), nullable=False),
+            sa.Column('last', sa.Float(), nullable=False),
+            sa.Column('last_ts', sa.BigInteger(), nullable=False),
+            sa.UniqueConstraint(*BUCKET_COLUMNS, name='uq_sensor_rollup_bucket'),
+        )
+        op.create_index('ix_sensor_rollups_station_id', 'sensor_rollups', ['station_id'])
+        op.create_index('ix_sensor_rollups_bucket_start', 'sensor_rollups', ['bucket_start'])
+        return
+
+    # Bảng tạo trước khi bucket có device_id: dòng cũ = 0 (không rõ thiết bị), đổi unique key
+    if 'device_id' in {column['name'] for column in inspector.get_columns('sensor_rollups')}:
+        return
+    op.add_column('sensor_rollups', sa.Column('device_id', sa.Integer(), nullable=False, server_default='0'))
+    op.drop_constraint('uq_sensor_rollup_bucket', 'sensor_rollups', type_='unique')
+    op.create_unique_constraint('uq_sensor_rollup_bucket', 'sensor_rollups', BUCKET_COLUMNS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sensor_rollups')
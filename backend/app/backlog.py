@@ -0,0 +1,140 @@
+# backend/app/backlog.py - Gom dữ liệu tồn đọng (store-and-forward) để xử lý bù theo lô
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BacklogBuffer:
+    """
+    Gateway mất kết nối rồi gửi dồn hàng giờ dữ liệu: các bản đo của đợt gửi dồn (xem `is_backlog`)
+    được gom theo topic thay vì xử lý/broadcast từng bản tin.
+    - Lô được xử lý khi đủ `batch_size`; đợt kết thúc khi topic không còn bản đo backlog trong `quiet_s` giây
+    - Bản đo realtime xen giữa đợt được giữ lại (`hold`) và chỉ được xử lý khi đợt kết thúc, trộn với
+      phần backlog còn lại theo thời gian → processor luôn nhận dữ liệu của thiết bị theo thứ tự
+    - `process_batch(topic, items)` nhận danh sách (timestamp, record) đã sắp theo thời gian
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[str, List[Tuple[float, Any]]], Awaitable[None]],
+        lag_threshold_s: float = 120.0,
+        batch_size: int = 500,
+        quiet_s: float = 2.0,
+        catchup_rate: float = 10.0
+    ):
+        self.process_batch = process_batch
+        self.lag_threshold_s = lag_threshold_s
+        self.batch_size = max(1, batch_size)
+        self.quiet_s = quiet_s
+        self.catchup_rate = catchup_rate
+
+        self.pending: Dict[str, List[Tuple[float, Any]]] = {}
+        self.held: Dict[str, List[Tuple[float, Any]]] = {}
+        # Giờ (monotonic) của bản đo backlog gần nhất theo topic: có mặt = đợt chưa kết thúc
+        self.last_added: Dict[str, float] = {}
+        # Độ trễ của bản đo gần nhất theo topic (phát hiện bước nhảy) + (giờ thiết bị, giờ nhận) lúc bắt đầu đợt
+        self.last_lag: Dict[str, float] = {}
+        self.bursts: Dict[str, Tuple[float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'buffered': 0, 'held': 0, 'batches': 0, 'max_lag_s': 0.0}
+
+    def is_backlog(self, topic: str, timestamp: float, arrival: float) -> bool:
+        """
+        Bản đo có thuộc đợt gửi dồn không. Không dựa vào độ trễ tuyệt đối: thiết bị có RTC/gateway chậm
+        ổn định cũng có độ trễ lớn nhưng vẫn là dữ liệu realtime.
+        - Bắt đầu đợt: trễ > ngưỡng và nhảy vọt > ngưỡng so với bản đo trước của topic
+          (bản đo đầu tiên của topic chỉ xét trễ tuyệt đối)
+        - Trong đợt: tiếp tục khi trễ còn > ngưỡng và giờ thiết bị (tính từ đầu đợt) tăng nhanh hơn
+          `catchup_rate` lần giờ nhận (đang đuổi kịp); chậm lại → đã về nhịp realtime với độ lệch cố định
+        """
+        lag = arrival - timestamp
+        previous_lag = self.last_lag.get(topic)
+        self.last_lag[topic] = lag
+
+        burst = self.bursts.get(topic)
+        if burst is not None:
+            start_ts, start_arrival = burst
+            if lag > self.lag_threshold_s and timestamp - start_ts >= self.catchup_rate * (arrival - start_arrival):
+                return True
+            del self.bursts[topic]
+            return False
+
+        if lag <= self.lag_threshold_s:
+            return False
+        if previous_lag is not None and lag - previous_lag <= self.lag_threshold_s:
+            return False
+        self.bursts[topic] = (timestamp, arrival)
+        return True
+
+    def in_burst(self, topic: str) -> bool:
+        """Topic đang có đợt gửi dồn chưa kết thúc (chưa im lặng `quiet_s`)"""
+        return topic in self.last_added
+
+    def add(self, topic: str, timestamp: float, record: Any, lag_s: float) -> bool:
+        """Trả về True khi lô của topic đã đủ lớn và nên được xử lý ngay"""
+        items = self.pending.setdefault(topic, [])
+        items.append((timestamp, record))
+        self.last_added[topic] = time.monotonic()
+        self.stats['buffered'] += 1
+        if lag_s > self.stats['max_lag_s']:
+            self.stats['max_lag_s'] = round(lag_s, 1)
+        return len(items) >= self.batch_size
+
+    def hold(self, topic: str, timestamp: float, record: Any):
+        """Bản đo realtime tới giữa đợt: chờ đợt kết thúc (không làm mới mốc im lặng)"""
+        self.held.setdefault(topic, []).append((timestamp, record))
+        self.stats['held'] += 1
+
+    async def flush(self, topic: str):
+        """Xử lý phần backlog đã gom (lô đầy); bản đo realtime đang giữ chờ tới khi đợt kết thúc"""
+        # Lấy lô ra khỏi buffer trước khi await → không có hai lần xử lý cùng một bản tin
+        await self._process(topic, self.pending.pop(topic, None))
+
+    async def release(self, topic: str):
+        """Kết thúc đợt: xử lý phần backlog còn lại cùng các bản đo realtime đang giữ"""
+        self.last_added.pop(topic, None)
+        items = self.pending.pop(topic, None) or []
+        items.extend(self.held.pop(topic, ()))
+        await self._process(topic, items)
+
+    async def _process(self, topic: str, items: Optional[List[Tuple[float, Any]]]):
+        if not items:
+            return
+        items.sort(key=lambda item: item[0])  # Sort ổn định: giữ thứ tự nhận khi trùng timestamp
+        self.stats['batches'] += 1
+        try:
+            await self.process_batch(topic, items)
+        except Exception as e:
+            logger.error(f"❌ Backlog batch failed for {topic} ({len(items)} readings): {e}")
+
+    async def flush_all(self):
+        for topic in list(self.last_added.keys() | self.pending.keys() | self.held.keys()):
+            await self.release(topic)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush_all()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(max(0.1, self.quiet_s / 2))
+            cutoff = time.monotonic() - self.quiet_s
+            for topic in [t for t, added in self.last_added.items() if added <= cutoff]:
+                await self.release(topic)
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'pending_topics': len(self.pending),
+            'pending_readings': sum(len(items) for items in self.pending.values()),
+            'held_readings': sum(len(items) for items in self.held.values())
+        }
@@ -0,0 +1,190 @@
+# backend/app/bulk_writer.py - Batched writer for SensorData / Alert rows
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .metrics import DB_FLUSH_ROWS, DB_FLUSH_SECONDS
+from .models import data as model_data
+
+logger = logging.getLogger(__name__)
+
+# Lỗi tạm thời (mất kết nối, DB restart, timeout) → giữ lại dữ liệu và thử lại
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, ConnectionError, OSError, asyncio.TimeoutError)
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, TRANSIENT_ERRORS):
+        return True
+    return isinstance(e, DBAPIError) and bool(e.connection_invalidated)
+
+
+class BulkWriter:
+    """
+    Gom các bản ghi SensorData / Alert từ mọi thiết bị và ghi theo lô (multi-row INSERT).
+    - Flush mỗi `flush_interval_ms` hoặc khi buffer đạt `max_batch_rows`; mỗi INSERT tối đa `max_batch_rows` dòng
+    - Lỗi tạm thời: đưa lô trở lại đầu buffer và thử lại với backoff
+    - Buffer có giới hạn `max_buffer_rows`, vượt quá thì bỏ bản ghi cũ nhất
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        flush_interval_ms: int = 500,
+        max_batch_rows: int = 500,
+        max_buffer_rows: int = 100000,
+        max_backoff_s: float = 30.0
+    ):
+        self.engine = engine
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch_rows = max(1, max_batch_rows)
+        self.max_buffer_rows = max(self.max_batch_rows, max_buffer_rows)
+        self.max_backoff_s = max_backoff_s
+
+        self.sensor_rows: List[Dict[str, Any]] = []
+        self.alert_rows: List[Dict[str, Any]] = []
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._failures = 0
+
+        self.stats = {
+            'sensor_rows_written': 0,
+            'alert_rows_written': 0,
+            'flushes': 0,
+            'retries': 0,
+            'rows_dropped': 0,
+            'last_flush_ms': 0.0
+        }
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+        logger.info(
+            f"✅ Bulk writer started: every {int(self.flush_interval * 1000)}ms or {self.max_batch_rows} rows"
+        )
+
+    async def stop(self):
+        """Dừng task định kỳ và ghi nốt toàn bộ buffer"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # Thử ghi nốt vài lần trước khi bỏ cuộc
+        for attempt in range(3):
+            if not self.pending():
+                break
+            await self.flush()
+            if self.pending():
+                await asyncio.sleep(min(2 ** attempt, 5))
+
+        if self.pending():
+            logger.error(f"❌ Bulk writer stopped with {self.pending()} unwritten rows")
+
+    def add_sensor_data(self, **row):
+        self.sensor_rows.append(row)
+        self._after_add()
+
+    def add_alert(self, **row):
+        row.setdefault('is_resolved', False)
+        self.alert_rows.append(row)
+        self._after_add()
+
+    def pending(self) -> int:
+        return len(self.sensor_rows) + len(self.alert_rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'pending': self.pending()}
+
+    # ------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------
+    def _after_add(self):
+        overflow = self.pending() - self.max_buffer_rows
+        if overflow > 0:
+            # Bỏ dữ liệu cảm biến cũ nhất trước, giữ lại cảnh báo
+            dropped = min(overflow, len(self.sensor_rows))
+            del self.sensor_rows[:dropped]
+            self.stats['rows_dropped'] += dropped
+            if dropped:
+                logger.warning(f"⚠️ Bulk writer buffer full, dropped {dropped} oldest sensor rows")
+
+        if self._wakeup and self.pending() >= self.max_batch_rows:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            await self.flush()
+
+            # Đang lỗi liên tục → chờ thêm theo backoff trước lần thử sau
+            if self._failures:
+                await asyncio.sleep(min(self.flush_interval * (2 ** self._failures), self.max_backoff_s))
+
+    async def flush(self):
+        """
+        Ghi buffer theo từng lô <= `max_batch_rows`, mỗi lô một INSERT + transaction riêng
+        → sau khi DB nghẽn, một dòng hỏng / timeout chỉ ảnh hưởng một lô chứ không cả buffer.
+        Chỉ ghi số bản ghi có lúc bắt đầu flush, bản ghi đến trong lúc ghi chờ lượt sau.
+        """
+        if not self.pending():
+            return
+
+        async with self._flush_lock:
+            for table, buffer in (
+                (model_data.SensorData.__table__, self.sensor_rows),
+                (model_data.Alert.__table__, self.alert_rows)
+            ):
+                budget = len(buffer)
+                while budget > 0 and buffer:
+                    chunk = buffer[:min(budget, self.max_batch_rows)]
+                    del buffer[:len(chunk)]
+                    budget -= len(chunk)
+                    if not await self._write_chunk(table, buffer, chunk):
+                        return  # Lỗi tạm thời: dừng, lượt sau thử lại theo backoff
+
+    async def _write_chunk(self, table, buffer: List[Dict[str, Any]], rows: List[Dict[str, Any]]) -> bool:
+        """Ghi một lô. False nếu lỗi tạm thời (lô đã được trả về đầu `buffer`)"""
+        started = time.perf_counter()
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(table), rows)
+        except Exception as e:
+            if _is_transient(e):
+                # Trả lô về đầu buffer để giữ đúng thứ tự thời gian
+                buffer[:0] = rows
+                self._failures += 1
+                self.stats['retries'] += 1
+                logger.warning(
+                    f"⚠️ Bulk write failed (attempt {self._failures}), "
+                    f"{len(rows)} rows kept for retry: {e}"
+                )
+                return False
+            self.stats['rows_dropped'] += len(rows)
+            logger.error(f"❌ Bulk write rejected, dropped {len(rows)} {table.name} rows: {e}")
+            return True
+
+        self._failures = 0
+        self.stats['flushes'] += 1
+        key = 'alert_rows_written' if table is model_data.Alert.__table__ else 'sensor_rows_written'
+        self.stats[key] += len(rows)
+        elapsed = time.perf_counter() - started
+        self.stats['last_flush_ms'] = round(elapsed * 1000, 2)
+        DB_FLUSH_SECONDS.observe(elapsed, 'bulk')
+        DB_FLUSH_ROWS.inc('bulk', amount=len(rows))
+        return True
@@ -0,0 +1,88 @@
+# backend/app/capture.py - Ghi lại bản tin MQTT thô ra file JSONL để replay
+import asyncio
+import base64
+import json
+import logging
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def encode_record(topic: str, payload: bytes, received_at: float) -> str:
+    """Một dòng capture: payload text giữ nguyên, payload nhị phân (RTCM) lưu base64"""
+    record = {'t': received_at, 'topic': topic}
+    try:
+        record['payload'] = payload.decode('utf-8')
+    except UnicodeDecodeError:
+        record['payload_b64'] = base64.b64encode(payload).decode('ascii')
+    return json.dumps(record, ensure_ascii=False)
+
+
+def decode_record(line: str):
+    """Dòng capture → (topic, payload bytes, thời điểm nhận)"""
+    record = json.loads(line)
+    if 'payload_b64' in record:
+        payload = base64.b64decode(record['payload_b64'])
+    else:
+        payload = record['payload'].encode('utf-8')
+    return record['topic'], payload, float(record['t'])
+
+
+class CaptureRecorder:
+    """
+    record() được gọi trên luồng paho: chỉ append vào deque (thread-safe, không I/O).
+    Task định kỳ trên event loop gom các bản tin và ghi file trong thread riêng.
+    """
+
+    def __init__(self, path: str, flush_interval_s: float = 1.0):
+        self.path = path
+        self.flush_interval_s = flush_interval_s
+        self.buffer: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'recorded': 0, 'errors': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(self, topic: str, payload: bytes, received_at: float):
+        if self.enabled:
+            self.buffer.append((topic, bytes(payload), received_at))
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.enabled:
+            self._task = loop.create_task(self._run())
+            logger.info(f"🎙️ Recording MQTT capture to {self.path}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+    def _write(self, lines):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        items = []
+        while self.buffer:
+            items.append(self.buffer.popleft())
+        try:
+            await asyncio.to_thread(self._write, [encode_record(*item) for item in items])
+            self.stats['recorded'] += len(items)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"❌ Capture write failed ({len(items)} messages lost): {e}")
+
+    def get_stats(self):
+        return {**self.stats, 'path': self.path, 'buffered': len(self.buffer)}
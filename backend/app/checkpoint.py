@@ -0,0 +1,245 @@
+# backend/app/checkpoint.py - Snapshot trạng thái processor/analyzer cho warm restart
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 2: JSON + một buffer float64 trong file .npz (không pickle), state processor kèm kind/version
+CHECKPOINT_VERSION = 2
+
+
+class _ArrayPacker:
+    """
+    Tách mọi mảng NumPy của snapshot vào một buffer float64 duy nhất, phần còn lại là JSON.
+    Mảng được thay bằng {"__array__": [offset, shape]}; chỉ nhận kiểu JSON cơ bản + ndarray,
+    key của dict phải là str (không âm thầm đổi int → str).
+    """
+
+    def __init__(self, data: Optional[np.ndarray] = None):
+        self.data = data
+        self.chunks: List[np.ndarray] = []
+        self.size = 0
+
+    def pack(self, value: Any) -> Any:
+        if isinstance(value, np.ndarray):
+            array = np.ascontiguousarray(value, dtype=np.float64)
+            ref = {'__array__': [self.size, list(array.shape)]}
+            self.chunks.append(array.ravel())
+            self.size += array.size
+            return ref
+        if isinstance(value, dict):
+            packed = {}
+            for key, item in value.items():
+                if not isinstance(key, str):
+                    raise TypeError(f"checkpoint dict keys must be str, got {key!r}")
+                packed[key] = self.pack(item)
+            return packed
+        if isinstance(value, (list, tuple)):
+            return [self.pack(item) for item in value]
+        if isinstance(value, np.generic):
+            return value.item()
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        raise TypeError(f"unsupported checkpoint value of type {type(value).__name__}")
+
+    def buffer(self) -> np.ndarray:
+        return np.concatenate(self.chunks) if self.chunks else np.zeros(0)
+
+    def unpack(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            ref = value.get('__array__')
+            if ref is not None and len(value) == 1:
+                offset, shape = int(ref[0]), tuple(int(n) for n in ref[1])
+                size = int(np.prod(shape))
+                if offset < 0 or offset + size > len(self.data):
+                    raise ValueError(f"array reference {ref} out of range")
+                return self.data[offset:offset + size].reshape(shape).copy()
+            return {key: self.unpack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.unpack(item) for item in value]
+        return value
+
+
+class StateCheckpointer:
+    """
+    Định kỳ ghi trạng thái của mọi processor thiết bị + bộ đếm xác nhận của analyzer
+    ra một file .npz (JSON + mảng float64, đọc với allow_pickle=False), khôi phục khi bridge khởi động lại.
+    - State mỗi processor lưu kèm tên lớp + `STATE_VERSION`: lệch (layout get_state đã đổi) → bỏ qua
+    - Snapshot được dựng trên event loop (chỉ copy dữ liệu nhỏ), ghi file trong thread riêng
+    - Ghi atomic: file tạm + os.replace, không bao giờ để lại file hỏng
+    - Snapshot cũ hơn `max_age_s` bị bỏ qua (lịch sử quá cũ làm sai vận tốc/cường độ)
+    """
+
+    def __init__(self, bridge, path: str, interval_s: float = 30.0, max_age_s: float = 3600.0):
+        self.bridge = bridge
+        self.path = path
+        self.interval_s = interval_s
+        self.max_age_s = max_age_s
+
+        # Trạng thái đã đọc từ file, chờ state thiết bị tương ứng được tạo trong registry
+        self.pending_processors: Dict[str, Dict[str, Any]] = {}
+        self.pending_last_save: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            'saves': 0,
+            'last_save_ms': 0.0,
+            'last_size_bytes': 0,
+            'restored_processors': 0,
+            'rejected_processors': 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    # ------------------------------------------------------------------
+    # Restore
+    # ------------------------------------------------------------------
+    def load(self):
+        if not self.enabled or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as archive:
+                meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+                data = archive['data']
+        except Exception as e:
+            logger.error(f"❌ Failed to read checkpoint {self.path}: {e}")
+            return
+
+        if not isinstance(meta, dict) or meta.get('version') != CHECKPOINT_VERSION:
+            version = meta.get('version') if isinstance(meta, dict) else None
+            logger.warning(f"⚠️ Checkpoint version mismatch ({version}), ignored")
+            return
+
+        age = time.time() - meta.get('saved_at', 0)
+        if age > self.max_age_s:
+            logger.warning(f"⚠️ Checkpoint is {age:.0f}s old (> {self.max_age_s}s), ignored")
+            return
+
+        try:
+            packer = _ArrayPacker(data)
+            processors = {}
+            for proc_key, entry in meta.get('processors', {}).items():
+                if not isinstance(entry, dict) or not isinstance(entry.get('state'), dict):
+                    raise ValueError(f"malformed processor entry {proc_key}")
+                processors[proc_key] = {**entry, 'state': packer.unpack(entry['state'])}
+            alert_counters = {int(station_id): counters for station_id, counters in meta.get('alert_counters', [])}
+            last_save_time = {str(k): float(v) for k, v in meta.get('last_save_time', {}).items()}
+        except Exception as e:
+            logger.error(f"❌ Malformed checkpoint {self.path}: {e}")
+            return
+
+        self.pending_processors = processors
+        self.bridge.analyzer.load_state(alert_counters)
+        self.pending_last_save = last_save_time
+        logger.info(
+            f"♻️ Checkpoint loaded ({age:.0f}s old): {len(self.pending_processors)} processors, "
+            f"{len(alert_counters)} stations"
+        )
+
+    def restore_device(self, device_state):
+        """Hook on_create của DeviceStateRegistry"""
+        device_state.last_save_time = self.pending_last_save.pop(
+            f"{device_state.device_id}_{device_state.sensor_type}", device_state.last_save_time
+        )
+        proc_key = f"device_{device_state.device_id}"
+        entry = self.pending_processors.pop(proc_key, None)
+        processor = device_state.processor
+        if entry is None or not hasattr(processor, 'load_state'):
+            return
+        kind, version = type(processor).__name__, getattr(processor, 'STATE_VERSION', None)
+        if entry.get('kind') != kind or entry.get('version') != version:
+            self.stats['rejected_processors'] += 1
+            logger.warning(
+                f"⚠️ Checkpoint state of {proc_key} is {entry.get('kind')} v{entry.get('version')}, "
+                f"expected {kind} v{version}: ignored"
+            )
+            return
+        try:
+            processor.load_state(entry['state'])
+            self.stats['restored_processors'] += 1
+        except Exception as e:
+            logger.error(f"❌ Failed to restore {proc_key} from checkpoint: {e}")
+
+    def prune_pending(self, active_device_ids):
+        """Bỏ state chờ khôi phục của thiết bị không còn trong topic map"""
+        keep = {f"device_{d}" for d in active_device_ids}
+        self.pending_processors = {k: v for k, v in self.pending_processors.items() if k in keep}
+        self.pending_last_save = {
+            k: v for k, v in self.pending_last_save.items() if f"device_{k.split('_', 1)[0]}" in keep
+        }
+
+    # ------------------------------------------------------------------
+    # Save
+    # ------------------------------------------------------------------
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.enabled:
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.enabled:
+            await self.save()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            await self.save()
+
+    def _build_snapshot(self) -> Dict[str, Any]:
+        processors = {}
+        last_save_time = dict(self.pending_last_save)
+        for device_id, device_state in self.bridge.devices.items():
+            processor = device_state.processor
+            if hasattr(processor, 'get_state'):
+                processors[f"device_{device_id}"] = {
+                    'kind': type(processor).__name__,
+                    'version': getattr(processor, 'STATE_VERSION', None),
+                    'state': processor.get_state()
+                }
+            last_save_time[f"{device_id}_{device_state.sensor_type}"] = device_state.last_save_time
+        # Giữ lại state chưa dùng tới (thiết bị chưa gửi dữ liệu lại) để không mất sau lần lưu đầu
+        for proc_key, state in self.pending_processors.items():
+            processors.setdefault(proc_key, state)
+
+        return {
+            'version': CHECKPOINT_VERSION,
+            'saved_at': time.time(),
+            'processors': processors,
+            # Station id là int: lưu dạng cặp để JSON không đổi key thành str
+            'alert_counters': [[sid, counters] for sid, counters in self.bridge.analyzer.get_state().items()],
+            'last_save_time': last_save_time
+        }
+
+    def _write(self, snapshot: Dict[str, Any]) -> int:
+        packer = _ArrayPacker()
+        meta = json.dumps(packer.pack(snapshot), separators=(',', ':')).encode('utf-8')
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.frombuffer(meta, dtype=np.uint8), data=packer.buffer())
+            size = f.tell()
+        os.replace(tmp_path, self.path)
+        return size
+
+    async def save(self):
+        started = time.perf_counter()
+        try:
+            snapshot = self._build_snapshot()
+            size = await asyncio.to_thread(self._write, snapshot)
+            self.stats['saves'] += 1
+            self.stats['last_size_bytes'] = size
+            self.stats['last_save_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        except Exception as e:
+            logger.error(f"❌ Checkpoint save failed: {e}")
+
+    def get_stats(self):
+        return {**self.stats, 'path': self.path, 'pending_restore': len(self.pending_processors)}
@@ -0,0 +1,30 @@
+# backend/app/clock.py - Đồng hồ có thể thay thế (chạy thật / replay capture)
+import time
+
+
+class SystemClock:
+    """Đồng hồ hệ thống: dùng khi chạy thật"""
+
+    def time(self) -> float:
+        return time.time()
+
+
+class ReplayClock:
+    """
+    Đồng hồ do replay điều khiển: thời gian = thời điểm nhận của bản tin đang phát lại,
+    nhờ đó throttle lưu DB, vận tốc GNSS và bộ đếm cảnh báo giống hệt lúc ghi capture.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def set(self, timestamp: float):
+        # Không cho thời gian chạy lùi (capture ghi từ nhiều luồng có thể lệch vài ms)
+        if timestamp > self.now:
+            self.now = timestamp
+
+
+system_clock = SystemClock()
@@ -21,6 +21,18 @@ class Settings(BaseSettings):
     MQTT_USER: str = "mqttUser"
     MQTT_PASSWORD: str = "MqttPassword123$%^"
     TOPIC_RELOAD_INTERVAL: int = 60
+    TOPIC_SAFETY_RELOAD_INTERVAL: int = 900
+    CONFIG_EVENTS_ENABLED: bool = True
+    CONFIG_EVENTS_CHANNEL: str = "landslide_config_changes"
+    # Wildcard mode: danh sách filter, cách nhau bởi dấu phẩy (VD: "landslide/+/+/gnss,landslide/+/+/rain")
+    # Để trống = subscribe từng topic thiết bị như cũ
+    MQTT_WILDCARD_FILTERS: str = ""
+    MQTT_SUBSCRIBE_BATCH: int = 100
+    # threaded: paho loop_start() (thread riêng) | asyncio: chạy MQTT ngay trên event loop
+    MQTT_TRANSPORT: str = "threaded"
+    MQTT_QOS: int = 0                  # QoS subscribe; asyncio mode + QoS 1 → ack theo lô
+    MQTT_RECEIVE_QUEUE: int = 10000    # asyncio mode: hàng đợi bản tin nhận
+    MQTT_RECEIVE_BATCH: int = 100
 
     SAVE_INTERVAL_DEFAULT: int = 60
     SAVE_INTERVAL_GNSS: int = 86400
@@ -28,6 +40,61 @@ class Settings(BaseSettings):
     SAVE_INTERVAL_WATER: int = 3600
     SAVE_INTERVAL_IMU: int = 2592000
 
+    # --- 3. INGEST PIPELINE ---
+    INGEST_WORKERS: int = 4
+    INGEST_QUEUE_SIZE: int = 10000
+    INGEST_OVERFLOW_POLICY: str = "drop_oldest"  # drop_oldest | drop_newest
+    # Sharded ingest: số process worker (0 = xử lý ngay trong process FastAPI)
+    INGEST_SHARDS: int = 0
+    SHARD_METRICS_INTERVAL: float = 5.0  # Worker shard gửi snapshot metrics về process API mỗi N giây
+    # Decode stage: giải mã payload trong process pool (0 = giải mã ngay trên event loop).
+    # Chỉ áp dụng cho process FastAPI (INGEST_SHARDS=0); worker shard luôn giải mã inline
+    DECODE_WORKERS: int = 2
+    DECODE_BATCH_SIZE: int = 64
+    DECODE_BATCH_INTERVAL_MS: int = 5
+    DECODE_MAX_PENDING: int = 20000
+
+    # --- 4. BULK WRITER (Data DB) ---
+    BULK_FLUSH_INTERVAL_MS: int = 500
+    BULK_FLUSH_MAX_ROWS: int = 500
+    BULK_MAX_BUFFER_ROWS: int = 100000
+    HEARTBEAT_FLUSH_INTERVAL: int = 5
+    # Rollup 1m/1h/1d: bucket đóng sau khi hết thời gian + grace thì upsert vào sensor_rollups
+    ROLLUP_ENABLED: bool = True
+    ROLLUP_FLUSH_INTERVAL: int = 5
+    ROLLUP_GRACE_SECONDS: int = 10
+
+    # --- 5. WARM RESTART CHECKPOINT ---
+    CHECKPOINT_PATH: str = "bridge_state.ckpt"  # Để trống để tắt
+    CHECKPOINT_INTERVAL: int = 30
+    CHECKPOINT_MAX_AGE: int = 3600
+
+    # --- 6. DEVICE STATE REGISTRY ---
+    DEVICE_STATE_MAX: int = 20000           # Giới hạn số thiết bị giữ state (LRU)
+    DEVICE_STATE_IDLE_TTL: int = 604800     # Xóa state thiết bị im lặng quá 7 ngày (0 = không xóa)
+
+    # --- 7. DEVICE TIMESTAMPS / BACKLOG ---
+    DEVICE_CLOCK_MAX_SKEW: int = 300           # Timestamp thiết bị ở tương lai quá mức này → dùng giờ nhận
+    DEVICE_TIMESTAMP_MAX_AGE: int = 604800     # Timestamp cũ hơn 7 ngày → coi như đồng hồ thiết bị sai
+    BACKLOG_LAG_THRESHOLD: int = 120           # Trễ (giờ nhận - giờ thiết bị) vượt ngưỡng và nhảy vọt → đợt gửi dồn
+    BACKLOG_BATCH_SIZE: int = 500
+    BACKLOG_QUIET_SECONDS: float = 2.0
+
+    # --- 8. CAPTURE / REPLAY ---
+    CAPTURE_PATH: str = ""  # VD: "capture.jsonl" để ghi lại bản tin MQTT thô cho replay.py
+
+    # --- 9. LOGGING ---
+    LOG_LEVEL: str = "INFO"
+    LOG_RATE_LIMIT_WINDOW: int = 60   # Giây: cửa sổ gộp log lặp lại (theo mẫu message + trạm)
+    LOG_RATE_LIMIT_BURST: int = 10    # Số log giống nhau được ghi mỗi cửa sổ (0 = không giới hạn)
+
+    # --- 10. GNSS PROCESSOR ---
+    GNSS_FILTER_WINDOW: int = 5   # Số epoch trung bình vận tốc ENU (VD: 60 = 1 phút ở 1 Hz)
+    GNSS_ORIGIN_POINTS: int = 5        # Số epoch để khóa gốc (có thể vài trăm: estimator O(1) bộ nhớ)
+    GNSS_ORIGIN_MAX_SPREAD: float = 5.0  # Khoảng cách 3D tối đa (m) từ tâm tới mọi epoch khi khóa gốc
+    GNSS_DRIFT_THRESHOLD: float = 0.5  # Bước nhảy vị trí (m) bị coi là dịch gốc / anten bị dời
+    GNSS_DRIFT_CONFIRM: int = 10       # Số epoch lệch liên tiếp trước khi cảnh báo drift
+
     class Config:
         # Chỉ định đường dẫn tuyệt đối tới file .env để chạy ổn định trên IIS
         env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
@@ -0,0 +1,120 @@
+# backend/app/config_events.py - Config change events (in-process bus + Postgres LISTEN/NOTIFY)
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from .config import settings
+from .database import config_engine
+
+logger = logging.getLogger(__name__)
+
+EventCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class ConfigEventBus:
+    """
+    Phát sự kiện khi trạm/thiết bị thay đổi để MQTT bridge cập nhật topic map tăng dần.
+    - Trong cùng process: gọi trực tiếp các subscriber
+    - Giữa các process: pg_notify trên Config DB, process khác LISTEN cùng channel
+    Event: {"entity": "station"|"device"|"project", "op": "upsert"|"delete"|"relock", "id": int, "station_id": int|None}
+    """
+
+    def __init__(self, channel: str = settings.CONFIG_EVENTS_CHANNEL):
+        self.channel = channel
+        # Đánh dấu process gửi để bỏ qua NOTIFY của chính mình
+        self.origin = uuid.uuid4().hex
+        self.subscribers: List[EventCallback] = []
+
+        self._listen_task: Optional[asyncio.Task] = None
+        self._listen_conn = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, callback: EventCallback):
+        if callback not in self.subscribers:
+            self.subscribers.append(callback)
+
+    async def publish(self, entity: str, op: str, entity_id: int, station_id: Optional[int] = None):
+        event = {
+            "entity": entity,
+            "op": op,
+            "id": entity_id,
+            "station_id": station_id,
+            "origin": self.origin
+        }
+        await self._dispatch(event)
+
+        if not settings.CONFIG_EVENTS_ENABLED:
+            return
+        try:
+            async with config_engine.begin() as conn:
+                await conn.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": self.channel, "payload": json.dumps(event)}
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Config event NOTIFY failed ({entity} {op} {entity_id}): {e}")
+
+    async def _dispatch(self, event: Dict[str, Any]):
+        for callback in list(self.subscribers):
+            try:
+                await callback(event)
+            except Exception as e:
+                logger.error(f"❌ Config event handler error: {e}")
+
+    # ------------------------------------------------------------------
+    # LISTEN (nhận sự kiện từ process khác)
+    # ------------------------------------------------------------------
+    def start_listener(self, loop: asyncio.AbstractEventLoop):
+        if not settings.CONFIG_EVENTS_ENABLED or self._listen_task:
+            return
+        self._loop = loop
+        self._listen_task = loop.create_task(self._listen_forever())
+
+    async def stop_listener(self):
+        if self._listen_task:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+            self._listen_task = None
+
+    async def _listen_forever(self):
+        while True:
+            conn = None
+            try:
+                conn = await config_engine.connect()
+                raw = await conn.get_raw_connection()
+                driver_conn = raw.driver_connection
+                await driver_conn.add_listener(self.channel, self._on_notify)
+                logger.info(f"✅ Listening for config events on '{self.channel}'")
+
+                # Kiểm tra kết nối định kỳ, mất kết nối thì LISTEN lại
+                while not driver_conn.is_closed():
+                    await asyncio.sleep(30)
+                logger.warning("⚠️ Config event listener connection closed, reconnecting...")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Config event listener error: {e}. Retry in 10s...")
+            finally:
+                if conn is not None:
+                    try:
+                        await conn.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(10)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except (TypeError, ValueError):
+            return
+        if event.get("origin") == self.origin:
+            return
+        self._loop.create_task(self._dispatch(event))
+
+
+config_events = ConfigEventBus()
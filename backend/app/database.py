@@ -1,31 +1,54 @@
 # backend/app/database.py
+import time
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .config import settings
+from .metrics import DB_POOL_CHECKOUT_SECONDS
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Đo thời gian chờ lấy connection từ pool (pool cạn → request/bulk writer phải xếp hàng)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, self.logging_name or 'db')
 
 # Hàm tạo engine chung cho Postgres
-def create_pg_engine(url):
+def create_pg_engine(url, name):
     return create_async_engine(
         url,
         echo=False,
         pool_pre_ping=True, # Tự động kết nối lại nếu bị ngắt
+        poolclass=TimedQueuePool,
+        pool_logging_name=name, # Nhãn `db` trong metrics
     )
 
 # 1. AUTH DB
-auth_engine = create_pg_engine(settings.AUTH_DB_URL)
+auth_engine = create_pg_engine(settings.AUTH_DB_URL, "auth")
 AuthSessionLocal = sessionmaker(auth_engine, class_=AsyncSession, expire_on_commit=False)
 BaseAuth = declarative_base()
 
 # 2. CONFIG DB
-config_engine = create_pg_engine(settings.CONFIG_DB_URL)
+config_engine = create_pg_engine(settings.CONFIG_DB_URL, "config")
 ConfigSessionLocal = sessionmaker(config_engine, class_=AsyncSession, expire_on_commit=False)
 BaseConfig = declarative_base()
 
 # 3. DATA DB
-data_engine = create_pg_engine(settings.DATA_DB_URL)
+data_engine = create_pg_engine(settings.DATA_DB_URL, "data")
 DataSessionLocal = sessionmaker(data_engine, class_=AsyncSession, expire_on_commit=False)
 BaseData = declarative_base()
 
+def pool_connections():
+    """Số connection theo trạng thái của từng pool, cho gauge landslide_db_pool_connections"""
+    for name, engine in (("auth", auth_engine), ("config", config_engine), ("data", data_engine)):
+        pool = engine.sync_engine.pool
+        yield (name, "checked_out"), pool.checkedout()
+        yield (name, "idle"), pool.checkedin()
+        yield (name, "overflow"), max(0, pool.overflow())
+
 # Dependency Injection cho FastAPI (Giữ nguyên)
 async def get_auth_db():
     async with AuthSessionLocal() as session:
@@ -0,0 +1,171 @@
+# backend/app/decode_stage.py - Giải mã payload ngoài luồng paho (process pool + micro-batch)
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from .metrics import PIPELINE_READINGS, PIPELINE_STAGE_SECONDS
+from .modules.payload_decoder import DEFAULT_ENCODING, EncodingSpec, decode_batch_timed
+
+logger = logging.getLogger(__name__)
+
+
+class DecodeStage:
+    """
+    Luồng paho chỉ chuyển bytes thô sang event loop, DecodeStage gom thành micro-batch
+    và giải mã trong ProcessPoolExecutor (không giữ GIL của process chính).
+    - Mỗi bản tin mang theo EncodingSpec của thiết bị (resolve sẵn lúc nạp topic map)
+    - Batch được gửi đi khi đủ `batch_size` bản tin hoặc sau `batch_interval_ms`
+    - Kết quả được trả về `sink(topic, record)` đúng thứ tự nhận (FIFO theo batch);
+      sink trả về awaitable (VD ingest queue đầy) → chờ xong mới chuyển bản tin kế tiếp,
+      batch vẫn tính là inflight nên `full()` / `wait_for_room()` dồn ngược về transport
+    - workers=0: giải mã trực tiếp trên event loop (không dùng process pool)
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[str, Any], Optional[Awaitable[None]]],
+        workers: int = 2,
+        batch_size: int = 64,
+        batch_interval_ms: int = 5,
+        max_pending: int = 20000
+    ):
+        self.sink = sink
+        self.workers = max(0, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval_ms / 1000.0
+        self.max_pending = max(self.batch_size, max_pending)
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.pending: List[Tuple[str, str, bytes, EncodingSpec]] = []
+        self.inflight: Optional[asyncio.Queue] = None
+        self.inflight_items = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._room: Optional[asyncio.Event] = None
+
+        self.stats = {'received': 0, 'decoded': 0, 'invalid': 0, 'dropped': 0, 'batches': 0}
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.inflight = asyncio.Queue()
+        self._room = asyncio.Event()
+        self._room.set()
+        if self.workers:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._dispatcher = loop.create_task(self._dispatch())
+        logger.info(
+            f"✅ Decode stage started: {self.workers or 'inline'} workers, "
+            f"batch {self.batch_size} / {int(self.batch_interval * 1000)}ms"
+        )
+
+    async def stop(self):
+        if self.loop is None:
+            return
+        self._flush()
+        if self.inflight is not None:
+            try:
+                await asyncio.wait_for(self.inflight.join(), timeout=5.0)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ Decode stage stop timed out with batches in flight")
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def submit_threadsafe(
+        self, topic: str, sensor_type: str, payload: bytes, encoding: EncodingSpec = DEFAULT_ENCODING
+    ):
+        """Gọi từ luồng paho: không decode/giải mã gì ở đây"""
+        if self.loop is None or not self.loop.is_running():
+            return
+        self.loop.call_soon_threadsafe(self._add, topic, sensor_type, payload, encoding)
+
+    def submit(
+        self, topic: str, sensor_type: str, payload: bytes, encoding: EncodingSpec = DEFAULT_ENCODING
+    ) -> bool:
+        """Gọi từ chính event loop (asyncio MQTT transport). False nếu bản tin bị bỏ (đầy) → không được ack"""
+        if self.loop is None:
+            return False
+        return self._add(topic, sensor_type, payload, encoding)
+
+    def full(self) -> bool:
+        return len(self.pending) + self.inflight_items >= self.max_pending
+
+    async def wait_for_room(self):
+        """Backpressure cho asyncio transport: chờ tới khi nhận thêm được bản tin"""
+        while self.full():
+            self._room.clear()
+            await self._room.wait()
+
+    def _add(self, topic: str, sensor_type: str, payload: bytes, encoding: EncodingSpec) -> bool:
+        self.stats['received'] += 1
+        if self.full():
+            self.stats['dropped'] += 1
+            if self.stats['dropped'] == 1 or self.stats['dropped'] % 1000 == 0:
+                logger.warning(f"⚠️ Decode stage backlog full, {self.stats['dropped']} messages dropped so far")
+            return False
+
+        self.pending.append((topic, sensor_type, payload, encoding))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.batch_interval, self._flush)
+        return True
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+        work = [(sensor_type, payload, encoding) for _, sensor_type, payload, encoding in batch]
+        if self.pool:
+            future = self.loop.run_in_executor(self.pool, decode_batch_timed, work)
+        else:
+            future = self.loop.create_future()
+            future.set_result(decode_batch_timed(work))
+
+        self.inflight_items += len(batch)
+        self.stats['batches'] += 1
+        self.inflight.put_nowait((batch, future))
+
+    async def _dispatch(self):
+        # Chờ từng batch theo đúng thứ tự gửi → giữ thứ tự bản tin của mỗi thiết bị
+        while True:
+            batch, future = await self.inflight.get()
+            try:
+                results, timings = await future
+                for (topic, sensor_type, _, _), record, (decrypt_s, parse_s) in zip(batch, results, timings):
+                    PIPELINE_STAGE_SECONDS.observe(decrypt_s, 'decrypt', sensor_type)
+                    if record is None:
+                        self.stats['invalid'] += 1
+                        PIPELINE_READINGS.inc(sensor_type, 'invalid')
+                        continue
+                    PIPELINE_STAGE_SECONDS.observe(parse_s, 'parse', sensor_type)
+                    self.stats['decoded'] += 1
+                    waiter = self.sink(topic, record)
+                    if waiter is not None:
+                        await waiter
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Decode batch failed ({len(batch)} messages): {e}")
+            finally:
+                self.inflight_items -= len(batch)
+                if not self.full():
+                    self._room.set()
+                self.inflight.task_done()
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'pending': len(self.pending),
+            'inflight': self.inflight_items,
+            'workers': self.workers
+        }
@@ -0,0 +1,152 @@
+# backend/app/device_state.py - Registry trạng thái theo thiết bị (processor, throttle lưu DB) có giới hạn
+import logging
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceState:
+    """Toàn bộ trạng thái bridge giữ cho một thiết bị"""
+    __slots__ = ('device_id', 'station_id', 'sensor_type', 'processor', 'last_save_time', 'last_seen', 'last_ts')
+
+    def __init__(self, device_id: int, station_id: int, sensor_type: str, processor: Any):
+        self.device_id = device_id
+        self.station_id = station_id
+        self.sensor_type = sensor_type
+        self.processor = processor
+        self.last_save_time = 0
+        self.last_seen = 0.0
+        self.last_ts = float('-inf')  # Timestamp bản đo mới nhất processor đã nhận
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Ước lượng bộ nhớ (bytes) của một object và mọi thứ nó sở hữu.
+    Bỏ qua callable/class/module (VD: session factory dùng chung) để không đếm cả engine DB.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or callable(obj) or isinstance(obj, type(sys)):
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool)):
+        if hasattr(obj, '__dict__'):
+            size += deep_sizeof(vars(obj), seen)
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+class DeviceStateRegistry:
+    """
+    Thay cho processors_cache/last_save_time (chỉ tăng, không bao giờ xóa).
+    - State được tạo lười khi thiết bị gửi bản tin đầu tiên (`factory` tạo processor)
+    - retain(): gọi sau mỗi lần reload topic map → xóa thiết bị đã bị xóa/tắt
+    - evict_idle(): xóa thiết bị im lặng quá `idle_ttl_s` (tạo lại khi có dữ liệu)
+    - Giới hạn cứng `max_devices`, vượt quá thì bỏ thiết bị ít dùng nhất (LRU)
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[int, str], Any],
+        max_devices: int = 20000,
+        idle_ttl_s: float = 7 * 86400,
+        on_create: Optional[Callable[[DeviceState], None]] = None
+    ):
+        self.factory = factory
+        self.max_devices = max(1, max_devices)
+        self.idle_ttl_s = idle_ttl_s
+        self.on_create = on_create
+
+        # Thứ tự = thứ tự truy cập (cuối = mới nhất) → LRU và TTL chỉ cần duyệt từ đầu
+        self.entries: "OrderedDict[int, DeviceState]" = OrderedDict()
+        self.stats = {'created': 0, 'evicted_removed': 0, 'evicted_idle': 0, 'evicted_lru': 0}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, device_id: int, station_id: int, sensor_type: str) -> Optional[DeviceState]:
+        """Lấy (hoặc tạo) state cho thiết bị và đánh dấu vừa được dùng"""
+        state = self.entries.get(device_id)
+        if state is not None and (state.sensor_type != sensor_type or state.station_id != station_id):
+            # Thiết bị bị đổi loại/chuyển trạm → lịch sử cũ không còn ý nghĩa
+            del self.entries[device_id]
+            state = None
+
+        if state is None:
+            processor = self.factory(device_id, sensor_type)
+            if processor is None:
+                return None
+            state = DeviceState(device_id, station_id, sensor_type, processor)
+            if self.on_create:
+                self.on_create(state)
+            self.entries[device_id] = state
+            self.stats['created'] += 1
+            self._enforce_capacity()
+        else:
+            self.entries.move_to_end(device_id)
+
+        state.last_seen = time.monotonic()
+        return state
+
+    def items(self):
+        return list(self.entries.items())
+
+    def evict(self, device_ids: Iterable[int], reason: str = 'removed') -> int:
+        count = 0
+        for device_id in device_ids:
+            if self.entries.pop(device_id, None) is not None:
+                count += 1
+        self.stats[f'evicted_{reason}'] += count
+        return count
+
+    def retain(self, active_device_ids: Iterable[int]) -> int:
+        """Chỉ giữ các thiết bị còn trong topic map"""
+        active = set(active_device_ids)
+        return self.evict([d for d in self.entries if d not in active])
+
+    def evict_idle(self) -> int:
+        if not self.idle_ttl_s:
+            return 0
+        cutoff = time.monotonic() - self.idle_ttl_s
+        idle = []
+        for device_id, state in self.entries.items():
+            if state.last_seen >= cutoff:
+                break
+            idle.append(device_id)
+        return self.evict(idle, 'idle')
+
+    def _enforce_capacity(self):
+        while len(self.entries) > self.max_devices:
+            device_id, _ = self.entries.popitem(last=False)
+            self.stats['evicted_lru'] += 1
+            if self.stats['evicted_lru'] == 1 or self.stats['evicted_lru'] % 1000 == 0:
+                logger.warning(f"⚠️ Device state registry full ({self.max_devices}), evicted LRU device {device_id}")
+
+    def memory_report(self) -> Dict[str, Dict[str, int]]:
+        """Số lượng + bộ nhớ ước tính theo loại processor"""
+        report: Dict[str, Dict[str, int]] = {}
+        for state in self.entries.values():
+            kind = type(state.processor).__name__
+            bucket = report.setdefault(kind, {'count': 0, 'bytes': 0})
+            bucket['count'] += 1
+            bucket['bytes'] += deep_sizeof(state)
+        return report
+
+    def get_stats(self):
+        return {**self.stats, 'devices': len(self.entries), 'max_devices': self.max_devices}
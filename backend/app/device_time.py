@@ -0,0 +1,61 @@
+# backend/app/device_time.py - Lấy timestamp do thiết bị gửi (GGA UTC / ngày RMC, trường `ts` trong JSON)
+from typing import Any, Dict, Optional
+
+DAY_SECONDS = 86400
+
+
+def utc_timestamp(seconds_of_day: Optional[float], reference: float, max_future_s: float = 300.0) -> Optional[float]:
+    """
+    GGA chỉ có giờ UTC trong ngày, ngày được suy ra từ `reference` (thời điểm nhận):
+    chọn mốc gần nhất không vượt quá reference + max_future_s.
+    → Bản tin 23:59:59 nhận lúc 00:00:05 được gán về ngày hôm trước (qua nửa đêm).
+    Giới hạn: backlog cũ hơn 24h không xác định được ngày nếu thiếu RMC.
+    """
+    if seconds_of_day is None or not 0 <= seconds_of_day < DAY_SECONDS + 1:  # +1: giây nhuận
+        return None
+
+    day_start = reference - (reference % DAY_SECONDS)
+    candidate = day_start + seconds_of_day
+    if candidate > reference + max_future_s:
+        candidate -= DAY_SECONDS
+    elif candidate + DAY_SECONDS <= reference + max_future_s:
+        candidate += DAY_SECONDS  # Đồng hồ thiết bị nhanh, đã sang ngày mới trước giờ nhận
+    return candidate
+
+
+def payload_timestamp(payload: Dict[str, Any]) -> Optional[float]:
+    """Trường `ts` (epoch giây hoặc mili giây) trong payload JSON"""
+    value = payload.get('ts') if isinstance(payload, dict) else None
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        ts = float(value)
+    except (TypeError, ValueError):
+        return None
+    if ts > 1e11:  # Mili giây (epoch giây chỉ vượt 1e11 sau năm 5000)
+        ts /= 1000.0
+    return ts
+
+
+def resolve_timestamp(
+    sensor_type: str,
+    record: Any,
+    arrival: float,
+    max_future_s: float = 300.0,
+    max_age_s: float = 7 * DAY_SECONDS
+) -> float:
+    """
+    Timestamp của bản đo: ưu tiên giá trị thiết bị gửi, quay về thời điểm nhận khi thiết bị
+    không gửi hoặc đồng hồ thiết bị rõ ràng sai (ở tương lai / quá cũ).
+    """
+    if sensor_type == 'gnss':
+        # GNSSFix (processors/nmea.py): có ngày RMC thì dùng epoch đầy đủ, không cần suy ra ngày
+        device_ts = getattr(record, 'timestamp', None)
+        if device_ts is None:
+            device_ts = utc_timestamp(getattr(record, 'utc', None), arrival, max_future_s)
+    else:
+        device_ts = payload_timestamp(record)
+
+    if device_ts is None or device_ts > arrival + max_future_s or device_ts < arrival - max_age_s:
+        return arrival
+    return device_ts
@@ -0,0 +1,113 @@
+# backend/app/heartbeat.py - Coalesced Device/Station heartbeat updates
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import BigInteger, Integer, column, func, update, values
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .metrics import DB_FLUSH_ROWS, DB_FLUSH_SECONDS
+from .models.config import Device, Station
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatTracker:
+    """
+    Gộp cập nhật Device.last_data_time / Station.last_update.
+    - touch() chỉ ghi vào dirty map trong bộ nhớ (giữ timestamp lớn nhất)
+    - Task định kỳ flush mỗi bảng bằng một câu UPDATE ... FROM (VALUES ...) duy nhất
+    """
+
+    def __init__(self, engine: AsyncEngine, flush_interval_s: float = 5.0, chunk_size: int = 1000):
+        self.engine = engine
+        self.flush_interval_s = flush_interval_s
+        self.chunk_size = max(1, chunk_size)
+
+        self.dirty_devices: Dict[int, int] = {}
+        self.dirty_stations: Dict[int, int] = {}
+
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'flushes': 0, 'statements': 0, 'devices_updated': 0, 'stations_updated': 0, 'errors': 0}
+
+    def touch(self, device_id: int, station_id: int, timestamp: int):
+        if timestamp > self.dirty_devices.get(device_id, 0):
+            self.dirty_devices[device_id] = timestamp
+        if timestamp > self.dirty_stations.get(station_id, 0):
+            self.dirty_stations[station_id] = timestamp
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def get_stats(self):
+        return {**self.stats, 'pending_devices': len(self.dirty_devices), 'pending_stations': len(self.dirty_stations)}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+    def _chunks(self, items: List[Tuple[int, int]]):
+        for i in range(0, len(items), self.chunk_size):
+            yield items[i:i + self.chunk_size]
+
+    async def flush(self):
+        if not self.dirty_devices and not self.dirty_stations:
+            return
+
+        devices, self.dirty_devices = self.dirty_devices, {}
+        stations, self.dirty_stations = self.dirty_stations, {}
+
+        device_table = Device.__table__
+        station_table = Station.__table__
+        statements = 0
+        started = time.perf_counter()
+
+        try:
+            async with self.engine.begin() as conn:
+                for chunk in self._chunks(sorted(devices.items())):
+                    hb = values(column('id', Integer), column('ts', BigInteger), name='hb').data(chunk)
+                    await conn.execute(
+                        update(device_table)
+                        .where(device_table.c.id == hb.c.id)
+                        .values(last_data_time=func.greatest(device_table.c.last_data_time, hb.c.ts))
+                    )
+                    statements += 1
+
+                for chunk in self._chunks(sorted(stations.items())):
+                    hb = values(column('id', Integer), column('ts', BigInteger), name='hb').data(chunk)
+                    await conn.execute(
+                        update(station_table)
+                        .where(station_table.c.id == hb.c.id)
+                        .values(
+                            last_update=func.greatest(station_table.c.last_update, hb.c.ts),
+                            status="online"
+                        )
+                    )
+                    statements += 1
+
+            self.stats['flushes'] += 1
+            self.stats['statements'] += statements
+            self.stats['devices_updated'] += len(devices)
+            self.stats['stations_updated'] += len(stations)
+            DB_FLUSH_SECONDS.observe(time.perf_counter() - started, 'heartbeat')
+            DB_FLUSH_ROWS.inc('heartbeat', amount=len(devices) + len(stations))
+
+        except Exception as e:
+            # Gộp lại vào dirty map để lần flush sau thử tiếp
+            for device_id, ts in devices.items():
+                if ts > self.dirty_devices.get(device_id, 0):
+                    self.dirty_devices[device_id] = ts
+            for station_id, ts in stations.items():
+                if ts > self.dirty_stations.get(station_id, 0):
+                    self.dirty_stations[station_id] = ts
+            self.stats['errors'] += 1
+            logger.error(f"❌ Heartbeat flush failed: {e}")
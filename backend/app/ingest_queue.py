@@ -0,0 +1,160 @@
+# backend/app/ingest_queue.py - Bounded ingest queue + worker pool
+import asyncio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest')
+
+
+class IngestQueue:
+    """
+    Hàng đợi có giới hạn nằm giữa luồng paho và các worker chạy pipeline.
+    - Mỗi worker có một asyncio.Queue riêng, key (topic) được băm cố định vào một worker
+      → bản tin của cùng một thiết bị luôn được xử lý tuần tự, đúng thứ tự đến.
+    - Khi hàng đợi của worker bị đầy:
+        + drop_oldest: bỏ bản tin cũ nhất để nhận bản tin mới (ưu tiên dữ liệu realtime)
+        + drop_newest: bỏ bản tin vừa đến
+      `put` (bản tin đã ack với broker) không bỏ gì: chờ tới khi có chỗ.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable[Any]],
+        num_workers: int = 4,
+        max_size: int = 10000,
+        overflow_policy: str = 'drop_oldest'
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}")
+
+        self.handler = handler
+        self.num_workers = max(1, int(num_workers))
+        self.max_size_per_worker = max(1, int(max_size) // self.num_workers)
+        self.overflow_policy = overflow_policy
+
+        self.queues: List[asyncio.Queue] = []
+        self.workers: List[asyncio.Task] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Bộ đếm xuất ra cho health/metrics
+        self.stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'dropped': 0,
+            'waits': 0,
+            'errors': 0,
+            'max_depth': 0
+        }
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queues = [asyncio.Queue(maxsize=self.max_size_per_worker) for _ in range(self.num_workers)]
+        self.workers = [loop.create_task(self._worker(i)) for i in range(self.num_workers)]
+        logger.info(
+            f"✅ Ingest queue started: {self.num_workers} workers x {self.max_size_per_worker} slots, "
+            f"policy={self.overflow_policy}"
+        )
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Chờ xử lý nốt các bản tin còn trong hàng đợi (có timeout) rồi dừng worker"""
+        if not self.workers:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self.queues)),
+                timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Ingest queue drain timed out, {self.depth()} messages discarded")
+
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def _shard(self, key: str) -> int:
+        # crc32 ổn định giữa các lần chạy (khác với hash() của Python)
+        return zlib.crc32(key.encode('utf-8')) % self.num_workers
+
+    def submit_threadsafe(self, key: str, item: Tuple):
+        """Gọi từ luồng paho: chuyển bản tin sang event loop mà không tạo coroutine mới"""
+        if self.loop is None or not self.loop.is_running():
+            return
+        self.loop.call_soon_threadsafe(self.put_nowait, key, item)
+
+    def put_nowait(self, key: str, item: Tuple):
+        """Chỉ gọi trên event loop"""
+        if not self.queues:
+            return
+        queue = self.queues[self._shard(key)]
+
+        if queue.full():
+            if self.overflow_policy == 'drop_newest':
+                self._record_drop()
+                return
+            try:
+                queue.get_nowait()
+                queue.task_done()
+            except asyncio.QueueEmpty:
+                pass
+            self._record_drop()
+
+        queue.put_nowait(item)
+        self.stats['enqueued'] += 1
+
+        depth = queue.qsize()
+        if depth > self.stats['max_depth']:
+            self.stats['max_depth'] = depth
+
+    async def put(self, key: str, item: Tuple):
+        """Như put_nowait nhưng chờ chỗ trống thay vì áp dụng overflow policy (backpressure)"""
+        if not self.queues:
+            return
+        queue = self.queues[self._shard(key)]
+        if queue.full():
+            self.stats['waits'] += 1
+        await queue.put(item)
+        self.stats['enqueued'] += 1
+
+        depth = queue.qsize()
+        if depth > self.stats['max_depth']:
+            self.stats['max_depth'] = depth
+
+    def _record_drop(self):
+        self.stats['dropped'] += 1
+        # Tránh spam log khi bị tràn liên tục
+        if self.stats['dropped'] == 1 or self.stats['dropped'] % 1000 == 0:
+            logger.warning(
+                f"⚠️ Ingest queue overflow ({self.overflow_policy}): {self.stats['dropped']} messages dropped so far"
+            )
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'depth': self.depth(),
+            'depth_per_worker': [q.qsize() for q in self.queues],
+            'capacity': self.max_size_per_worker * self.num_workers,
+            'workers': self.num_workers,
+            'overflow_policy': self.overflow_policy
+        }
+
+    async def _worker(self, idx: int):
+        queue = self.queues[idx]
+        while True:
+            item = await queue.get()
+            try:
+                await self.handler(*item)
+                self.stats['processed'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Ingest worker {idx} error: {e}")
+            finally:
+                queue.task_done()
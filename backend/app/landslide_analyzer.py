@@ -2,10 +2,12 @@
 import logging
 import math
 import numpy as np
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from datetime import datetime
 from collections import defaultdict
 
+from .thresholds import StationThresholds, compile_station_thresholds
+
 logger = logging.getLogger(__name__)
 
 class LandslideAnalyzer:
@@ -18,11 +20,31 @@ class LandslideAnalyzer:
             'imu': {'count': 0, 'last_level': None}
         })
         
-    def _get_cfg(self, config: Dict, section: str, key: str, default: float) -> float:
-        try:
-            return float(config.get(section, {}).get(key, default))
-        except (ValueError, TypeError, AttributeError):
-            return float(default)
+    def get_state(self) -> Dict[int, Dict[str, Dict[str, Any]]]:
+        """Bộ đếm xác nhận dạng dict thường (defaultdict lambda không pickle được)"""
+        return {
+            station_id: {sensor: dict(info) for sensor, info in counters.items()}
+            for station_id, counters in self.alert_counters.items()
+        }
+
+    def load_state(self, snapshot: Dict[int, Dict[str, Dict[str, Any]]]):
+        for station_id, counters in snapshot.items():
+            for sensor, info in counters.items():
+                self.alert_counters[station_id][sensor] = dict(info)
+
+    def retain_stations(self, active_station_ids) -> int:
+        """Xóa bộ đếm của các trạm không còn trong topic map"""
+        active = set(active_station_ids)
+        stale = [sid for sid in self.alert_counters if sid not in active]
+        for station_id in stale:
+            del self.alert_counters[station_id]
+        return len(stale)
+
+    def _thresholds(self, config) -> StationThresholds:
+        """Nhận ngưỡng đã biên dịch (bridge) hoặc dict cấu hình thô (API phân tích dài hạn)"""
+        if isinstance(config, StationThresholds):
+            return config
+        return compile_station_thresholds(config)
 
     # =========================================================================
     # PHÂN TÍCH DÀI HẠN (Long-term Analysis)
@@ -102,43 +124,9 @@ class LandslideAnalyzer:
         velocity_mm_s: float,
         velocity_mm_day: float, 
         velocity_mm_year: float,
-        config: Dict
+        config: Union[Dict, StationThresholds]
     ) -> str:
-        classification_table = config.get('velocity_classification') or config.get('GNSS_Classification', [])
-        
-        if not classification_table:
-            classification_table = [
-                {"name": "Extremely Rapid", "threshold": 5000, "unit": "mm/s"},
-                {"name": "Very Rapid", "threshold": 50, "unit": "mm/s"},
-                {"name": "Rapid", "threshold": 0.5, "unit": "mm/s"},
-                {"name": "Moderate", "threshold": 0.05, "unit": "mm/s"},
-                {"name": "Slow", "threshold": 0.00005, "unit": "mm/s"},
-                {"name": "Very Slow", "threshold": 0.0000005, "unit": "mm/s"},
-                {"name": "Extremely Slow", "threshold": 0, "unit": "mm/s"}
-            ]
-        
-        normalized_table = []
-        for cls in classification_table:
-            thresh = float(cls.get('threshold', 0))
-            unit = cls.get('unit', 'mm/s')
-            
-            thresh_mm_s = thresh
-            if unit == 'mm/year': thresh_mm_s = thresh / 31536000
-            elif unit == 'mm/day': thresh_mm_s = thresh / 86400
-            elif unit == 'm/s': thresh_mm_s = thresh * 1000
-            
-            normalized_table.append({
-                "name": cls.get('name', 'Unknown'),
-                "threshold_mm_s": thresh_mm_s
-            })
-
-        sorted_classes = sorted(normalized_table, key=lambda x: x['threshold_mm_s'], reverse=True)
-        
-        for cls in sorted_classes:
-            if velocity_mm_s >= cls['threshold_mm_s']:
-                return cls['name']
-        
-        return "Stable"
+        return self._thresholds(config).gnss.classifier.classify(velocity_mm_s)
 
     def _detect_trend(self, sorted_data: List[Dict]) -> str:
         if len(sorted_data) < 5: return "stable"
@@ -187,7 +175,7 @@ class LandslideAnalyzer:
         self, 
         station_id: int, 
         recent_data: List[Dict[str, Any]], 
-        config: Dict
+        config: Union[Dict, StationThresholds]
     ) -> Optional[Dict]:
         
         if not recent_data: return None
@@ -197,30 +185,14 @@ class LandslideAnalyzer:
             velocity_ms = latest.get('speed_2d', 0.0) 
             velocity_mms = velocity_ms * 1000.0
             
-            # Lấy cấu hình xác nhận
-            gnss_config = config.get('GnssAlerting', {})
-            confirm_steps = int(gnss_config.get('gnss_confirm_steps', 3))  # Mặc định 3 lần
-            safe_streak = int(gnss_config.get('gnss_safe_streak', 5))      # Mặc định 5 lần an toàn
+            # Lấy cấu hình xác nhận (mặc định 3 lần, 5 lần an toàn)
+            gnss_cfg = self._thresholds(config).gnss
+            confirm_steps = gnss_cfg.confirm_steps
             
-            velocity_class = self._classify_velocity_extended(
-                velocity_mms,
-                velocity_mms * 86400,
-                velocity_mms * 31536000,
-                config
-            )
-            
-            cls_upper = velocity_class.upper()
-            
-            # ✅ XÁC ĐỊNH MỨC ĐỘ NGUY HIỂM (chưa gửi alert)
-            current_level = "INFO"
-            if "EXTREMELY RAPID" in cls_upper:
-                current_level = "CRITICAL"
-            elif "VERY RAPID" in cls_upper:
-                current_level = "CRITICAL"
-            elif "RAPID" in cls_upper:
-                current_level = "WARNING"
-            elif "MODERATE" in cls_upper:
-                current_level = "WARNING"
+            # ✅ XÁC ĐỊNH LỚP VẬN TỐC + MỨC ĐỘ NGUY HIỂM (chưa gửi alert): một lần searchsorted
+            cls_idx = gnss_cfg.classifier.index(velocity_mms)
+            velocity_class = gnss_cfg.classifier.names[cls_idx]
+            current_level = gnss_cfg.classifier.levels[cls_idx]
             
             # ✅ LẤY BỘ ĐẾM CỦA TRẠM NÀY
             counter_info = self.alert_counters[station_id]['gnss']
@@ -231,12 +203,12 @@ class LandslideAnalyzer:
                 if counter_info['last_level'] != current_level:
                     counter_info['count'] = 1
                     counter_info['last_level'] = current_level
-                    logger.info(f"🔄 [GNSS-{station_id}] Level changed to {current_level}, reset counter to 1")
+                    logger.debug("🔄 [GNSS-%s] Level changed to %s, reset counter to 1", station_id, current_level)
                     return None  # Chưa đủ → Không gửi
                 else:
                     # Level giữ nguyên → Tăng đếm
                     counter_info['count'] += 1
-                    logger.info(f"⏳ [GNSS-{station_id}] {current_level} count: {counter_info['count']}/{confirm_steps}")
+                    logger.debug("⏳ [GNSS-%s] %s count: %s/%s", station_id, current_level, counter_info['count'], confirm_steps)
                     
                     # ✅ CHỈ GỬI ALERT KHI ĐỦ SỐ LẦN XÁC NHẬN
                     if counter_info['count'] >= confirm_steps:
@@ -261,7 +233,7 @@ class LandslideAnalyzer:
                 # ✅ AN TOÀN → Đếm ngược để reset
                 if counter_info['count'] > 0:
                     counter_info['count'] = max(0, counter_info['count'] - 1)
-                    logger.info(f"✅ [GNSS-{station_id}] Safe reading, decrement to {counter_info['count']}")
+                    logger.debug("✅ [GNSS-%s] Safe reading, decrement to %s", station_id, counter_info['count'])
                 
                 # Reset sau khi liên tục an toàn
                 if counter_info['count'] == 0:
@@ -276,13 +248,12 @@ class LandslideAnalyzer:
     # =========================================================================
     # 2. PHÂN TÍCH MƯA - ✅ CÓ ĐẾM XÁC NHẬN
     # =========================================================================
-    def analyze_rainfall(self, station_id: int, recent_data: List[Dict], past_72h: List[Dict], config: Dict) -> Optional[Dict]:
+    def analyze_rainfall(self, station_id: int, recent_data: List[Dict], past_72h: List[Dict], config: Union[Dict, StationThresholds]) -> Optional[Dict]:
         if not recent_data: return None
         try:
-            watch = self._get_cfg(config, 'RainAlerting', 'rain_intensity_watch_threshold', 10.0)
-            warning = self._get_cfg(config, 'RainAlerting', 'rain_intensity_warning_threshold', 25.0)
-            critical = self._get_cfg(config, 'RainAlerting', 'rain_intensity_critical_threshold', 50.0)
-            confirm_steps = int(config.get('RainAlerting', {}).get('rain_confirm_steps', 2))  # ✅ Mặc định 2 lần
+            rain_cfg = self._thresholds(config).rain
+            watch, warning, critical = rain_cfg.watch, rain_cfg.warning, rain_cfg.critical
+            confirm_steps = rain_cfg.confirm_steps  # ✅ Mặc định 2 lần
 
             intensity = recent_data[-1]['data'].get('intensity_mm_h', 0.0)
             
@@ -316,13 +287,13 @@ class LandslideAnalyzer:
     # =========================================================================
     # 3. PHÂN TÍCH MỰC NƯỚC - ✅ CÓ ĐẾM XÁC NHẬN
     # =========================================================================
-    def analyze_water_level(self, station_id: int, recent_data: List[Dict], config: Dict) -> Optional[Dict]:
+    def analyze_water_level(self, station_id: int, recent_data: List[Dict], config: Union[Dict, StationThresholds]) -> Optional[Dict]:
         if not recent_data: return None
         try:
             val = recent_data[-1]['data'].get('water_level', 0.0)
-            warn = self._get_cfg(config, 'Water', 'warning_threshold', 999.0)
-            crit = self._get_cfg(config, 'Water', 'critical_threshold', 999.0)
-            confirm_steps = int(config.get('Water', {}).get('water_confirm_steps', 3))  # ✅ Mặc định 3 lần
+            water_cfg = self._thresholds(config).water
+            warn, crit = water_cfg.warning, water_cfg.critical
+            confirm_steps = water_cfg.confirm_steps  # ✅ Mặc định 3 lần
             
             current_level = "INFO"
             if val >= crit: current_level = "CRITICAL"
@@ -353,13 +324,14 @@ class LandslideAnalyzer:
     # =========================================================================
     # 4. PHÂN TÍCH IMU - ✅ CÓ ĐẾM XÁC NHẬN
     # =========================================================================
-    def analyze_tilt(self, station_id: int, recent_data: List[Dict], config: Dict) -> Optional[Dict]:
+    def analyze_tilt(self, station_id: int, recent_data: List[Dict], config: Union[Dict, StationThresholds]) -> Optional[Dict]:
         if not recent_data: return None
         try:
             latest = recent_data[-1]['data']
             accel = latest.get('total_accel', 0.0)
-            thresh = self._get_cfg(config, 'ImuAlerting', 'shock_threshold_ms2', 20.0)
-            confirm_steps = int(config.get('ImuAlerting', {}).get('imu_confirm_steps', 1))  # ✅ Mặc định 1 lần (shock tức thì)
+            imu_cfg = self._thresholds(config).imu
+            thresh = imu_cfg.shock_ms2
+            confirm_steps = imu_cfg.confirm_steps  # ✅ Mặc định 1 lần (shock tức thì)
             
             counter_info = self.alert_counters[station_id]['imu']
             
@@ -0,0 +1,119 @@
+# backend/app/logging_setup.py - Cấu hình logging chung: ghi file trong thread nền, giới hạn log lặp lại
+import atexit
+import logging
+import queue
+import re
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from .config import settings
+
+LOG_FORMAT = '%(asctime)s - {component} - %(levelname)s - %(message)s'
+
+# Phần tag đầu dòng "🎯 [GNSS-12]" / "⏳ [Trạm A]" giữ nguyên → gộp theo từng trạm
+_TAG = re.compile(r'^[^\w\[]*(?:\[[^\]]*\]\s*)*')
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+_listener: Optional[QueueListener] = None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Gộp log lặp lại: mỗi mẫu message (số được thay bằng '#', tag trạm giữ nguyên) chỉ được
+    ghi `burst` lần trong mỗi cửa sổ `window_s` giây, phần còn lại bị bỏ và được đếm.
+    Bản ghi đầu tiên của cửa sổ kế tiếp mang theo số message đã bị bỏ.
+    Không áp dụng cho ERROR trở lên.
+    """
+
+    def __init__(self, window_s: float = 60.0, burst: int = 10, max_keys: int = 10000):
+        super().__init__()
+        self.window_s = window_s
+        self.burst = burst
+        self.max_keys = max_keys
+        # key → [bắt đầu cửa sổ, số bản ghi trong cửa sổ, số bản ghi bị bỏ]
+        self.windows: Dict[Tuple[str, int, str], List[float]] = {}
+        self.suppressed_total = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(record: logging.LogRecord) -> Tuple[str, int, str]:
+        message = record.getMessage()
+        tag = _TAG.match(message).group(0)
+        return record.name, record.levelno, tag + _NUMBER.sub('#', message[len(tag):])
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.ERROR:
+            return True
+
+        key = self._key(record)
+        now = time.monotonic()
+        with self._lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.window_s:
+                suppressed = window[2] if window else 0
+                if len(self.windows) >= self.max_keys:
+                    self._prune(now)
+                self.windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} (+{suppressed} similar messages suppressed)"
+                    record.args = None
+                return True
+
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+            self.suppressed_total += 1
+            return False
+
+    def _prune(self, now: float):
+        expired = [k for k, w in self.windows.items() if now - w[0] >= self.window_s]
+        for key in expired:
+            del self.windows[key]
+        if len(self.windows) >= self.max_keys:
+            self.windows.clear()
+
+
+def setup_logging(component: str, log_file: Optional[str] = None) -> QueueListener:
+    """
+    Cấu hình root logger một lần cho cả process (API / ingest worker / replay):
+    - Hot path chỉ đưa record vào queue (QueueHandler), ghi file/console chạy trong QueueListener
+    - RateLimitFilter nằm trước queue → log lặp lại bị bỏ ngay, không tốn I/O
+    Gọi lại lần nữa trong cùng process không làm gì (trả về listener đang chạy).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT.format(component=component))
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMIT_WINDOW, settings.LOG_RATE_LIMIT_BURST))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Ghi nốt các record còn trong queue khi process thoát
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Dừng QueueListener sau khi đã ghi hết queue (gọi nhiều lần không sao)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
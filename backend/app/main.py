@@ -15,7 +15,7 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPExcept
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, desc, func, delete
 
@@ -27,30 +27,55 @@ from . import schemas, auth, config
 from .database import (
     auth_engine, config_engine, data_engine,
     get_auth_db, get_config_db, get_data_db,
-    AuthSessionLocal, ConfigSessionLocal
+    AuthSessionLocal, ConfigSessionLocal, pool_connections
 )
 from .models import auth as model_auth
 from .models import config as model_config
 from .models import data as model_data
 from .websocket import manager as ws_manager
+from .config_events import config_events
+from .sharding import ShardRelay, ShardSupervisor
 from .landslide_analyzer import LandslideAnalyzer
+from .metrics import metrics, register_ingest_gauges
+from .logging_setup import setup_logging
+from .modules.payload_decoder import resolve_encoding
 
-# Cấu hình Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - API - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('landslide_system.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Cấu hình Logging (ghi file trong thread nền, dùng chung cho cả bridge chạy trong process API)
+setup_logging("API", 'landslide_system.log')
 logger = logging.getLogger(__name__)
 
 # ============================================================================
 # GLOBAL INSTANCES
 # ============================================================================
 analyzer = LandslideAnalyzer()
-mqtt_service = MQTTBridge()
+
+# Sharded ingest: xử lý MQTT trong N process worker, process API chỉ relay ra WebSocket (không tạo bridge)
+shard_relay = ShardRelay() if config.settings.INGEST_SHARDS > 0 else None
+shard_supervisor = ShardSupervisor(config.settings.INGEST_SHARDS, shard_relay) if shard_relay else None
+mqtt_service = None if shard_supervisor else MQTTBridge()
+
+# ============================================================================
+# METRICS (giá trị đọc lúc scrape /metrics)
+# ============================================================================
+# Chế độ shard: pipeline chạy trong process worker, các gauge dưới đây chỉ còn phần của process API;
+# metrics của từng worker được relay qua pipe (ShardRelay.shard_metrics) và gộp vào /metrics với nhãn shard
+def _queue_depths():
+    depths = [(("ws_buffer",), len(ws_manager.message_buffer))]
+    if mqtt_service:
+        depths.extend(mqtt_service.queue_depths())
+    return depths
+
+
+register_ingest_gauges(
+    _queue_depths,
+    lambda: mqtt_service.dropped_counts() if mqtt_service else [],
+    lambda: [((), len(mqtt_service.devices))] if mqtt_service else [],
+    pool_connections
+)
+metrics.gauge(
+    'landslide_ws_clients', 'Connected WebSocket clients', (),
+    lambda: [((), len(ws_manager.active_connections))]
+)
 
 # ============================================================================
 # LIFESPAN MANAGEMENT
@@ -70,7 +95,7 @@ async def lifespan(app: FastAPI):
             await conn.run_sync(model_config.BaseConfig.metadata.create_all)
         logger.info("✓ Config database initialized")
 
-        # 3. Khởi tạo DATA DB
+        # 3. Khởi tạo DATA DB (create_all chỉ tạo bảng mới; sửa bảng đã có: `alembic upgrade head`)
         async with data_engine.begin() as conn:
             await conn.run_sync(model_data.BaseData.metadata.create_all)
         logger.info("✓ Data database initialized")
@@ -125,8 +150,12 @@ async def lifespan(app: FastAPI):
                     else:
                         logger.info("✓ System Password is up to date.")
 
-        mqtt_service.start()
-        logger.info("✓ Background MQTT Service started")
+        if shard_supervisor:
+            shard_supervisor.start(asyncio.get_running_loop())
+            logger.info(f"✓ Sharded MQTT ingest started ({config.settings.INGEST_SHARDS} workers)")
+        else:
+            mqtt_service.start()
+            logger.info("✓ Background MQTT Service started")
 
         logger.info("=" * 60)
         logger.info("🎉 System ready to serve!")
@@ -136,10 +165,14 @@ async def lifespan(app: FastAPI):
         
     finally:
         logger.info("🛑 Shutting down...")
+        # Dừng bridge trước để xử lý nốt hàng đợi khi DB vẫn còn kết nối
+        if shard_supervisor:
+            await shard_supervisor.stop()
+        else:
+            await mqtt_service.stop()
         await auth_engine.dispose()
         await config_engine.dispose()
         await data_engine.dispose()
-        mqtt_service.stop()
         logger.info("✅ Shutdown complete")
 
 # ============================================================================
@@ -337,6 +370,7 @@ async def delete_project(
         
         await db.delete(project)
         await db.commit()
+        await config_events.publish("project", "delete", project_id)
         
         return {"status": "success", "message": f"Deleted project {project_id}"}
         
@@ -476,6 +510,7 @@ async def create_station_in_project(
         
         await db.commit()
         await db.refresh(new_station)
+        await config_events.publish("station", "upsert", new_station.id, new_station.id)
         return new_station
     except Exception as e:
         await db.rollback()
@@ -521,6 +556,7 @@ async def update_station_full_config(
                         updated_at=int(time.time())
                     ))
         await db.commit()
+        await config_events.publish("station", "upsert", station_id, station_id)
         return {"status": "success"}
     except Exception as e:
         await db.rollback()
@@ -537,6 +573,7 @@ async def delete_station(
     if station:
         await db.delete(station)
         await db.commit()
+        await config_events.publish("station", "delete", station_id, station_id)
         return {"status": "success"}
     raise HTTPException(status_code=404)
 
@@ -618,6 +655,11 @@ async def create_device_in_station(
         if not result.scalar_one_or_none():
             raise HTTPException(status_code=404, detail="Station not found")
         
+        try:
+            resolve_encoding(device_data.get('config'))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid device config: {e}")
+        
         new_device = model_config.Device(
             device_code=device_data['device_code'],
             name=device_data['name'],
@@ -627,7 +669,7 @@ async def create_device_in_station(
             position=device_data.get('position'),
             is_active=True,
             last_data_time=0,
-            config={},
+            config=device_data.get('config') or {},
             created_at=int(time.time()),
             updated_at=int(time.time())
         )
@@ -635,6 +677,7 @@ async def create_device_in_station(
         db.add(new_device)
         await db.commit()
         await db.refresh(new_device)
+        await config_events.publish("device", "upsert", new_device.id, station_id)
         
         return {
             "id": new_device.id,
@@ -665,8 +708,10 @@ async def delete_device(
         if not device:
             raise HTTPException(status_code=404, detail="Device not found")
         
+        station_id = device.station_id
         await db.delete(device)
         await db.commit()
+        await config_events.publish("device", "delete", device_id, station_id)
         
         return {"status": "success", "message": f"Deleted device {device_id}"}
         
@@ -677,6 +722,41 @@ async def delete_device(
         logger.error(f"Error deleting device: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/admin/devices/{device_id}/gnss/relock", status_code=202)
+async def relock_gnss_origin(
+    device_id: int,
+    db: AsyncSession = Depends(get_config_db),
+    current_user: model_auth.User = Depends(auth.require_permission(auth.Permission.EDIT_STATIONS))
+):
+    """
+    Yêu cầu relock gốc GNSS (VD sau khi anten được dời/lắp lại).
+    Chỉ phát sự kiện: bridge đang giữ processor của thiết bị (nếu có) thực hiện bất đồng bộ,
+    kết quả xem trong log / trạng thái gốc của thiết bị.
+    """
+    try:
+        result = await db.execute(
+            select(model_config.Device).where(model_config.Device.id == device_id)
+        )
+        device = result.scalar_one_or_none()
+
+        if not device:
+            raise HTTPException(status_code=404, detail="Device not found")
+        if device.device_type != 'gnss':
+            raise HTTPException(status_code=400, detail="Device is not a GNSS receiver")
+        if shard_supervisor and not config.settings.CONFIG_EVENTS_ENABLED:
+            # Ingest worker chỉ nhận sự kiện qua LISTEN/NOTIFY → yêu cầu sẽ không tới bridge nào
+            raise HTTPException(status_code=409, detail="Config events are disabled; ingest workers cannot receive relock")
+
+        await config_events.publish("device", "relock", device_id, device.station_id)
+
+        return {"status": "requested", "message": f"Relock requested for device {device_id}"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error requesting relock: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============================================================================
 # STATION DATA ENDPOINTS 
 # ============================================================================
@@ -884,12 +964,6 @@ async def get_long_term_analysis(
         )
         gnss_data = gnss_result.scalars().all()
         
-        if len(gnss_data) < 2:
-            return {
-                "status": "insufficient_data",
-                "message": f"Cần ít nhất 2 điểm dữ liệu GNSS. Hiện có: {len(gnss_data)}"
-            }
-        
         # 3. Chuyển đổi sang format cho analyzer
         historical_data = [
             {
@@ -899,6 +973,17 @@ async def get_long_term_analysis(
             for d in gnss_data
         ]
         
+        # Raw GNSS chỉ lưu ~1 điểm/ngày (SAVE_INTERVAL_GNSS): dùng rollup 1d (giá trị cuối ngày) nếu dày hơn
+        daily_points = await _load_daily_gnss_rollups(db_data, station_id, cutoff_time)
+        if len(daily_points) > len(historical_data):
+            historical_data = daily_points
+        
+        if len(historical_data) < 2:
+            return {
+                "status": "insufficient_data",
+                "message": f"Cần ít nhất 2 điểm dữ liệu GNSS. Hiện có: {len(historical_data)}"
+            }
+        
         # 4. Gọi analyzer
         analysis_result = analyzer.analyze_long_term_velocity(
             station_id=station_id,
@@ -916,6 +1001,86 @@ async def get_long_term_analysis(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _load_daily_gnss_rollups(db_data: AsyncSession, station_id: int, cutoff_time: int) -> List[Dict[str, Any]]:
+    """
+    Rollup 1d → điểm {timestamp, data} cùng format SensorData cho analyzer.
+    Trạm có nhiều anten: không trộn chuỗi vị trí của các anten, lấy chuỗi của anten có nhiều ngày nhất.
+    """
+    result = await db_data.execute(
+        select(model_data.SensorRollup)
+        .where(
+            and_(
+                model_data.SensorRollup.station_id == station_id,
+                model_data.SensorRollup.sensor_type == "gnss",
+                model_data.SensorRollup.resolution == "1d",
+                model_data.SensorRollup.metric.in_(["pos_e", "pos_n", "pos_u", "speed_2d"]),
+                model_data.SensorRollup.bucket_start >= cutoff_time
+            )
+        )
+        .order_by(model_data.SensorRollup.bucket_start.asc())
+    )
+    series: Dict[int, Dict[int, Dict[str, Any]]] = {}
+    for r in result.scalars().all():
+        points = series.setdefault(r.device_id, {})
+        point = points.setdefault(r.bucket_start, {"timestamp": r.last_ts, "data": {}})
+        point["timestamp"] = max(point["timestamp"], r.last_ts)
+        point["data"][r.metric] = r.last
+    complete = [
+        [p for p in points.values() if all(k in p["data"] for k in ("pos_e", "pos_n", "pos_u"))]
+        for points in series.values()
+    ]
+    return max(complete, key=len, default=[])
+
+
+@app.get("/api/stations/{station_id}/rollups")
+async def get_station_rollups(
+    station_id: int,
+    sensor_type: str,
+    metric: str,
+    resolution: str = "1h",
+    hours: int = 24,
+    device_id: Optional[int] = None,
+    db_data: AsyncSession = Depends(get_data_db)
+):
+    """
+    Thống kê count/min/max/mean/last theo bucket (1m / 1h / 1d) cho biểu đồ,
+    đầy đủ độ phân giải kể cả khi raw bị throttle. Mỗi thiết bị một chuỗi (lọc bằng `device_id`)
+    """
+    if resolution not in ("1m", "1h", "1d"):
+        raise HTTPException(status_code=400, detail="resolution must be one of 1m, 1h, 1d")
+    try:
+        cutoff_time = int(time.time()) - hours * 3600
+        conditions = [
+            model_data.SensorRollup.station_id == station_id,
+            model_data.SensorRollup.sensor_type == sensor_type,
+            model_data.SensorRollup.metric == metric,
+            model_data.SensorRollup.resolution == resolution,
+            model_data.SensorRollup.bucket_start >= cutoff_time
+        ]
+        if device_id is not None:
+            conditions.append(model_data.SensorRollup.device_id == device_id)
+        result = await db_data.execute(
+            select(model_data.SensorRollup)
+            .where(and_(*conditions))
+            .order_by(model_data.SensorRollup.bucket_start.asc(), model_data.SensorRollup.device_id.asc())
+        )
+        return [
+            {
+                "device_id": r.device_id,
+                "bucket_start": r.bucket_start,
+                "count": r.count,
+                "min": r.min,
+                "max": r.max,
+                "mean": r.mean,
+                "last": r.last
+            }
+            for r in result.scalars().all()
+        ]
+    except Exception as e:
+        logger.error(f"Error fetching rollups: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================================================
 # DATABASE MANAGEMENT ENDPOINTS (cho Admin Panel)
 # ============================================================================
@@ -1076,6 +1241,7 @@ async def admin_update_station(
         station.updated_at = int(time.time())
         
         await db.commit()
+        await config_events.publish("station", "upsert", record_id, record_id)
         return {"status": "success", "message": "Station updated"}
         
     except HTTPException:
@@ -1104,6 +1270,7 @@ async def admin_delete_station(
         
         await db.delete(station)
         await db.commit()
+        await config_events.publish("station", "delete", record_id, record_id)
         
         return {"status": "success", "message": f"Deleted station {record_id}"}
         
@@ -1130,14 +1297,23 @@ async def admin_update_device(
         if not device:
             raise HTTPException(status_code=404)
         
+        if 'config' in update_data:
+            try:
+                resolve_encoding(update_data['config'])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid device config: {e}")
+        
         for key, value in update_data.items():
             if key not in ['id', '_table'] and hasattr(device, key):
                 setattr(device, key, value)
         
         device.updated_at = int(time.time())
         await db.commit()
+        await config_events.publish("device", "upsert", record_id, device.station_id)
         
         return {"status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -1154,6 +1330,7 @@ async def admin_delete_device(
             delete(model_config.Device).where(model_config.Device.id == record_id)
         )
         await db.commit()
+        await config_events.publish("device", "delete", record_id)
         return {"status": "success"}
     except Exception as e:
         await db.rollback()
@@ -1211,7 +1388,30 @@ async def websocket_endpoint(websocket: WebSocket):
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "ok", "time": time.time(), "db_status": "3-DB-Active"}
+    return {
+        "status": "ok",
+        "time": time.time(),
+        "db_status": "3-DB-Active",
+        "mqtt_bridge": (
+            {**shard_supervisor.get_stats(), "relay": shard_relay.stats}
+            if shard_supervisor else mqtt_service.get_stats()
+        )
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # Định dạng text exposition của Prometheus; chế độ shard: gộp snapshot mới nhất của từng worker (nhãn shard)
+    body = metrics.render(shard_relay.shard_metrics if shard_relay else None)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/admin/bridge/memory")
+async def bridge_memory_report(
+    current_user: model_auth.User = Depends(auth.require_permission(auth.Permission.MANAGE_USERS))
+):
+    if shard_supervisor:
+        # State nằm trong các process worker, ở đây chỉ còn throttle WebSocket
+        return {"ws_throttle": {"count": len(ws_manager.last_broadcast_time)}}
+    return mqtt_service.memory_report()
 
 @app.get("/")
 async def read_root():
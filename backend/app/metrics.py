@@ -0,0 +1,275 @@
+# backend/app/metrics.py - Bộ đếm / histogram trong process, xuất ra định dạng text của Prometheus
+import bisect
+import math
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+
+# Bucket (giây) cho các bước xử lý: từ vài µs (analyze) tới vài giây (DB flush khi DB chậm)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _with_label(sample: str, name: str, value: Any) -> str:
+    """Thêm một nhãn vào dòng sample đã render (VD shard=\"2\" cho metrics relay từ worker)"""
+    if sample.startswith('#'):
+        return sample
+    label = f'{name}="{_escape(value)}"'
+    brace, space = sample.find('{'), sample.find(' ')
+    if 0 <= brace < space:
+        return f"{sample[:brace + 1]}{label},{sample[brace + 1:]}"
+    return f"{sample[:space]}{{{label}}}{sample[space:]}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    """Bộ đếm tăng dần. Chỉ cập nhật trên event loop nên không cần khóa"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """
+    Histogram bucket cố định: observe() chỉ là một bisect + vài phép cộng.
+    Bucket lưu dạng không cộng dồn, cộng dồn lúc render (hiếm khi gọi).
+    """
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels → [count_bucket_0, ..., count_+Inf, sum]
+        self.series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Giá trị đọc tại thời điểm scrape (độ sâu hàng đợi, số client...): fn() → [(labels, value)]"""
+    kind = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str],
+        fn: Callable[[], Iterable[Tuple[Labels, float]]]
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, tuple(labels))} {_format_value(float(value))}"
+            for labels, value in self.fn()
+            if value is not None
+        ]
+
+
+class CallbackCounter(CallbackGauge):
+    """Bộ đếm sẵn có trong stats của component (số bản tin bị bỏ...), đọc lúc scrape"""
+    kind = 'counter'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Đăng ký lại cùng tên (VD: tạo lại bridge) → thay metric cũ
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str],
+        fn: Callable[[], Iterable[Tuple[Labels, float]]]
+    ) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, labelnames, fn))
+
+    def callback_counter(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str],
+        fn: Callable[[], Iterable[Tuple[Labels, float]]]
+    ) -> CallbackCounter:
+        return self.register(CallbackCounter(name, help_text, labelnames, fn))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self.metrics.get(name)
+
+    def snapshot(self) -> List[List[Any]]:
+        """[[name, help, kind, [dòng sample]], ...]: dạng JSON để worker shard gửi qua pipe về process API"""
+        families = []
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            try:
+                samples = metric._samples()
+            except Exception as e:
+                # Một gauge lỗi không được làm hỏng cả trang metrics
+                samples = [f"# ERROR {name}: {_escape(e)}"]
+            families.append([name, metric.help, metric.kind, samples])
+        return families
+
+    def render(self, shards: Optional[Mapping[int, List[List[Any]]]] = None) -> str:
+        """
+        Text exposition của Prometheus. `shards`: snapshot() mới nhất của từng worker shard,
+        gộp vào cùng họ metric với nhãn shard="N" (mỗi họ chỉ có một cặp HELP/TYPE)
+        """
+        families: Dict[str, List[Any]] = {name: [help_text, kind, samples] for name, help_text, kind, samples in self.snapshot()}
+        for shard, snapshot in sorted((shards or {}).items()):
+            for name, help_text, kind, samples in snapshot:
+                family = families.setdefault(name, [help_text, kind, []])
+                family[2] = family[2] + [_with_label(sample, 'shard', shard) for sample in samples]
+
+        lines: List[str] = []
+        for name in sorted(families):
+            help_text, kind, samples = families[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+def register_ingest_gauges(
+    queue_depths: Callable[[], Iterable[Tuple[Labels, float]]],
+    dropped: Callable[[], Iterable[Tuple[Labels, float]]],
+    device_states: Callable[[], Iterable[Tuple[Labels, float]]],
+    pool_connections: Callable[[], Iterable[Tuple[Labels, float]]]
+):
+    """Gauge đọc lúc scrape của ingest pipeline: process API (không shard) hoặc từng worker shard"""
+    metrics.gauge('landslide_queue_depth', 'Items waiting in each ingest queue/buffer', ('queue',), queue_depths)
+    metrics.callback_counter('landslide_dropped_total', 'Messages/rows dropped by bounded queues', ('queue',), dropped)
+    metrics.gauge('landslide_device_states', 'Devices with in-memory processor state', (), device_states)
+    metrics.gauge('landslide_db_pool_connections', 'SQLAlchemy pool connections by state', ('db', 'state'), pool_connections)
+
+
+# Khởi tạo instance global
+metrics = MetricsRegistry()
+
+# --- Ingest pipeline ---
+PIPELINE_STAGE_SECONDS = metrics.histogram(
+    'landslide_pipeline_stage_seconds',
+    'Time spent per reading in each ingest stage (decrypt, parse, process, analyze, save, broadcast)',
+    ('stage', 'sensor_type')
+)
+PIPELINE_READINGS = metrics.counter(
+    'landslide_pipeline_readings_total',
+    'Readings by ingest outcome (processed, invalid, backlog, skipped, error)',
+    ('sensor_type', 'outcome')
+)
+ALERTS = metrics.counter(
+    'landslide_alerts_total',
+    'Alerts raised by the analyzer',
+    ('sensor_type', 'level')
+)
+
+# --- Database ---
+DB_POOL_CHECKOUT_SECONDS = metrics.histogram(
+    'landslide_db_pool_checkout_seconds',
+    'Time waiting for a connection from the SQLAlchemy pool',
+    ('db',)
+)
+DB_FLUSH_SECONDS = metrics.histogram(
+    'landslide_db_flush_seconds',
+    'Duration of background batched writes',
+    ('writer',)
+)
+DB_FLUSH_ROWS = metrics.counter(
+    'landslide_db_flush_rows_total',
+    'Rows written by background batched writers',
+    ('writer',)
+)
+
+# --- WebSocket ---
+WS_SEND_SECONDS = metrics.histogram(
+    'landslide_ws_send_seconds',
+    'Latency of sending one message to all WebSocket clients',
+    ('type',)
+)
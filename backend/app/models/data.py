@@ -1,5 +1,5 @@
 #backend/app/models/data.py
-from sqlalchemy import Column, Integer, String, Boolean, JSON, BigInteger, Float
+from sqlalchemy import Column, Integer, String, Boolean, JSON, BigInteger, Float, UniqueConstraint
 from app.database import BaseData
 
 class SensorData(BaseData):
@@ -26,4 +26,30 @@ class Alert(BaseData):
     level = Column(String, nullable=False)  # CRITICAL, WARNING, INFO
     category = Column(String, nullable=False)  # GNSS, RAIN, WATER, IMU
     message = Column(String, nullable=False)
-    is_resolved = Column(Boolean, default=False, nullable=False)
\ No newline at end of file
+    is_resolved = Column(Boolean, default=False, nullable=False)
+
+class SensorRollup(BaseData):
+    """Thống kê theo bucket thời gian (1m / 1h / 1d) cho từng trạm - thiết bị - chỉ số"""
+    __tablename__ = "sensor_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            'station_id', 'device_id', 'sensor_type', 'metric', 'resolution', 'bucket_start',
+            name='uq_sensor_rollup_bucket'
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    station_id = Column(Integer, index=True, nullable=False)
+    device_id = Column(Integer, nullable=False, server_default='0')  # 0: bucket cũ, trước khi tách theo thiết bị
+    sensor_type = Column(String, nullable=False)
+    metric = Column(String, nullable=False)  # VD: total_displacement_mm, intensity_mm_h
+    resolution = Column(String, nullable=False)  # 1m, 1h, 1d
+    bucket_start = Column(BigInteger, index=True, nullable=False)
+    
+    count = Column(Integer, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    sum = Column(Float, nullable=False)
+    mean = Column(Float, nullable=False)
+    last = Column(Float, nullable=False)
+    last_ts = Column(BigInteger, nullable=False)
@@ -2,11 +2,6 @@ from Crypto.Cipher import AES
 from Crypto.Util.Padding import unpad
 import base64
 
-def encryption_check(dataString):
-    if dataString.startswith("\$GNGGA"):
-        return False
-    return True
-
 def decrypt_aes(ciphertext_b64, key, iv):
     # Decode the base64 encoded ciphertext
     ciphertext = base64.b64decode(ciphertext_b64)
@@ -0,0 +1,163 @@
+# backend/app/modules/payload_decoder.py
+# Giải mã payload MQTT. Chạy được trong process pool nên chỉ import những gì cần thiết.
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aes128decrypt import aes128_decrypt_base64, aes128_decrypt_base64_batch, initialKey
+from processors.nmea import parse_fixes
+from .decrypt import decrypt_aes
+
+# Kiểu mã hóa payload của thiết bị (Device.config["encoding"])
+ENCODING_PLAINTEXT = 'plaintext'    # Gửi thẳng NMEA/JSON, không giải mã
+ENCODING_CUSTOM_AES = 'custom_aes'  # aes128decrypt (mặc định, như firmware hiện tại)
+ENCODING_AES_CBC = 'aes_cbc'        # AES-128-CBC chuẩn (decrypt_aes), cần aes_key + aes_iv
+ENCODINGS = (ENCODING_PLAINTEXT, ENCODING_CUSTOM_AES, ENCODING_AES_CBC)
+
+# (kiểu, key, iv): tuple bất biến, pickle được → gửi kèm bản tin sang process pool
+EncodingSpec = Tuple[str, Optional[bytes], Optional[bytes]]
+DEFAULT_ENCODING: EncodingSpec = (ENCODING_CUSTOM_AES, bytes(initialKey), None)
+
+
+def _key_bytes(value: Any, name: str) -> bytes:
+    """Key/IV trong config: chuỗi hex 32 ký tự (16 byte)"""
+    try:
+        raw = bytes.fromhex(str(value))
+    except ValueError:
+        raise ValueError(f"{name} must be a hex string") from None
+    if len(raw) != 16:
+        raise ValueError(f"{name} must be 16 bytes (32 hex characters), got {len(raw)}")
+    return raw
+
+
+def resolve_encoding(device_config: Optional[Mapping[str, Any]]) -> EncodingSpec:
+    """
+    Device.config → EncodingSpec, gọi một lần lúc nạp topic map (không thử giải mã khi nhận bản tin).
+    VD: {"encoding": "plaintext"} | {"encoding": "aes_cbc", "aes_key": "<hex>", "aes_iv": "<hex>"}
+    Không khai báo → custom_aes với key mặc định. Config sai → ValueError.
+    """
+    config = device_config or {}
+    encoding = str(config.get('encoding') or ENCODING_CUSTOM_AES).strip().lower()
+    if encoding == ENCODING_PLAINTEXT:
+        return (ENCODING_PLAINTEXT, None, None)
+    if encoding == ENCODING_CUSTOM_AES:
+        if config.get('aes_key'):
+            return (ENCODING_CUSTOM_AES, _key_bytes(config['aes_key'], 'aes_key'), None)
+        return DEFAULT_ENCODING
+    if encoding == ENCODING_AES_CBC:
+        if not config.get('aes_key') or not config.get('aes_iv'):
+            raise ValueError("aes_cbc encoding requires aes_key and aes_iv")
+        return (ENCODING_AES_CBC, _key_bytes(config['aes_key'], 'aes_key'), _key_bytes(config['aes_iv'], 'aes_iv'))
+    raise ValueError(f"unknown encoding {encoding!r} (expected one of {', '.join(ENCODINGS)})")
+
+
+def _plaintext(decrypted) -> Optional[str]:
+    """Bản rõ → str, decode UTF-8 đúng một lần (rỗng = không hợp lệ)"""
+    if not decrypted:
+        return None
+    try:
+        return decrypted.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def decrypt_payload(payload: bytes, encoding: EncodingSpec = DEFAULT_ENCODING) -> Optional[str]:
+    """
+    bytes MQTT → chuỗi đã giải mã, None nếu là dữ liệu nhị phân (RTCM) hoặc giải mã lỗi.
+    Không qua str trung gian: memoryview của payload → base64 → AES → bỏ padding tại chỗ → decode.
+    Thiết bị plaintext: chỉ decode UTF-8 (RTCM nhị phân không phải UTF-8 hợp lệ → None).
+    """
+    mode, key, iv = encoding
+    if mode == ENCODING_PLAINTEXT:
+        return _plaintext(payload)
+    if not payload.isascii():
+        return None  # Bỏ qua dữ liệu nhị phân (RTCM): base64 luôn là ASCII
+
+    try:
+        if mode == ENCODING_AES_CBC:
+            return decrypt_aes(memoryview(payload), key, iv) or None
+        decrypted = aes128_decrypt_base64(memoryview(payload), key)
+    except Exception:
+        return None
+    return _plaintext(decrypted)
+
+
+def decrypt_payloads(
+    payloads: List[bytes],
+    encodings: Optional[List[EncodingSpec]] = None
+) -> List[Optional[str]]:
+    """
+    Như decrypt_payload cho cả micro-batch. Bản tin custom_aes được gom theo key và giải mã
+    chung một lượt (NumPy); plaintext/aes_cbc đi thẳng từng bản tin.
+    """
+    if encodings is None:
+        encodings = [DEFAULT_ENCODING] * len(payloads)
+    results: List[Optional[str]] = [None] * len(payloads)
+    by_key: Dict[bytes, List[int]] = defaultdict(list)
+    for i, (payload, encoding) in enumerate(zip(payloads, encodings)):
+        if encoding[0] == ENCODING_CUSTOM_AES:
+            if payload.isascii():
+                by_key[encoding[1]].append(i)
+        else:
+            results[i] = decrypt_payload(payload, encoding)
+
+    for key, index in by_key.items():
+        decrypted = aes128_decrypt_base64_batch([memoryview(payloads[i]) for i in index], key)
+        for i, plain in zip(index, decrypted):
+            if plain is not None:
+                results[i] = _plaintext(plain)
+    return results
+
+
+def parse_record(sensor_type: str, decrypted_payload: str) -> Optional[Any]:
+    """
+    gnss: các epoch GNSSFix (câu sai checksum / frame bị cắt bị bỏ, không còn GGA nào → None);
+    rain/water/imu: parse JSON
+    """
+    if sensor_type == 'gnss':
+        return parse_fixes(decrypted_payload) or None
+    try:
+        return json.loads(decrypted_payload)
+    except json.JSONDecodeError:
+        return None
+
+
+def decode_payload(sensor_type: str, payload: bytes, encoding: EncodingSpec = DEFAULT_ENCODING) -> Optional[Any]:
+    """
+    bytes MQTT → bản ghi cho pipeline:
+    - gnss: list GNSSFix (một payload có thể chứa nhiều epoch)
+    - rain/water/imu: dict JSON đã parse
+    Trả về None nếu payload không hợp lệ (RTCM nhị phân, giải mã lỗi, NMEA sai checksum, JSON hỏng).
+    """
+    decrypted_payload = decrypt_payload(payload, encoding)
+    if decrypted_payload is None:
+        return None
+    return parse_record(sensor_type, decrypted_payload)
+
+
+def decode_batch(items: List[Tuple[str, bytes, EncodingSpec]]) -> List[Optional[Any]]:
+    """Giải mã một micro-batch (sensor_type, payload, encoding) — đơn vị công việc gửi sang process pool"""
+    return decode_batch_timed(items)[0]
+
+
+def decode_batch_timed(items: List[Tuple[str, bytes, EncodingSpec]]) -> Tuple[List[Optional[Any]], List[Tuple[float, float]]]:
+    """
+    Như decode_batch, kèm thời gian (giải mã, parse) của từng bản tin để process chính ghi metrics.
+    Giải mã chạy theo lô nên thời gian giải mã là trung bình của cả lô.
+    """
+    if not items:
+        return [], []
+    clock = time.perf_counter
+    started = clock()
+    decrypted_payloads = decrypt_payloads([item[1] for item in items], [item[2] for item in items])
+    decrypt_s = (clock() - started) / len(items)
+
+    records: List[Optional[Any]] = []
+    timings: List[Tuple[float, float]] = []
+    for (sensor_type, _, _), decrypted_payload in zip(items, decrypted_payloads):
+        started = clock()
+        record = None if decrypted_payload is None else parse_record(sensor_type, decrypted_payload)
+        records.append(record)
+        timings.append((decrypt_s, clock() - started))
+    return records, timings
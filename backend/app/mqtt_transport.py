@@ -0,0 +1,224 @@
+# backend/app/mqtt_transport.py - Chạy giao thức MQTT (paho) trực tiếp trên event loop, không dùng thread
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, List, Optional
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncioMQTTTransport:
+    """
+    Thay cho loop_start() của paho (thread riêng + run_coroutine_threadsafe cho mỗi bản tin):
+    - Dùng external-loop API: socket của paho được đăng ký add_reader/add_writer trên event loop,
+      loop_read/loop_write/loop_misc chạy ngay trên loop → callback paho chạy trên loop
+    - Bản tin vào asyncio.Queue, đọc theo lô bằng `async for batch in transport.batches()`
+    - Backpressure: queue đạt `queue_size` → ngừng đọc socket (remove_reader), đọc lại khi queue
+      còn một nửa → TCP/broker giữ bản tin thay vì bỏ mà không ack
+    - QoS ≥ 1: manual ack, PUBACK chỉ gửi cho bản tin bridge đã nhận bàn giao
+    - Mất kết nối: reconnect không chặn loop (TCP connect chạy trong executor), backoff lũy thừa
+    """
+
+    def __init__(
+        self,
+        client: mqtt.Client,
+        host: str,
+        port: int,
+        keepalive: int = 60,
+        on_connect: Optional[Callable] = None,
+        queue_size: int = 10000,
+        batch_size: int = 100,
+        manual_ack: bool = False,
+        backoff_initial_s: float = 1.0,
+        backoff_max_s: float = 60.0
+    ):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.on_connect_cb = on_connect
+        self.batch_size = max(1, batch_size)
+        self.manual_ack = manual_ack
+        self.backoff_initial_s = backoff_initial_s
+        self.backoff_max_s = backoff_max_s
+
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.connected = False
+        self._stopping = False
+        self._has_connected_once = False
+        self._sock = None
+        self._paused = False
+        self._misc_task: Optional[asyncio.Task] = None
+        self._connect_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'received': 0, 'dropped': 0, 'batches': 0, 'acks': 0, 'pauses': 0,
+            'reconnects': 0, 'connect_failures': 0
+        }
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.manual_ack_set(manual_ack)
+
+    # ------------------------------------------------------------------
+    # Vòng đời
+    # ------------------------------------------------------------------
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        # Không giới hạn cứng: giới hạn bằng cách ngừng đọc socket (xem _on_message)
+        self.queue = asyncio.Queue()
+        self._stopping = False
+        self._paused = False
+        self._misc_task = loop.create_task(self._misc_loop())
+        self._connect_task = loop.create_task(self._connect_loop())
+
+    async def stop(self):
+        self._stopping = True
+        for task in (self._connect_task, self._misc_task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._connect_task, self._misc_task) if t), return_exceptions=True)
+        if self.connected:
+            self.client.disconnect()
+        self._detach_socket()
+
+    async def _connect_loop(self):
+        backoff = self.backoff_initial_s
+        while not self._stopping:
+            try:
+                # connect()/reconnect() mở TCP đồng bộ (DNS + handshake) → chạy trong executor
+                if self._has_connected_once:
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                else:
+                    await self.loop.run_in_executor(
+                        None, self.client.connect, self.host, self.port, self.keepalive
+                    )
+                self._has_connected_once = True
+                return
+            except Exception as e:
+                self.stats['connect_failures'] += 1
+                logger.error(f"❌ MQTT connect failed: {e}. Retrying in {backoff:.0f}s...")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.backoff_max_s)
+
+    async def _misc_loop(self):
+        # Keepalive PINGREQ, timeout, retry QoS > 0
+        while True:
+            await asyncio.sleep(1)
+            if self._sock is not None:
+                self.client.loop_misc()
+
+    # ------------------------------------------------------------------
+    # Socket callbacks (có thể được gọi từ executor trong lúc connect)
+    # ------------------------------------------------------------------
+    def _call_in_loop(self, fn, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            fn(*args)
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call_in_loop(self._attach_socket, sock)
+
+    def _attach_socket(self, sock):
+        self._sock = sock
+        if not self._paused:
+            self.loop.add_reader(sock, self.client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call_in_loop(self._detach_socket)
+
+    def _detach_socket(self):
+        if self._sock is not None:
+            self.loop.remove_reader(self._sock)
+            self.loop.remove_writer(self._sock)
+            self._sock = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.add_writer, sock, self.client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.remove_writer, sock)
+
+    # ------------------------------------------------------------------
+    # Protocol callbacks (chạy trên event loop)
+    # ------------------------------------------------------------------
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        self.connected = rc == 0
+        if self.on_connect_cb:
+            self.on_connect_cb(client, userdata, flags, rc, properties)
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties):
+        self.connected = False
+        self._detach_socket()
+        if self._stopping:
+            logger.info("✅ MQTT Disconnected gracefully")
+            return
+        logger.warning(f"⚠️ MQTT disconnect: rc={reason_code}. Reconnecting in background...")
+        self.stats['reconnects'] += 1
+        if self._connect_task is None or self._connect_task.done():
+            self._connect_task = self.loop.create_task(self._connect_loop())
+
+    def _on_message(self, client, userdata, msg):
+        self.queue.put_nowait(msg)
+        self.stats['received'] += 1
+        if not self._paused and self.queue.qsize() >= self.queue_size:
+            self._pause_reading()
+
+    def _pause_reading(self):
+        # Bản tin đang nằm trong buffer paho/TCP vẫn an toàn: broker chỉ coi là xong khi nhận PUBACK
+        self._paused = True
+        self.stats['pauses'] += 1
+        if self._sock is not None:
+            self.loop.remove_reader(self._sock)
+        logger.warning(f"⚠️ MQTT receive queue full ({self.queue.qsize()}), pausing socket reads")
+
+    def _resume_reading(self):
+        self._paused = False
+        if self._sock is not None:
+            self.loop.add_reader(self._sock, self.client.loop_read)
+        logger.info("✅ MQTT receive queue drained, resuming socket reads")
+
+    # ------------------------------------------------------------------
+    # Tiêu thụ bản tin
+    # ------------------------------------------------------------------
+    async def batches(self) -> AsyncIterator[List[mqtt.MQTTMessage]]:
+        """Chờ bản tin đầu tiên rồi lấy thêm những gì đã có sẵn trong queue (tối đa batch_size)"""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            if self._paused and self.queue.qsize() <= self.queue_size // 2:
+                self._resume_reading()
+            self.stats['batches'] += 1
+            yield batch
+
+    def ack(self, batch: List[mqtt.MQTTMessage]):
+        """
+        PUBACK cho các bản tin đã được nhận bàn giao: paho ghi vào buffer ra, socket writer gửi gộp một lần.
+        Bản tin không được ack sẽ được broker gửi lại khi kết nối lại.
+        """
+        if not self.manual_ack:
+            return
+        for msg in batch:
+            if msg.qos > 0:
+                self.client.ack(msg.mid, msg.qos)
+                self.stats['acks'] += 1
+
+    def get_stats(self):
+        return {**self.stats, 'connected': self.connected, 'queue_depth': self.queue.qsize() if self.queue else 0}
@@ -0,0 +1,211 @@
+# backend/app/rollups.py - Thống kê liên tục (1m/1h/1d) cho mọi bản đo, kể cả bản không lưu raw
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .bulk_writer import _is_transient
+from .clock import system_clock
+from .metrics import DB_FLUSH_ROWS, DB_FLUSH_SECONDS
+from .models import data as model_data
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# Chỉ số được tổng hợp theo loại cảm biến (key trong processed_data)
+ROLLUP_METRICS = {
+    'gnss': ('total_displacement_mm', 'speed_2d', 'speed_2d_mm_s', 'pos_e', 'pos_n', 'pos_u'),
+    'rain': ('rainfall_mm', 'intensity_mm_h'),
+    'water': ('water_level',),
+    'imu': ('total_accel', 'roll', 'pitch')
+}
+
+BucketKey = Tuple[int, int, str, str, str, int]  # station_id, device_id, sensor_type, metric, resolution, bucket_start
+
+# Vị trí các trường trong bucket (list cho nhanh, cập nhật tại chỗ)
+COUNT, MIN, MAX, SUM, LAST, LAST_TS = range(6)
+
+
+class RollupAggregator:
+    """
+    Gộp mọi bản đo (không bị ảnh hưởng bởi SAVE_INTERVAL_*) thành count/min/max/mean/last
+    theo bucket 1 phút / 1 giờ / 1 ngày, trong bộ nhớ.
+    - Bucket đóng khi clock vượt quá cuối bucket + `grace_s` → upsert vào sensor_rollups
+    - Upsert gộp (ON CONFLICT): dữ liệu tồn đọng tới muộn hoặc bucket ghi dở trước khi
+      restart được cộng dồn vào bucket đã có, không ghi đè
+    - stop(): ghi cả các bucket đang mở (gộp tiếp khi khởi động lại)
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        flush_interval_s: float = 5.0,
+        grace_s: float = 10.0,
+        chunk_size: int = 1000,
+        max_pending: int = 200000,
+        clock=None
+    ):
+        self.engine = engine
+        self.flush_interval_s = flush_interval_s
+        self.grace_s = grace_s
+        self.chunk_size = max(1, chunk_size)
+        self.max_pending = max(1, max_pending)
+        self.clock = clock or system_clock
+
+        self.buckets: Dict[BucketKey, List[float]] = {}
+        self.closed: List[Tuple[BucketKey, List[float]]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.stats = {'readings': 0, 'buckets_written': 0, 'flushes': 0, 'errors': 0, 'dropped': 0}
+
+    def add(self, station_id: int, device_id: int, sensor_type: str, timestamp: float, data: Dict[str, Any]):
+        metrics = ROLLUP_METRICS.get(sensor_type)
+        if not metrics:
+            return
+        self.stats['readings'] += 1
+        ts = int(timestamp)
+        for metric in metrics:
+            value = data.get(metric)
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if not math.isfinite(value):
+                continue
+
+            for resolution, seconds in RESOLUTIONS.items():
+                key = (station_id, device_id, sensor_type, metric, resolution, ts - ts % seconds)
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    self.buckets[key] = [1, value, value, value, value, ts]
+                    continue
+                bucket[COUNT] += 1
+                if value < bucket[MIN]: bucket[MIN] = value
+                if value > bucket[MAX]: bucket[MAX] = value
+                bucket[SUM] += value
+                if ts >= bucket[LAST_TS]:
+                    bucket[LAST] = value
+                    bucket[LAST_TS] = ts
+
+    def _close_expired(self, force: bool = False):
+        now = self.clock.time()
+        expired = [
+            key for key in self.buckets
+            if force or key[5] + RESOLUTIONS[key[4]] + self.grace_s <= now
+        ]
+        for key in expired:
+            self.closed.append((key, self.buckets.pop(key)))
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._close_expired(force=True)
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            self._close_expired()
+            await self.flush()
+
+    @staticmethod
+    def _row(key: BucketKey, bucket: List[float]) -> Dict[str, Any]:
+        station_id, device_id, sensor_type, metric, resolution, bucket_start = key
+        return {
+            'station_id': station_id,
+            'device_id': device_id,
+            'sensor_type': sensor_type,
+            'metric': metric,
+            'resolution': resolution,
+            'bucket_start': bucket_start,
+            'count': int(bucket[COUNT]),
+            'min': bucket[MIN],
+            'max': bucket[MAX],
+            'sum': bucket[SUM],
+            'mean': bucket[SUM] / bucket[COUNT],
+            'last': bucket[LAST],
+            'last_ts': int(bucket[LAST_TS])
+        }
+
+    @staticmethod
+    def _upsert_statement():
+        table = model_data.SensorRollup.__table__
+        stmt = pg_insert(table)
+        existing, new = table.c, stmt.excluded
+        merged_count = existing.count + new.count
+        merged_sum = existing.sum + new.sum
+        newer = new.last_ts >= existing.last_ts
+        return stmt.on_conflict_do_update(
+            constraint='uq_sensor_rollup_bucket',
+            set_={
+                'count': merged_count,
+                'min': func.least(existing.min, new.min),
+                'max': func.greatest(existing.max, new.max),
+                'sum': merged_sum,
+                'mean': merged_sum / merged_count,
+                'last': case((newer, new.last), else_=existing.last),
+                'last_ts': func.greatest(existing.last_ts, new.last_ts)
+            }
+        )
+
+    async def flush(self):
+        if not self.closed:
+            return
+        async with self._flush_lock:
+            closed, self.closed = self.closed, []
+            # Gộp trùng key (bucket bị đóng rồi mở lại bởi dữ liệu muộn) → mỗi key một dòng/câu lệnh
+            merged: Dict[BucketKey, List[float]] = {}
+            for key, bucket in closed:
+                current = merged.get(key)
+                if current is None:
+                    merged[key] = bucket
+                    continue
+                current[COUNT] += bucket[COUNT]
+                current[MIN] = min(current[MIN], bucket[MIN])
+                current[MAX] = max(current[MAX], bucket[MAX])
+                current[SUM] += bucket[SUM]
+                if bucket[LAST_TS] >= current[LAST_TS]:
+                    current[LAST], current[LAST_TS] = bucket[LAST], bucket[LAST_TS]
+
+            items = list(merged.items())
+            rows = [self._row(key, bucket) for key, bucket in items]
+            started = time.perf_counter()
+            try:
+                stmt = self._upsert_statement()
+                async with self.engine.begin() as conn:
+                    for i in range(0, len(rows), self.chunk_size):
+                        await conn.execute(stmt, rows[i:i + self.chunk_size])
+                self.stats['flushes'] += 1
+                self.stats['buckets_written'] += len(rows)
+                DB_FLUSH_SECONDS.observe(time.perf_counter() - started, 'rollups')
+                DB_FLUSH_ROWS.inc('rollups', amount=len(rows))
+            except Exception as e:
+                self.stats['errors'] += 1
+                if _is_transient(e):
+                    # Transaction lỗi → chưa ghi gì, giữ lại để thử lại ở chu kỳ sau
+                    self.closed[:0] = items
+                    overflow = len(self.closed) - self.max_pending
+                    if overflow > 0:
+                        del self.closed[:overflow]
+                        self.stats['dropped'] += overflow
+                    logger.warning(f"⚠️ Rollup upsert failed, {len(rows)} buckets kept for retry: {e}")
+                else:
+                    self.stats['dropped'] += len(rows)
+                    logger.error(f"❌ Rollup upsert rejected, dropped {len(rows)} buckets: {e}")
+
+    def get_stats(self):
+        return {**self.stats, 'open_buckets': len(self.buckets), 'pending_buckets': len(self.closed)}
+
@@ -18,6 +18,7 @@ from ..database import get_auth_db, get_config_db, get_data_db
 from ..models import auth as model_auth
 from ..models import config as model_config
 from ..models import data as model_data
+from processors.nmea import parse_fixes
 
 logger = logging.getLogger(__name__)
 router = APIRouter(
@@ -446,25 +447,12 @@ class GNSSLiveFetcher:
         self.is_connected = False
         
     def _parse_gngga(self, gngga_string: str) -> Optional[dict]:
-        try:
-            parts = gngga_string.strip().split(',')
-            if len(parts) < 10 or not parts[2] or not parts[4]: return None
-            
-            lat_str, lat_dir = parts[2], parts[3]
-            lat = float(lat_str[:2]) + float(lat_str[2:]) / 60.0
-            if lat_dir == 'S': lat = -lat
-            
-            lon_str, lon_dir = parts[4], parts[5]
-            lon = float(lon_str[:3]) + float(lon_str[3:]) / 60.0
-            if lon_dir == 'W': lon = -lon
-            
-            h = float(parts[9]) if parts[9] else 0.0
-            fix_quality = int(parts[6]) if parts[6] else 0
-            num_sats = int(parts[7]) if parts[7] else 0
-            
-            return {'lat': lat, 'lon': lon, 'h': h, 'fix_quality': fix_quality, 'num_sats': num_sats}
-        except (ValueError, IndexError):
+        # Epoch GGA cuối cùng trong payload (parser dùng chung, đã kiểm tra checksum)
+        fixes = parse_fixes(gngga_string)
+        if not fixes:
             return None
+        fix = fixes[-1]
+        return {'lat': fix.lat, 'lon': fix.lon, 'h': fix.h, 'fix_quality': fix.fix_quality, 'num_sats': fix.num_sats}
     
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
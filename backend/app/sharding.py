@@ -0,0 +1,186 @@
+# backend/app/sharding.py - Multi-process sharded ingest (supervisor + WebSocket relay)
+import asyncio
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import zlib
+from typing import IO, Any, Dict, List, Optional
+
+from .websocket import manager
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ingest_worker.py")
+
+
+def shard_for(station_id: int, shard_count: int) -> int:
+    """Shard sở hữu trạm: crc32 ổn định giữa các process (khác hash() của Python)"""
+    return zlib.crc32(str(station_id).encode('utf-8')) % shard_count
+
+
+# Giới hạn một dòng relay (JSON) khi đọc từ pipe của worker
+RELAY_LINE_LIMIT = 1 << 20
+
+
+class RelayWriter:
+    """
+    Chạy trong process worker: ghi kết quả realtime thành các dòng JSON lên stdout (pipe tới process API).
+    Snapshot metrics của worker đi cùng pipe, đánh dấu bằng key "_relay": "metrics".
+    Ghi trong thread nền với hàng đợi giới hạn → event loop không bao giờ bị chặn bởi pipe;
+    hàng đợi đầy (process API không đọc kịp) thì bỏ message như QoS 0.
+    Log của worker đi ra stderr nên stdout chỉ chứa dữ liệu relay.
+    """
+
+    def __init__(self, stream: IO[bytes], max_pending: int = 10000):
+        self.stream = stream
+        self.queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=max_pending)
+        self.stats = {'relayed': 0, 'dropped': 0}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="shard-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def publish(self, message: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(json.dumps(message).encode('utf-8') + b"\n")
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def publish_metrics(self, families: List[List[Any]]):
+        """MetricsRegistry.snapshot() của worker → process API gộp vào /metrics"""
+        self.publish({'_relay': 'metrics', 'families': families})
+
+    def _run(self):
+        while True:
+            line = self.queue.get()
+            if line is None:
+                return
+            try:
+                self.stream.write(line)
+                if self.queue.empty():
+                    self.stream.flush()
+                self.stats['relayed'] += 1
+            except (OSError, ValueError):
+                return  # Pipe đã đóng (process API dừng)
+
+
+class ShardRelay:
+    """
+    Chạy trong process API khi bật sharding: đọc các dòng JSON từ stdout (pipe) của từng worker
+    và đẩy ra WebSocket. IPC cục bộ, không đi vòng qua MQTT broker.
+    Dòng metrics giữ lại snapshot mới nhất của mỗi shard (`shard_metrics`), xóa khi worker thoát.
+    """
+
+    def __init__(self):
+        self.stats = {'relayed': 0, 'invalid': 0, 'metrics_updates': 0}
+        self.shard_metrics: Dict[int, List[List[Any]]] = {}
+
+    async def consume(self, shard: int, stream: asyncio.StreamReader):
+        """Đọc tới khi worker thoát (EOF)"""
+        try:
+            await self._consume(shard, stream)
+        finally:
+            self.shard_metrics.pop(shard, None)
+
+    async def _consume(self, shard: int, stream: asyncio.StreamReader):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Dòng vượt RELAY_LINE_LIMIT: StreamReader đã bỏ phần dữ liệu đó
+                self.stats['invalid'] += 1
+                continue
+            if not line:
+                return
+            try:
+                message = json.loads(line)
+            except ValueError:
+                self.stats['invalid'] += 1
+                continue
+            if isinstance(message, dict) and message.get('_relay') == 'metrics':
+                self.shard_metrics[shard] = message.get('families') or []
+                self.stats['metrics_updates'] += 1
+                continue
+            self.stats['relayed'] += 1
+            try:
+                await manager.broadcast(message)
+            except Exception as e:
+                logger.error(f"❌ Shard {shard} relay broadcast failed: {e}")
+
+
+class ShardSupervisor:
+    """Khởi chạy N process ingest_worker.py và tự khởi động lại khi worker bị dừng bất thường"""
+
+    def __init__(self, shard_count: int, relay: ShardRelay, restart_delay: float = 5.0):
+        self.shard_count = shard_count
+        self.relay = relay
+        self.restart_delay = restart_delay
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.restarts = 0
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._stopping = False
+        self._tasks = [loop.create_task(self._supervise(i)) for i in range(self.shard_count)]
+        logger.info(f"🚀 Starting {self.shard_count} ingest worker processes")
+
+    async def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        for proc in self.processes.values():
+            if proc.returncode is None:
+                proc.terminate()
+        for shard, proc in self.processes.items():
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Ingest worker {shard} did not exit, killing")
+                proc.kill()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _supervise(self, shard: int):
+        while not self._stopping:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, WORKER_SCRIPT,
+                "--shard", str(shard), "--shards", str(self.shard_count), "--relay-stdout",
+                cwd=os.path.dirname(WORKER_SCRIPT),
+                stdout=asyncio.subprocess.PIPE,
+                limit=RELAY_LINE_LIMIT
+            )
+            self.processes[shard] = proc
+            logger.info(f"✅ Ingest worker {shard}/{self.shard_count} started (pid={proc.pid})")
+
+            # Đọc hết pipe trước khi chờ process thoát (tránh worker bị chặn vì pipe đầy)
+            await self.relay.consume(shard, proc.stdout)
+            returncode = await proc.wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            logger.error(f"❌ Ingest worker {shard} exited (rc={returncode}), restarting in {self.restart_delay}s")
+            await asyncio.sleep(self.restart_delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'shards': self.shard_count,
+            'restarts': self.restarts,
+            'workers': {
+                shard: {'pid': proc.pid, 'running': proc.returncode is None}
+                for shard, proc in self.processes.items()
+            }
+        }
@@ -0,0 +1,188 @@
+# backend/app/thresholds.py - Ngưỡng cảnh báo của trạm, biên dịch một lần khi nạp topic map
+import bisect
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bảng phân loại vận tốc mặc định (Cruden & Varnes) khi trạm không cấu hình
+DEFAULT_VELOCITY_CLASSIFICATION = [
+    {"name": "Extremely Rapid", "threshold": 5000, "unit": "mm/s"},
+    {"name": "Very Rapid", "threshold": 50, "unit": "mm/s"},
+    {"name": "Rapid", "threshold": 0.5, "unit": "mm/s"},
+    {"name": "Moderate", "threshold": 0.05, "unit": "mm/s"},
+    {"name": "Slow", "threshold": 0.00005, "unit": "mm/s"},
+    {"name": "Very Slow", "threshold": 0.0000005, "unit": "mm/s"},
+    {"name": "Extremely Slow", "threshold": 0, "unit": "mm/s"}
+]
+
+# Đơn vị → (nhân, chia) sang mm/s. Chia đúng như bảng gốc (x / 31536000 ≠ x * (1 / 31536000) ở bit cuối)
+# để vận tốc nằm đúng trên ngưỡng vẫn rơi vào cùng một lớp
+UNIT_TO_MM_S = {
+    'mm/s': (1.0, 1.0),
+    'mm/year': (1.0, 31536000.0),
+    'mm/day': (1.0, 86400.0),
+    'm/s': (1000.0, 1.0)
+}
+
+
+def to_mm_s(value: float, unit: str) -> float:
+    scale, divisor = UNIT_TO_MM_S.get(unit, (1.0, 1.0))
+    return value * scale / divisor
+
+STABLE = "Stable"
+
+
+def velocity_level(class_name: str) -> str:
+    """Mức cảnh báo tức thời theo tên lớp vận tốc"""
+    cls_upper = class_name.upper()
+    if "EXTREMELY RAPID" in cls_upper or "VERY RAPID" in cls_upper:
+        return "CRITICAL"
+    if "RAPID" in cls_upper or "MODERATE" in cls_upper:
+        return "WARNING"
+    return "INFO"
+
+
+@dataclass(frozen=True)
+class VelocityClassifier:
+    """
+    Bảng phân loại đã chuẩn hóa về mm/s, sắp tăng dần để tra bằng searchsorted.
+    Tương đương duyệt bảng giảm dần và lấy lớp đầu tiên có v >= ngưỡng
+    (ngưỡng trùng nhau: lớp đứng trước trong cấu hình thắng).
+    """
+    thresholds_mm_s: np.ndarray
+    names: Tuple[str, ...]     # Cùng thứ tự với thresholds_mm_s, phần tử cuối = STABLE
+    levels: Tuple[str, ...]
+    bounds: Tuple[float, ...]  # Bản tuple của thresholds_mm_s: tra 1 giá trị bằng bisect nhanh hơn numpy
+
+    @classmethod
+    def compile(cls, table) -> "VelocityClassifier":
+        normalized = []
+        for row in table or DEFAULT_VELOCITY_CLASSIFICATION:
+            try:
+                thresh = to_mm_s(float(row.get('threshold', 0)), row.get('unit', 'mm/s'))
+            except (TypeError, ValueError, AttributeError):
+                logger.warning(f"⚠️ Ignoring invalid velocity class {row!r}")
+                continue
+            if math.isnan(thresh):
+                continue
+            normalized.append((row.get('name', 'Unknown'), thresh))
+
+        # Sort giảm dần ổn định rồi đảo ngược → trong nhóm trùng ngưỡng, lớp khai báo trước nằm cuối
+        ordered = sorted(normalized, key=lambda x: x[1], reverse=True)[::-1]
+        thresholds = np.array([t for _, t in ordered], dtype=np.float64)
+        thresholds.setflags(write=False)
+        names = tuple(name for name, _ in ordered) + (STABLE,)
+        return cls(thresholds, names, tuple(velocity_level(n) for n in names), tuple(t for _, t in ordered))
+
+    def index(self, velocity_mm_s: float) -> int:
+        if velocity_mm_s != velocity_mm_s:  # NaN
+            return len(self.names) - 1
+        idx = bisect.bisect_right(self.bounds, velocity_mm_s) - 1
+        return idx if idx >= 0 else len(self.names) - 1
+
+    def classify(self, velocity_mm_s: float) -> str:
+        return self.names[self.index(velocity_mm_s)]
+
+    def indices_many(self, velocities_mm_s) -> np.ndarray:
+        v = np.asarray(velocities_mm_s, dtype=np.float64)
+        idx = np.searchsorted(self.thresholds_mm_s, v, side='right') - 1
+        idx[(idx < 0) | np.isnan(v)] = len(self.names) - 1
+        return idx
+
+    def classify_many(self, velocities_mm_s) -> np.ndarray:
+        """Phân loại cả mảng vận tốc (mm/s) một lần → mảng tên lớp"""
+        return np.array(self.names, dtype=object)[self.indices_many(velocities_mm_s)]
+
+    def levels_many(self, velocities_mm_s) -> np.ndarray:
+        return np.array(self.levels, dtype=object)[self.indices_many(velocities_mm_s)]
+
+
+@dataclass(frozen=True)
+class GnssThresholds:
+    classifier: VelocityClassifier
+    confirm_steps: int
+    safe_streak: int
+
+
+@dataclass(frozen=True)
+class RainThresholds:
+    watch: float
+    warning: float
+    critical: float
+    confirm_steps: int
+
+
+@dataclass(frozen=True)
+class WaterThresholds:
+    warning: float
+    critical: float
+    confirm_steps: int
+
+
+@dataclass(frozen=True)
+class ImuThresholds:
+    shock_ms2: float
+    confirm_steps: int
+
+
+@dataclass(frozen=True)
+class StationThresholds:
+    gnss: GnssThresholds
+    rain: RainThresholds
+    water: WaterThresholds
+    imu: ImuThresholds
+
+
+def _section(config: Dict, name: str) -> Dict:
+    section = config.get(name) if isinstance(config, dict) else None
+    return section if isinstance(section, dict) else {}
+
+
+def _float(section: Dict, key: str, default: float) -> float:
+    try:
+        return float(section.get(key, default))
+    except (ValueError, TypeError):
+        return float(default)
+
+
+def _int(section: Dict, key: str, default: int) -> int:
+    try:
+        return int(section.get(key, default))
+    except (ValueError, TypeError):
+        return int(default)
+
+
+def compile_station_thresholds(config: Dict[str, Any]) -> StationThresholds:
+    """Station.config (dict JSON) → ngưỡng đã kiểu hóa, dùng chung cho mọi bản tin của trạm"""
+    config = config if isinstance(config, dict) else {}
+    gnss, rain = _section(config, 'GnssAlerting'), _section(config, 'RainAlerting')
+    water, imu = _section(config, 'Water'), _section(config, 'ImuAlerting')
+
+    table = config.get('velocity_classification') or config.get('GNSS_Classification', [])
+    return StationThresholds(
+        gnss=GnssThresholds(
+            classifier=VelocityClassifier.compile(table),
+            confirm_steps=_int(gnss, 'gnss_confirm_steps', 3),
+            safe_streak=_int(gnss, 'gnss_safe_streak', 5)
+        ),
+        rain=RainThresholds(
+            watch=_float(rain, 'rain_intensity_watch_threshold', 10.0),
+            warning=_float(rain, 'rain_intensity_warning_threshold', 25.0),
+            critical=_float(rain, 'rain_intensity_critical_threshold', 50.0),
+            confirm_steps=_int(rain, 'rain_confirm_steps', 2)
+        ),
+        water=WaterThresholds(
+            warning=_float(water, 'warning_threshold', 999.0),
+            critical=_float(water, 'critical_threshold', 999.0),
+            confirm_steps=_int(water, 'water_confirm_steps', 3)
+        ),
+        imu=ImuThresholds(
+            shock_ms2=_float(imu, 'shock_threshold_ms2', 20.0),
+            confirm_steps=_int(imu, 'imu_confirm_steps', 1)
+        )
+    )
@@ -0,0 +1,137 @@
+# backend/app/topic_router.py - MQTT topic trie + router cho chế độ wildcard
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+
+def has_wildcard(topic: str) -> bool:
+    return '+' in topic or '#' in topic
+
+
+def filter_covers(topic_filter: str, topic: str) -> bool:
+    """
+    True nếu mọi bản tin khớp `topic` cũng khớp `topic_filter`.
+    `topic` có thể là topic cụ thể hoặc cũng là một filter (+, #).
+    """
+    f_parts = topic_filter.split('/')
+    t_parts = topic.split('/')
+    for i, f in enumerate(f_parts):
+        if f == '#':
+            return True
+        if i >= len(t_parts):
+            return False
+        t = t_parts[i]
+        if f == '+':
+            if t == '#':
+                return False
+            continue
+        if f != t:
+            return False
+    return len(f_parts) == len(t_parts)
+
+
+class _Node:
+    __slots__ = ('children', 'value', 'has_value')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.value: Any = None
+        self.has_value = False
+
+
+class TopicTrie:
+    """Trie của các MQTT topic filter, tra cứu theo từng cấp topic (hỗ trợ + và #)"""
+
+    def __init__(self):
+        self.root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, topic_filter: str, value: Any):
+        node = self.root
+        for level in topic_filter.split('/'):
+            node = node.children.setdefault(level, _Node())
+        if not node.has_value:
+            self._size += 1
+        node.value = value
+        node.has_value = True
+
+    def match(self, topic: str) -> List[Any]:
+        """Trả về value của mọi filter khớp với topic cụ thể"""
+        levels = topic.split('/')
+        results: List[Any] = []
+        # Theo chuẩn MQTT: topic bắt đầu bằng '$' không khớp wildcard ở cấp đầu
+        self._match(self.root, levels, 0, results, topic.startswith('$'))
+        return results
+
+    def _match(self, node: _Node, levels: List[str], i: int, results: List[Any], dollar: bool):
+        wildcard_ok = not (dollar and i == 0)
+
+        hash_node = node.children.get('#') if wildcard_ok else None
+        if hash_node is not None and hash_node.has_value:
+            results.append(hash_node.value)
+
+        if i == len(levels):
+            if node.has_value:
+                results.append(node.value)
+            return
+
+        child = node.children.get(levels[i])
+        if child is not None:
+            self._match(child, levels, i + 1, results, dollar)
+
+        plus = node.children.get('+') if wildcard_ok else None
+        if plus is not None:
+            self._match(plus, levels, i + 1, results, dollar)
+
+
+class _Routes(NamedTuple):
+    """Bảng tra của một lần rebuild: đổi cả cặp bằng một phép gán, không sửa tại chỗ"""
+    exact: Dict[str, Dict[str, Any]]
+    trie: TopicTrie
+
+
+class TopicRouter:
+    """
+    Ánh xạ topic nhận được → thông tin thiết bị.
+    - Topic cụ thể: tra dict O(1)
+    - Topic thiết bị có wildcard: tra trie
+    - `filters`: các wildcard subscription dùng thay cho subscribe từng topic
+    """
+
+    def __init__(self, filters: Iterable[str] = ()):
+        self.filters = [f.strip() for f in filters if f and f.strip()]
+        self.routes = _Routes({}, TopicTrie())
+
+    @property
+    def wildcard_mode(self) -> bool:
+        return bool(self.filters)
+
+    def rebuild(self, topic_map: Dict[str, Dict[str, Any]]):
+        trie = TopicTrie()
+        for topic, info in topic_map.items():
+            if has_wildcard(topic):
+                trie.insert(topic, info)
+        # Một thuộc tính duy nhất: thread paho không thể thấy exact mới đi cùng trie cũ
+        # (topic_map là bản copy-on-write của bridge, không bị sửa sau khi gán)
+        self.routes = _Routes(topic_map, trie)
+
+    def resolve(self, topic: str) -> Optional[Dict[str, Any]]:
+        routes = self.routes  # Đọc một lần cho cả lần tra
+        info = routes.exact.get(topic)
+        if info is not None:
+            return info
+        if len(routes.trie):
+            matches = routes.trie.match(topic)
+            if matches:
+                return matches[0]
+        return None
+
+    def is_covered(self, topic: str) -> bool:
+        return any(filter_covers(f, topic) for f in self.filters)
+
+    def subscriptions_for(self, topics: Iterable[str]) -> set:
+        """Tập subscription cần có: các filter + những topic không nằm trong filter nào"""
+        if not self.wildcard_mode:
+            return set(topics)
+        return set(self.filters) | {t for t in topics if not self.is_covered(t)}
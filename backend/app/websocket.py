@@ -7,6 +7,8 @@ import asyncio
 import time
 from collections import defaultdict
 
+from .metrics import WS_SEND_SECONDS
+
 logger = logging.getLogger(__name__)
 
 class ConnectionManager:
@@ -24,6 +26,7 @@ class ConnectionManager:
         # ✅ Buffer để gộp message cùng loại
         self.message_buffer = defaultdict(dict)
         self.buffer_task = None
+        self._last_prune = time.time()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -63,6 +66,8 @@ class ConnectionManager:
                 return  # Bỏ qua nếu gửi quá nhanh
             
             self.last_broadcast_time[key] = current_time
+            if current_time - self._last_prune > 60:
+                self._prune_throttle(current_time)
             await self._send_to_all(message)
             return
         
@@ -76,6 +81,17 @@ class ConnectionManager:
             self.message_buffer[key] = message
             return
     
+    def _prune_throttle(self, now: float):
+        """
+        Xóa mốc throttle đã hết hạn: key quá `max(throttle_intervals)` giây tương đương key chưa có,
+        nên xóa không đổi hành vi mà giữ dict không phình theo số trạm đã từng tồn tại
+        """
+        max_interval = max(self.throttle_intervals.values())
+        stale = [k for k, t in self.last_broadcast_time.items() if now - t >= max_interval]
+        for key in stale:
+            del self.last_broadcast_time[key]
+        self._last_prune = now
+
     async def _flush_buffer_periodically(self):
         """
         ✅ Gửi buffer định kỳ mỗi 0.5s (thay vì realtime)
@@ -110,12 +126,15 @@ class ConnectionManager:
     async def _send_to_all(self, message: dict):
         """Gửi message tới tất cả client"""
         disconnected = []
+        started = time.perf_counter()
         for connection in self.active_connections:
             try:
                 await connection.send_json(message)
             except Exception as e:
                 logger.error(f"❌ WS send error: {e}")
                 disconnected.append(connection)
+        if self.active_connections:
+            WS_SEND_SECONDS.observe(time.perf_counter() - started, message.get('type', 'unknown'))
         
         # Xóa các connection lỗi
         for conn in disconnected:
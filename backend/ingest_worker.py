@@ -0,0 +1,88 @@
+# ==============================================================================
+# == backend/ingest_worker.py - Sharded ingest worker process                ==
+# ==============================================================================
+# Mỗi process sở hữu một tập trạm cố định (crc32(station_id) % shards == shard):
+#   python ingest_worker.py --shard 0 --shards 4
+# --relay-stdout (supervisor trong process API tự thêm): kết quả realtime được ghi thành các dòng JSON
+# lên stdout (pipe) để process API đẩy ra WebSocket. Log luôn đi ra stderr và mqtt_bridge.shard<N>.log.
+# Metrics (Prometheus) của worker được gửi qua cùng pipe mỗi SHARD_METRICS_INTERVAL giây và xuất ra
+# ở /metrics của process API với nhãn shard="N"; chạy tay không có --relay-stdout thì không xuất metrics.
+# Worker giải mã payload inline (bỏ qua DECODE_WORKERS): song song hóa đã nằm ở số shard, thêm process
+# pool trong từng shard chỉ làm số process vượt số lõi CPU.
+
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+from app.config import settings
+from app.database import pool_connections
+from app.logging_setup import setup_logging
+from app.metrics import metrics, register_ingest_gauges
+from app.sharding import RelayWriter
+from mqtt_bridge import MQTTBridge
+
+logger = logging.getLogger(__name__)
+
+
+async def relay_metrics(relay: RelayWriter, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        relay.publish_metrics(metrics.snapshot())
+
+
+async def run_worker(shard: int, shards: int, relay_stdout: bool):
+    relay = RelayWriter(sys.stdout.buffer) if relay_stdout else None
+    if relay:
+        relay.start()
+    bridge = MQTTBridge(shard_index=shard, shard_count=shards, relay=relay)
+    bridge.start()
+    register_ingest_gauges(
+        bridge.queue_depths,
+        bridge.dropped_counts,
+        lambda: [((), len(bridge.devices))],
+        pool_connections
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    metrics_task = loop.create_task(relay_metrics(relay, settings.SHARD_METRICS_INTERVAL)) if relay else None
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: không hỗ trợ signal handler trên event loop
+            pass
+
+    try:
+        await stop_event.wait()
+    finally:
+        if metrics_task:
+            metrics_task.cancel()
+        await bridge.stop()
+        if relay:
+            relay.stop()
+        logger.info(f"✅ Ingest worker {shard}/{shards} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Landslide sharded ingest worker")
+    parser.add_argument("--shard", type=int, required=True, help="Chỉ số shard (0..shards-1)")
+    parser.add_argument("--shards", type=int, required=True, help="Tổng số shard")
+    parser.add_argument("--relay-stdout", action="store_true", help="Ghi kết quả realtime lên stdout cho process API")
+    args = parser.parse_args()
+
+    if not 0 <= args.shard < args.shards:
+        parser.error("--shard must be in range [0, --shards)")
+
+    # Mỗi shard một file: N process cùng append + xoay vòng một file sẽ ghi đè/xen lẫn nhau
+    setup_logging(f"SHARD{args.shard}", f"mqtt_bridge.shard{args.shard}.log")
+    try:
+        asyncio.run(run_worker(args.shard, args.shards, args.relay_stdout))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -6,38 +6,64 @@ import asyncio
 import json
 import logging
 import time
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import paho.mqtt.client as mqtt
 from sqlalchemy import select
 from app.websocket import manager
-from app.database import ConfigSessionLocal, DataSessionLocal
+from app.database import ConfigSessionLocal, config_engine, data_engine
 from app.models import config as model_config
 from app.models import data as model_data
 from app.config import settings
 from app.landslide_analyzer import LandslideAnalyzer
+from app.ingest_queue import IngestQueue
+from app.bulk_writer import BulkWriter
+from app.heartbeat import HeartbeatTracker
+from app.config_events import config_events
+from app.topic_router import TopicRouter
+from app.sharding import shard_for
+from app.decode_stage import DecodeStage
+from app.checkpoint import StateCheckpointer
+from app.device_state import DeviceStateRegistry, deep_sizeof
+from app.clock import system_clock
+from app.capture import CaptureRecorder
+from app.device_time import resolve_timestamp
+from app.backlog import BacklogBuffer
+from app.thresholds import compile_station_thresholds
+from app.rollups import RollupAggregator
+from app.mqtt_transport import AsyncioMQTTTransport
+from app.metrics import ALERTS, PIPELINE_READINGS, PIPELINE_STAGE_SECONDS
+from app.modules.payload_decoder import EncodingSpec, resolve_encoding
 
 from processors.gnss_processor import GNSSVelocityProcessor
+from processors.nmea import parse_fixes
 from processors.water_processor import WaterEngine, RainEngine
 from processors.imu_processor import IMUEngine
 
-from .aes128decrypt import aes128_decrypt_base64
-
-# Cấu hình Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - BRIDGE - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('mqtt_bridge.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Logging được cấu hình bởi entrypoint (app/main.py, ingest_worker.py, replay.py)
 logger = logging.getLogger(__name__)
 
 class MQTTBridge:
-    def __init__(self):
+    def __init__(
+        self,
+        shard_index: Optional[int] = None,
+        shard_count: int = 0,
+        clock=None,
+        config_session_factory=ConfigSessionLocal,
+        relay=None
+    ):
         logger.info("🛠️ Initializing MQTT Bridge Instance...")
         
+        # Đồng hồ + session factory có thể thay thế để replay capture offline (replay.py)
+        self.clock = clock or system_clock
+        self.config_session_factory = config_session_factory
+        
+        # Sharded mode: chỉ xử lý các trạm có crc32(station_id) % shard_count == shard_index
+        self.shard_index = shard_index
+        self.shard_count = shard_count if shard_index is not None else 0
+        # Worker shard: kết quả realtime đi qua pipe về process API (app.sharding.RelayWriter)
+        self.relay = relay
+        
         self.analyzer = LandslideAnalyzer()
         
         # MQTT Client setup
@@ -49,19 +75,127 @@ class MQTTBridge:
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
         
+        # asyncio mode: transport thay các callback trên bằng bản chạy trên event loop
+        self.transport = None
+        if settings.MQTT_TRANSPORT == 'asyncio':
+            self.transport = AsyncioMQTTTransport(
+                self.client,
+                settings.MQTT_BROKER,
+                settings.MQTT_PORT,
+                on_connect=self.on_connect,
+                queue_size=settings.MQTT_RECEIVE_QUEUE,
+                batch_size=settings.MQTT_RECEIVE_BATCH,
+                manual_ack=settings.MQTT_QOS > 0
+            )
+        
         # Topic management
         self.topic_map: Dict[str, Dict[str, Any]] = {}
-        self.processors_cache: Dict[str, Any] = {}
-        self.last_save_time: Dict[str, float] = {}
+        self.topics_loaded = False
+        
+        # ✅ Router: tra topic → thiết bị (dict + trie), hỗ trợ wildcard subscription
+        # Worker shard subscribe đúng topic của trạm mình sở hữu (topic partitioning),
+        # wildcard filter sẽ kéo về bản tin của mọi shard nên bị tắt ở chế độ này
+        wildcard_filters = [] if self.is_shard else settings.MQTT_WILDCARD_FILTERS.split(',')
+        self.router = TopicRouter(wildcard_filters)
+        self.subscribed: set = set()
+        self.unrouted_messages = 0
+        
+        # ✅ Hàng đợi có giới hạn + worker pool (thay cho 1 coroutine/bản tin)
+        self.ingest = IngestQueue(
+            self.process_pipeline,
+            num_workers=settings.INGEST_WORKERS,
+            max_size=settings.INGEST_QUEUE_SIZE,
+            overflow_policy=settings.INGEST_OVERFLOW_POLICY
+        )
+        
+        # ✅ Giải mã trong process pool theo micro-batch, kết quả đưa vào ingest queue.
+        # Worker shard giải mã inline: bản thân các shard đã là N process song song, mỗi shard thêm một
+        # pool DECODE_WORKERS sẽ thành N x (1 + DECODE_WORKERS) process tranh nhau CPU
+        self.decoder = DecodeStage(
+            self._on_decoded,
+            workers=0 if self.shard_count else settings.DECODE_WORKERS,
+            batch_size=settings.DECODE_BATCH_SIZE,
+            batch_interval_ms=settings.DECODE_BATCH_INTERVAL_MS,
+            max_pending=settings.DECODE_MAX_PENDING
+        )
+        # ✅ Dữ liệu tồn đọng từ gateway store-and-forward → xử lý bù theo lô
+        self.backlog = BacklogBuffer(
+            self._process_backlog,
+            lag_threshold_s=settings.BACKLOG_LAG_THRESHOLD,
+            batch_size=settings.BACKLOG_BATCH_SIZE,
+            quiet_s=settings.BACKLOG_QUIET_SECONDS
+        )
+        
+        # Ghi lại bản tin thô (CAPTURE_PATH) để replay.py phát lại
+        capture_path = settings.CAPTURE_PATH
+        if capture_path and self.is_shard:
+            capture_path = f"{capture_path}.shard{self.shard_index}"
+        self.capture = CaptureRecorder(capture_path)
+        # Thời gian luồng mạng paho bị chiếm trong on_message
+        self.network_thread_stats = {'calls': 0, 'busy_seconds': 0.0, 'max_ms': 0.0}
+        
+        # ✅ Ghi SensorData/Alert theo lô thay vì commit từng bản ghi
+        self.writer = BulkWriter(
+            data_engine,
+            flush_interval_ms=settings.BULK_FLUSH_INTERVAL_MS,
+            max_batch_rows=settings.BULK_FLUSH_MAX_ROWS,
+            max_buffer_rows=settings.BULK_MAX_BUFFER_ROWS
+        )
+        
+        # ✅ Thống kê 1m/1h/1d cho mọi bản đo (raw chỉ lưu theo SAVE_INTERVAL_*)
+        self.rollups = RollupAggregator(
+            data_engine,
+            flush_interval_s=settings.ROLLUP_FLUSH_INTERVAL,
+            grace_s=settings.ROLLUP_GRACE_SECONDS,
+            clock=self.clock
+        ) if settings.ROLLUP_ENABLED else None
+        
+        # ✅ Gộp cập nhật last_data_time / last_update, flush định kỳ
+        self.heartbeat = HeartbeatTracker(config_engine, flush_interval_s=settings.HEARTBEAT_FLUSH_INTERVAL)
+        
+        # ✅ Snapshot trạng thái processor/analyzer để khởi động lại không mất lịch sử
+        checkpoint_path = settings.CHECKPOINT_PATH
+        if checkpoint_path and self.is_shard:
+            checkpoint_path = f"{checkpoint_path}.shard{self.shard_index}"
+        self.checkpoint = StateCheckpointer(
+            self,
+            checkpoint_path,
+            interval_s=settings.CHECKPOINT_INTERVAL,
+            max_age_s=settings.CHECKPOINT_MAX_AGE
+        )
+        
+        # ✅ State theo thiết bị (processor + mốc lưu DB) có giới hạn, dọn theo topic map
+        self.devices = DeviceStateRegistry(
+            self._create_processor,
+            max_devices=settings.DEVICE_STATE_MAX,
+            idle_ttl_s=settings.DEVICE_STATE_IDLE_TTL,
+            on_create=self.checkpoint.restore_device
+        )
         
         self.loop = None
+        self._consumer_task = None
+
+    @property
+    def is_shard(self) -> bool:
+        return self.shard_count > 0
+
+    def owns_station(self, station_id: int) -> bool:
+        return not self.is_shard or shard_for(station_id, self.shard_count) == self.shard_index
+
+    async def broadcast(self, message: Dict[str, Any]):
+        """Process API: gửi thẳng WebSocket. Worker shard: chuyển qua pipe relay về process API"""
+        if self.relay is not None:
+            self.relay.publish(message)
+        else:
+            await manager.broadcast(message)
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             logger.info("✅ MQTT Connected to Broker.")
-            for topic in self.topic_map.keys():
-                client.subscribe(topic)
-                logger.info(f"   ✓ Subscribed: {topic}")
+            # Subscribe lại theo lô: số packet không tăng theo số thiết bị ở wildcard mode
+            self.subscribed = self.router.subscriptions_for(self.topic_map.keys())
+            self._subscribe_many(self.subscribed)
+            logger.info(f"   ✓ Subscribed {len(self.subscribed)} topics/filters")
         else:
             logger.error(f"❌ MQTT Connection failed: rc={rc}")
 
@@ -87,23 +221,53 @@ class MQTTBridge:
             self.loop.call_later(10, self._retry_connect)
 
     def on_message(self, client, userdata, msg):
+        # Luồng paho: chỉ định tuyến + chuyển bytes thô sang event loop, decode/giải mã nằm ở DecodeStage
+        self._route_message(msg, self.decoder.submit_threadsafe)
+
+    async def _consume_messages(self):
+        """
+        asyncio transport: đọc bản tin theo lô ngay trên event loop.
+        Decode stage (hoặc ingest queue phía sau nó) đầy → chờ (backpressure lan tới transport
+        → ngừng đọc socket) thay vì bỏ bản tin;
+        chỉ ack các bản tin đã được nhận bàn giao.
+        """
+        async for batch in self.transport.batches():
+            accepted = []
+            for msg in batch:
+                if self.decoder.full():
+                    await self.decoder.wait_for_room()
+                if self._route_message(msg, self.decoder.submit):
+                    accepted.append(msg)
+            self.transport.ack(accepted)
+
+    def _route_message(self, msg, submit: Callable[[str, str, bytes, EncodingSpec], Optional[bool]]) -> bool:
+        """True nếu bản tin đã được xử lý xong phía nhận (bàn giao cho decode stage hoặc chủ động bỏ qua)"""
+        started = time.perf_counter()
         try:
             topic = msg.topic
-            try:
-                payload_str = msg.payload.decode('utf-8')
-                # sẽ thêm hàm giải mã AES ở đoạn này
-                decrypted_payload = str(aes128_decrypt_base64(bytearray(payload_str, 'utf-8')))
-                
-            except UnicodeDecodeError:
-                return # Bỏ qua dữ liệu nhị phân (RTCM)
-            
-            if self.loop and self.loop.is_running():
-                asyncio.run_coroutine_threadsafe(
-                    self.process_pipeline(topic, decrypted_payload), 
-                    self.loop
-                )
+            info = self.router.resolve(topic)
+            if info is None:
+                # Wildcard mode: bỏ qua sớm topic không thuộc thiết bị nào
+                self.unrouted_messages += 1
+                return True
+            self.capture.record(topic, msg.payload, time.time())
+            return submit(topic, info['type'], msg.payload, info['encoding']) is not False
         except Exception as e:
             logger.error(f"Error in on_message: {e}")
+            return True  # Lỗi không do quá tải: gửi lại cũng lỗi như cũ
+        finally:
+            elapsed = time.perf_counter() - started
+            stats = self.network_thread_stats
+            stats['calls'] += 1
+            stats['busy_seconds'] += elapsed
+            if elapsed * 1000 > stats['max_ms']:
+                stats['max_ms'] = elapsed * 1000
+
+    def _on_decoded(self, topic: str, record: Any):
+        if self.transport is not None and self.transport.manual_ack:
+            # Bản tin đã ack với broker: chờ chỗ trong ingest queue (dồn ngược về decode stage → transport)
+            return self.ingest.put(topic, (topic, record))
+        self.ingest.put_nowait(topic, (topic, record))
 
     def start(self):
         logger.info("🚀 Starting MQTT Bridge inside FastAPI...")
@@ -113,177 +277,461 @@ class MQTTBridge:
             logger.error("❌ No running event loop found!")
             return
 
+        self.checkpoint.load()
+        self.checkpoint.start(self.loop)
+        self.capture.start(self.loop)
+        self.decoder.start(self.loop)
+        self.ingest.start(self.loop)
+        self.backlog.start(self.loop)
+        self.writer.start(self.loop)
+        self.heartbeat.start(self.loop)
+        if self.rollups:
+            self.rollups.start(self.loop)
+
+        # ✅ Cập nhật topic map ngay khi admin thay đổi trạm/thiết bị
+        config_events.subscribe(self.on_config_event)
+        config_events.start_listener(self.loop)
+
         try:
-            self.client.connect(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
-            self.client.loop_start()
+            if self.transport:
+                self.transport.start(self.loop)
+                self._consumer_task = self.loop.create_task(self._consume_messages())
+            else:
+                self.client.connect(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
+                self.client.loop_start()
             self.loop.create_task(self.reload_topics_from_db())
             logger.info("✅ MQTT Bridge started successfully.")
         except Exception as e:
             logger.error(f"❌ Failed to start MQTT Bridge: {e}")
 
-    def stop(self):
+    async def stop(self):
         logger.info("🛑 Stopping MQTT Bridge...")
-        self.client.loop_stop()
-        self.client.disconnect()
+        if self.transport:
+            await self.transport.stop()
+            if self._consumer_task:
+                self._consumer_task.cancel()
+                await asyncio.gather(self._consumer_task, return_exceptions=True)
+        else:
+            self.client.loop_stop()
+            self.client.disconnect()
+        await config_events.stop_listener()
+        await self.decoder.stop()
+        await self.ingest.stop()
+        await self.backlog.stop()
+        await self.checkpoint.stop()
+        await self.writer.stop()
+        await self.heartbeat.stop()
+        if self.rollups:
+            await self.rollups.stop()
+        await self.capture.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "shard": f"{self.shard_index}/{self.shard_count}" if self.is_shard else None,
+            "topics": len(self.topic_map),
+            "subscriptions": len(self.subscribed),
+            "wildcard_mode": self.router.wildcard_mode,
+            "unrouted_messages": self.unrouted_messages,
+            "transport": self.transport.get_stats() if self.transport else "threaded",
+            "network_thread": {
+                **self.network_thread_stats,
+                "avg_us": round(self.network_thread_stats['busy_seconds'] / max(1, self.network_thread_stats['calls']) * 1e6, 2)
+            },
+            "decode": self.decoder.get_stats(),
+            "ingest": self.ingest.get_stats(),
+            "backlog": self.backlog.get_stats(),
+            "writer": self.writer.get_stats(),
+            "heartbeat": self.heartbeat.get_stats(),
+            "rollups": self.rollups.get_stats() if self.rollups else None,
+            "checkpoint": self.checkpoint.get_stats(),
+            "device_state": self.devices.get_stats(),
+            "capture": self.capture.get_stats() if self.capture.enabled else None
+        }
+
+    def queue_depths(self) -> List[Tuple[Tuple[str], int]]:
+        """Độ sâu các hàng đợi/buffer của pipeline, cho gauge landslide_queue_depth"""
+        depths = [
+            (("decode_pending",), len(self.decoder.pending)),
+            (("decode_inflight",), self.decoder.inflight_items),
+            (("ingest",), self.ingest.depth()),
+            (("backlog",), sum(len(items) for items in self.backlog.pending.values())
+                + sum(len(items) for items in self.backlog.held.values())),
+            (("bulk_writer",), self.writer.pending()),
+            (("heartbeat",), len(self.heartbeat.dirty_devices) + len(self.heartbeat.dirty_stations)),
+        ]
+        if self.transport and self.transport.queue:
+            depths.append((("mqtt_receive",), self.transport.queue.qsize()))
+        if self.rollups:
+            depths.append((("rollups",), len(self.rollups.closed)))
+        if self.relay is not None:
+            depths.append((("shard_relay",), self.relay.queue.qsize()))
+        return depths
+
+    def dropped_counts(self) -> List[Tuple[Tuple[str], int]]:
+        """Số bản tin/dòng bị bỏ theo hàng đợi, cho counter landslide_dropped_total"""
+        dropped = [
+            (("decode",), self.decoder.stats['dropped']),
+            (("ingest",), self.ingest.stats['dropped']),
+            (("bulk_writer",), self.writer.stats['rows_dropped']),
+            (("unrouted",), self.unrouted_messages),
+        ]
+        if self.transport:
+            dropped.append((("mqtt_receive",), self.transport.stats['dropped']))
+        if self.relay is not None:
+            dropped.append((("shard_relay",), self.relay.stats['dropped']))
+        return dropped
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Bộ nhớ ước tính theo từng loại state (duyệt toàn bộ state, không gọi trong hot path)"""
+        report: Dict[str, Any] = {"processors": self.devices.memory_report()}
+        report["alert_counters"] = {
+            "count": len(self.analyzer.alert_counters),
+            "bytes": deep_sizeof(self.analyzer.get_state())
+        }
+        report["topic_map"] = {"count": len(self.topic_map), "bytes": deep_sizeof(self.topic_map)}
+        if not self.is_shard:
+            report["ws_throttle"] = {
+                "count": len(manager.last_broadcast_time),
+                "bytes": deep_sizeof(dict(manager.last_broadcast_time))
+            }
+        report["total_bytes"] = sum(
+            bucket["bytes"] for bucket in report["processors"].values()
+        ) + sum(v["bytes"] for k, v in report.items() if k != "processors")
+        return report
 
     async def reload_topics_from_db(self):
-        logger.info("🔄 Started Topic Auto-Reload Task")
+        """
+        Full reload định kỳ. Khi bật config events, thay đổi được áp dụng ngay qua
+        on_config_event → vòng lặp này chỉ còn là lưới an toàn (chu kỳ dài).
+        """
+        interval = settings.TOPIC_SAFETY_RELOAD_INTERVAL if settings.CONFIG_EVENTS_ENABLED else settings.TOPIC_RELOAD_INTERVAL
+        logger.info(f"🔄 Started Topic Auto-Reload Task (every {interval}s)")
         while True:
+            await self.reload_all_topics()
+            await asyncio.sleep(interval)
+
+    async def reload_all_topics(self):
+        try:
+            devices_with_stations = await self._query_devices()
+            self.topics_loaded = True
+            self._apply_topic_changes(devices_with_stations, lambda info: True)
+            self.checkpoint.prune_pending(info['device_id'] for info in self.topic_map.values())
+            evicted = self.devices.evict_idle()
+            if evicted:
+                logger.info(f"🧹 Evicted state of {evicted} idle devices")
+        except Exception as e:
+            logger.error(f"Error reloading topics: {e}")
+
+    async def _query_devices(self, *conditions):
+        from app.models.config import Device, Station
+
+        if self.config_session_factory is None:
+            raise RuntimeError("no config database (config_session_factory=None)")
+        async with self.config_session_factory() as db:
+            result = await db.execute(
+                select(Device, Station)
+                .join(Station, Device.station_id == Station.id)
+                .where(Device.is_active == True, *conditions)
+            )
+            return result.all()
+
+    def _create_processor(self, device_id: int, sensor_type: str):
+        """Factory của DeviceStateRegistry: processor được tạo khi thiết bị gửi bản tin đầu tiên"""
+        if sensor_type == 'gnss':
+            return GNSSVelocityProcessor(
+                device_id, self.config_session_factory,
+                required_points=settings.GNSS_ORIGIN_POINTS,
+                max_spread_m=settings.GNSS_ORIGIN_MAX_SPREAD,
+                filter_window_size=settings.GNSS_FILTER_WINDOW,
+                drift_threshold_m=settings.GNSS_DRIFT_THRESHOLD,
+                drift_confirm=settings.GNSS_DRIFT_CONFIRM,
+                clock=self.clock
+            )
+        elif sensor_type == 'rain':
+            return RainEngine()
+        elif sensor_type == 'water':
+            return WaterEngine()
+        elif sensor_type == 'imu':
+            return IMUEngine()
+        return None
+
+    def _build_topic_entry(self, device, station, thresholds, encoding: EncodingSpec) -> Dict[str, Any]:
+        return {
+            "device_id": device.id,
+            "device_name": device.name,
+            "station_id": station.id,
+            "station_name": station.name,
+            "type": device.device_type,
+            "config": station.config or {},
+            # Ngưỡng biên dịch sẵn, dùng chung giữa các thiết bị của trạm
+            "thresholds": thresholds,
+            # Kiểu mã hóa payload (plaintext / custom_aes / aes_cbc), resolve một lần ở đây
+            "encoding": encoding
+        }
+
+    def _apply_topic_changes(self, devices_with_stations, in_scope: Callable[[Dict[str, Any]], bool]):
+        """
+        Thay toàn bộ các topic thuộc phạm vi `in_scope` bằng kết quả query mới,
+        subscribe/unsubscribe phần chênh lệch. Topic ngoài phạm vi giữ nguyên.
+        """
+        scoped_entries = {}
+        compiled = {}
+        for device, station in devices_with_stations:
+            if not device.mqtt_topic or device.mqtt_topic.strip() == "": continue
+            if not self.owns_station(station.id): continue
             try:
-                from app.models.config import Device, Station
-                from sqlalchemy import select
-                
-                async with ConfigSessionLocal() as db:
-                    result = await db.execute(
-                        select(Device, Station)
-                        .join(Station, Device.station_id == Station.id)
-                        .where(Device.is_active == True)
-                    )
-                    devices_with_stations = result.all()
-                
-                new_map = {}
-                for device, station in devices_with_stations:
-                    if not device.mqtt_topic or device.mqtt_topic.strip() == "": continue
-                    
-                    topic = device.mqtt_topic
-                    sensor_type = device.device_type
-                    proc_key = f"device_{device.id}"
-                    
-                    if proc_key not in self.processors_cache:
-                        if device.device_type == 'gnss':
-                            self.processors_cache[proc_key] = GNSSVelocityProcessor(device.id, ConfigSessionLocal)
-                        elif sensor_type == 'rain':
-                            self.processors_cache[proc_key] = RainEngine()
-                        elif sensor_type == 'water':
-                            self.processors_cache[proc_key] = WaterEngine()
-                        elif sensor_type == 'imu':
-                            self.processors_cache[proc_key] = IMUEngine()
-                    
-                    new_map[topic] = {
-                        "device_id": device.id,
-                        "device_name": device.name,
-                        "station_id": station.id,
-                        "station_name": station.name,
-                        "type": device.device_type,
-                        "processor": self.processors_cache[proc_key],
-                        "config": station.config or {}
-                    }
-
-                # Diff subscribe/unsubscribe
-                current_topics = set(self.topic_map.keys())
-                new_topics = set(new_map.keys())
-                for t in new_topics - current_topics: self.client.subscribe(t)
-                for t in current_topics - new_topics: self.client.unsubscribe(t)
-                self.topic_map = new_map
+                encoding = resolve_encoding(device.config)
+            except ValueError as e:
+                logger.error(f"❌ [{station.name}] Device {device.device_code}: invalid encoding config ({e}), not subscribed")
+                continue
+            if station.id not in compiled:
+                compiled[station.id] = compile_station_thresholds(station.config or {})
+            scoped_entries[device.mqtt_topic] = self._build_topic_entry(device, station, compiled[station.id], encoding)
 
-            except Exception as e:
-                logger.error(f"Error reloading topics: {e}")
-            await asyncio.sleep(settings.TOPIC_RELOAD_INTERVAL)
+        # Copy-on-write: worker đang đọc topic_map cũ không bị ảnh hưởng
+        new_map = {t: info for t, info in self.topic_map.items() if not in_scope(info)}
+        new_map.update(scoped_entries)
+
+        current_topics = set(self.topic_map.keys())
+        new_topics = set(new_map.keys())
+
+        wanted = self.router.subscriptions_for(new_topics)
+        self._subscribe_many(wanted - self.subscribed)
+        self._unsubscribe_many(self.subscribed - wanted)
+        self.subscribed = wanted
+
+        self.router.rebuild(new_map)
+        self.topic_map = new_map
+
+        added, removed = len(new_topics - current_topics), len(current_topics - new_topics)
+        if added or removed:
+            logger.info(f"🔄 Topic map updated: +{added} / -{removed} (total {len(new_map)})")
+
+        # Dọn state của thiết bị/trạm đã bị xóa hoặc tắt. Chờ lần full reload đầu tiên,
+        # tránh xóa nhầm state vừa khôi phục từ checkpoint khi topic map còn rỗng
+        if self.topics_loaded:
+            evicted = self.devices.retain(info['device_id'] for info in new_map.values())
+            stale_stations = self.analyzer.retain_stations(info['station_id'] for info in new_map.values())
+            if evicted or stale_stations:
+                logger.info(f"🧹 Evicted state of {evicted} devices / {stale_stations} stations")
 
-    async def process_pipeline(self, topic: str, raw_payload: str):
-        info = self.topic_map.get(topic)
+    def _subscribe_many(self, topics):
+        topics = sorted(topics)
+        batch = max(1, settings.MQTT_SUBSCRIBE_BATCH)
+        for i in range(0, len(topics), batch):
+            self.client.subscribe([(t, settings.MQTT_QOS) for t in topics[i:i + batch]])
+
+    def _unsubscribe_many(self, topics):
+        topics = sorted(topics)
+        batch = max(1, settings.MQTT_SUBSCRIBE_BATCH)
+        for i in range(0, len(topics), batch):
+            self.client.unsubscribe(topics[i:i + batch])
+
+    async def on_config_event(self, event: Dict[str, Any]):
+        """Áp dụng thay đổi tăng dần cho đúng các thiết bị bị ảnh hưởng"""
+        from app.models.config import Device
+
+        entity, op, entity_id = event.get('entity'), event.get('op'), event.get('id')
+        try:
+            if entity == 'device' and op == 'relock':
+                # Chỉ shard đang giữ processor của thiết bị xử lý, các shard khác bỏ qua
+                state = self.devices.entries.get(entity_id)
+                processor = state.processor if state else None
+                if hasattr(processor, 'request_relock'):
+                    result = processor.request_relock()
+                    logger.info(f"🔄 Device {entity_id}: relock requested → {result.get('status')}")
+            elif entity == 'station':
+                in_scope = lambda info: info['station_id'] == entity_id
+                rows = [] if op == 'delete' else await self._query_devices(Device.station_id == entity_id)
+                self._apply_topic_changes(rows, in_scope)
+            elif entity == 'device':
+                in_scope = lambda info: info['device_id'] == entity_id
+                rows = [] if op == 'delete' else await self._query_devices(Device.id == entity_id)
+                self._apply_topic_changes(rows, in_scope)
+            else:
+                # Project hoặc sự kiện không rõ → reload toàn bộ
+                await self.reload_all_topics()
+        except Exception as e:
+            logger.error(f"Error applying config event {event}: {e}")
+
+    async def process_pipeline(self, topic: str, raw_payload: Any):
+        """
+        raw_payload: list GNSSFix / chuỗi NMEA (gnss) hoặc dict/chuỗi JSON (rain/water/imu).
+        Payload gnss nhiều epoch được xử lý lần lượt từng epoch.
+        """
+        info = self.router.resolve(topic)
         if not info: return
-            
+        
+        sensor_type = info['type']
+        if sensor_type == 'gnss':
+            fixes = raw_payload
+            if isinstance(raw_payload, str):
+                started = time.perf_counter()
+                fixes = parse_fixes(raw_payload)
+                PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - started, 'parse', sensor_type)
+            elif not isinstance(raw_payload, list):
+                fixes = [raw_payload]
+            if not fixes:
+                PIPELINE_READINGS.inc(sensor_type, 'invalid')
+                return
+            for fix in fixes:
+                await self._ingest_reading(topic, info, fix)
+            return
+        
+        if not isinstance(raw_payload, dict):
+            started = time.perf_counter()
+            try:
+                raw_payload = json.loads(raw_payload)
+            except (TypeError, json.JSONDecodeError):
+                PIPELINE_READINGS.inc(sensor_type, 'invalid')
+                return
+            PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - started, 'parse', sensor_type)
+        await self._ingest_reading(topic, info, raw_payload)
+
+    async def _ingest_reading(self, topic: str, info: Dict[str, Any], raw_payload: Any):
+        """Một bản đo đã parse (GNSSFix / dict JSON): timestamp → backlog hoặc xử lý + broadcast"""
+        sensor_type = info['type']
+        
+        # ✅ Timestamp thiết bị (GGA UTC + ngày RMC / trường `ts`), quay về giờ nhận nếu không có
+        arrival = self.clock.time()
+        timestamp = resolve_timestamp(
+            sensor_type, raw_payload, arrival,
+            max_future_s=settings.DEVICE_CLOCK_MAX_SKEW,
+            max_age_s=settings.DEVICE_TIMESTAMP_MAX_AGE
+        )
+        
+        # ✅ Dữ liệu tồn đọng (gateway gửi dồn): gom lại xử lý bù theo lô
+        lag = arrival - timestamp
+        if self.backlog.is_backlog(topic, timestamp, arrival):
+            PIPELINE_READINGS.inc(sensor_type, 'backlog')
+            if self.backlog.add(topic, timestamp, raw_payload, lag):
+                await self.backlog.flush(topic)
+            return
+        if self.backlog.in_burst(topic):
+            # Realtime xen giữa đợt gửi dồn: giữ lại, xử lý theo thứ tự thời gian khi đợt kết thúc
+            self.backlog.hold(topic, timestamp, raw_payload)
+            return
+        
+        device_state = self.devices.get(info['device_id'], info['station_id'], sensor_type)
+        if device_state is None: return
+        
+        result = self._process_reading(info, device_state, raw_payload, timestamp)
+        if result is None: return
+        processed_data, alert = result
+        started = time.perf_counter()
+        await self._broadcast_reading(info, int(timestamp), processed_data, alert)
+        PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - started, 'broadcast', sensor_type)
+
+    async def _process_backlog(self, topic: str, items: List[Tuple[float, Any]]):
+        """Xử lý bù một lô dữ liệu tồn theo thứ tự thời gian, chỉ broadcast trạng thái cuối"""
+        info = self.router.resolve(topic)
+        if not info: return
+        device_state = self.devices.get(info['device_id'], info['station_id'], info['type'])
+        if device_state is None: return
+        
+        # Xử lý đồng bộ cả lô (không await) → bản tin realtime không chen vào giữa
+        last = None
+        alerts = 0
+        for timestamp, payload in items:
+            result = self._process_reading(info, device_state, payload, timestamp)
+            if result is None: continue
+            last = (int(timestamp), *result)
+            if self._is_dangerous(result[1]):
+                alerts += 1
+        
+        logger.info(
+            f"⏪ [{info['station_name']}] Backlog caught up: {len(items)} {info['type']} readings "
+            f"({items[0][0]:.0f} → {items[-1][0]:.0f}), {alerts} alerts"
+        )
+        if last:
+            await self._broadcast_reading(info, *last)
+
+    @staticmethod
+    def _is_dangerous(alert: Optional[Dict[str, Any]]) -> bool:
+        return bool(alert and alert.get('level') in ['WARNING', 'CRITICAL'])
+
+    def _process_reading(self, info: Dict[str, Any], device_state, payload: Any, timestamp: float):
+        """Xử lý + phân tích + lưu (throttled) một bản đo. Trả về (processed_data, alert) hoặc None"""
         device_id = info['device_id']
         station_id = info['station_id']
         station_name = info['station_name']
         sensor_type = info['type']
-        processor = info['processor']
-        station_config = info['config']
+        thresholds = info['thresholds']
+        processor = device_state.processor
         
-        current_timestamp = int(time.time())
+        if timestamp < device_state.last_ts:
+            # Cũ hơn bản đo processor đã nhận (VD backlog tới sau dữ liệu realtime): processor giữ lịch sử
+            # theo thời gian (vận tốc GNSS, cường độ mưa) nên không nhận bản đo ngược chiều
+            PIPELINE_READINGS.inc(sensor_type, 'late')
+            return None
+        device_state.last_ts = timestamp
+
+        current_timestamp = int(timestamp)
         processed_data = None
+        clock = time.perf_counter
+        started = clock()
         
         # 1. PROCESS DATA
         try:
             if sensor_type == 'gnss':
-                res = processor.process_gngga(raw_payload)
+                res = processor.process_gngga(payload, ts=timestamp)
                 if res and res.get('type') == 'gnss_processed':
                     processed_data = res.get('data')
                 elif res and res.get('type') == 'origin_locked':
                     logger.info(f"🎯 [{station_name}] GNSS Origin locked")
-                    return
-            else:
-                try:
-                    payload_json = json.loads(raw_payload)
-                    if sensor_type == 'rain': processed_data = processor.process(payload_json, current_timestamp)
-                    elif sensor_type == 'water': processed_data = processor.process(payload_json, current_timestamp)
-                    elif sensor_type == 'imu': processed_data = processor.process(payload_json)
-                except json.JSONDecodeError:
-                    return
+                    PIPELINE_READINGS.inc(sensor_type, 'skipped')
+                    return None
+            elif sensor_type == 'rain': processed_data = processor.process(payload, current_timestamp)
+            elif sensor_type == 'water': processed_data = processor.process(payload, current_timestamp)
+            elif sensor_type == 'imu': processed_data = processor.process(payload)
         except Exception as e:
             logger.error(f"Processing error ({sensor_type}): {e}")
-            return
+            PIPELINE_READINGS.inc(sensor_type, 'error')
+            return None
 
-        if not processed_data: return
+        processed = clock()
+        PIPELINE_STAGE_SECONDS.observe(processed - started, 'process', sensor_type)
+        if not processed_data:
+            PIPELINE_READINGS.inc(sensor_type, 'skipped')
+            return None
+        PIPELINE_READINGS.inc(sensor_type, 'processed')
 
-        # ---------------------------------------------------------
-        # ✅ REALTIME BROADCAST 1: SENSOR DATA (Số liệu)
-        # Gửi ngay lập tức, không chờ DB
-        # ---------------------------------------------------------
-        try:
-            await manager.broadcast({
-                "type": "sensor_data",
-                "station_id": station_id,
-                "sensor_type": sensor_type,
-                "timestamp": current_timestamp,
-                "data": processed_data
-            })
-        except Exception as e:
-            logger.error(f"❌ WS Sensor Error: {e}")
+        # Heartbeat thiết bị/trạm: chỉ đánh dấu trong bộ nhớ, flush theo chu kỳ
+        self.heartbeat.touch(device_id, station_id, current_timestamp)
+        if self.rollups:
+            self.rollups.add(station_id, device_id, sensor_type, timestamp, processed_data)
 
         # 2. ANALYZE
         alert = None
+        analyze_started = clock()
         data_wrapper = [{"timestamp": current_timestamp, "data": processed_data}]
         
         try:
             if sensor_type == 'gnss':
-                alert = self.analyzer.analyze_gnss_displacement(station_id, data_wrapper, station_config)
+                alert = self.analyzer.analyze_gnss_displacement(station_id, data_wrapper, thresholds)
             elif sensor_type == 'rain':
-                alert = self.analyzer.analyze_rainfall(station_id, data_wrapper, [], station_config)
+                alert = self.analyzer.analyze_rainfall(station_id, data_wrapper, [], thresholds)
             elif sensor_type == 'water':
-                alert = self.analyzer.analyze_water_level(station_id, data_wrapper, station_config)
+                alert = self.analyzer.analyze_water_level(station_id, data_wrapper, thresholds)
             elif sensor_type == 'imu':
-                alert = self.analyzer.analyze_tilt(station_id, data_wrapper, station_config)
+                alert = self.analyzer.analyze_tilt(station_id, data_wrapper, thresholds)
         except Exception as e:
             logger.error(f"Analyzer error: {e}")
 
-        # ---------------------------------------------------------
-        # ✅ REALTIME BROADCAST 2: STATION STATUS (Màu sắc)
-        # Gửi ngay lập tức sau khi phân tích xong
-        # ---------------------------------------------------------
-        is_dangerous = False
-        if alert and alert.get('level') in ['WARNING', 'CRITICAL']:
-            is_dangerous = True
-            try:
-                await manager.broadcast({
-                    "type": "station_status",
-                    "station_id": station_id,
-                    "risk_level": alert['level']
-                })
-                logger.warning(f"🚨 [{station_name}] Alert sent: {alert['message']}")
-            except Exception as e:
-                logger.error(f"❌ WS Alert Error: {e}")
-        else:
-            # Nếu AN TOÀN -> Gửi LOW để UI chuyển về màu xanh ngay lập tức
-            try:
-                await manager.broadcast({
-                    "type": "station_status",
-                    "station_id": station_id,
-                    "risk_level": "LOW"
-                })
-            except Exception as e:
-                logger.error(f"❌ WS Low Status Error: {e}")
+        analyzed = clock()
+        PIPELINE_STAGE_SECONDS.observe(analyzed - analyze_started, 'analyze', sensor_type)
+        if alert:
+            ALERTS.inc(sensor_type, alert.get('level', 'UNKNOWN'))
 
         # 3. SAVE TO DB (THROTTLED)
-        # Chỉ lưu khi nguy hiểm HOẶC đến chu kỳ lưu
+        # Chỉ lưu khi nguy hiểm HOẶC đến chu kỳ lưu (tính theo giờ thiết bị)
+        is_dangerous = self._is_dangerous(alert)
         save_data_now = False
 
         if is_dangerous:
             save_data_now = True
         else:
-            throttle_key = f"{device_id}_{sensor_type}"
-            last_saved = self.last_save_time.get(throttle_key, 0)
+            last_saved = device_state.last_save_time
             
             interval = settings.SAVE_INTERVAL_DEFAULT
             if sensor_type == 'gnss': interval = settings.SAVE_INTERVAL_GNSS
@@ -296,40 +744,72 @@ class MQTTBridge:
 
         try:
             if save_data_now:
-                 async with ConfigSessionLocal() as db_config:
-                    from app.models.config import Device, Station
-                    await db_config.execute(
-                        Device.__table__.update().where(Device.id == device_id).values(last_data_time=current_timestamp)
-                    )
-                    await db_config.execute(
-                        Station.__table__.update().where(Station.id == station_id).values(last_update=current_timestamp, status="online")
-                    )
-                    await db_config.commit()
+                # Lưu dữ liệu cảm biến (đưa vào bulk writer, ghi theo lô)
+                self.writer.add_sensor_data(
+                    station_id=station_id,
+                    timestamp=current_timestamp,
+                    sensor_type=sensor_type,
+                    data=processed_data,
+                    value_1=processed_data.get('speed_2d_mm_s') if sensor_type == 'gnss' else processed_data.get('water_level'),
+                    value_2=processed_data.get('total_displacement_mm') if sensor_type == 'gnss' else processed_data.get('intensity_mm_h'),
+                )
+                device_state.last_save_time = current_timestamp
 
-            if save_data_now:
-                async with DataSessionLocal() as db_data:
-                    # Lưu dữ liệu cảm biến
-                    db_data.add(model_data.SensorData(
-                        station_id=station_id,  
+                # Chỉ lưu cảnh báo nếu nguy hiểm
+                if is_dangerous:
+                    self.writer.add_alert(
+                        station_id=station_id,
                         timestamp=current_timestamp,
-                        sensor_type=sensor_type,
-                        data=processed_data,
-                        value_1=processed_data.get('speed_2d_mm_s') if sensor_type == 'gnss' else processed_data.get('water_level'),
-                        value_2=processed_data.get('total_displacement_mm') if sensor_type == 'gnss' else processed_data.get('intensity_mm_h'),
-                    ))
-                    self.last_save_time[f"{device_id}_{sensor_type}"] = current_timestamp
-
-                    # Chỉ lưu cảnh báo nếu nguy hiểm
-                    if is_dangerous:
-                        db_data.add(model_data.Alert(
-                            station_id=station_id,
-                            timestamp=current_timestamp,
-                            level=alert['level'],
-                            category=alert['category'],
-                            message=alert['message'],
-                            is_resolved=False
-                        ))
-                    await db_data.commit()
+                        level=alert['level'],
+                        category=alert['category'],
+                        message=alert['message'],
+                        is_resolved=False
+                    )
+
+        except Exception as e:
+            logger.error(f"❌ DB Error: {e}")
 
+        PIPELINE_STAGE_SECONDS.observe(clock() - analyzed, 'save', sensor_type)
+        return processed_data, alert
+
+    async def _broadcast_reading(self, info: Dict[str, Any], timestamp: int, processed_data: Dict[str, Any], alert):
+        station_id = info['station_id']
+
+        # ---------------------------------------------------------
+        # ✅ REALTIME BROADCAST 1: SENSOR DATA (Số liệu)
+        # Không chờ DB (bulk writer ghi nền)
+        # ---------------------------------------------------------
+        try:
+            await self.broadcast({
+                "type": "sensor_data",
+                "station_id": station_id,
+                "sensor_type": info['type'],
+                "timestamp": timestamp,
+                "data": processed_data
+            })
         except Exception as e:
-            logger.error(f"❌ DB Error: {e}")
\ No newline at end of file
+            logger.error(f"❌ WS Sensor Error: {e}")
+
+        # ---------------------------------------------------------
+        # ✅ REALTIME BROADCAST 2: STATION STATUS (Màu sắc)
+        # ---------------------------------------------------------
+        if self._is_dangerous(alert):
+            try:
+                await self.broadcast({
+                    "type": "station_status",
+                    "station_id": station_id,
+                    "risk_level": alert['level']
+                })
+                logger.warning(f"🚨 [{info['station_name']}] Alert sent: {alert['message']}")
+            except Exception as e:
+                logger.error(f"❌ WS Alert Error: {e}")
+        else:
+            # Nếu AN TOÀN -> Gửi LOW để UI chuyển về màu xanh ngay lập tức
+            try:
+                await self.broadcast({
+                    "type": "station_status",
+                    "station_id": station_id,
+                    "risk_level": "LOW"
+                })
+            except Exception as e:
+                logger.error(f"❌ WS Low Status Error: {e}")
@@ -0,0 +1,132 @@
+# backend/processors/geodesy.py - Chuyển đổi WGS84 ↔ ECEF ↔ ENU dạng vector (NumPy broadcasting)
+# Mọi hàm nhận scalar hoặc mảng, trả về mảng cùng shape (+ trục cuối 3 cho tọa độ).
+# Phép quay viết bằng phép nhân/cộng từng phần tử (không dùng matmul/BLAS) nên kết quả
+# của một điểm và của cùng điểm đó trong một lô lớn giống hệt nhau đến từng bit.
+from typing import Tuple
+
+import numpy as np
+
+A_WGS84 = 6378137.0
+F_WGS84 = 1 / 298.257223563
+E2_WGS84 = 2 * F_WGS84 - F_WGS84**2
+B_WGS84 = A_WGS84 * (1 - F_WGS84)
+EP2_WGS84 = (A_WGS84**2 - B_WGS84**2) / B_WGS84**2
+
+
+def _f64(value):
+    # Mảng → mảng float64; scalar → np.float64 scalar (phép tính scalar nhanh hơn mảng 0 chiều nhiều lần)
+    return np.asarray(value, dtype=np.float64)[()]
+
+
+def _xyz(values):
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        # Một điểm: float Python, cùng phép nhân/cộng IEEE như nhánh mảng nhưng không tốn overhead ufunc
+        return values.tolist()
+    return values[..., 0], values[..., 1], values[..., 2]
+
+
+def _stack3(a, b, c) -> np.ndarray:
+    # Một điểm (scalar): np.array nhanh hơn np.stack nhiều lần, giá trị không đổi
+    if not (isinstance(a, np.ndarray) or isinstance(b, np.ndarray) or isinstance(c, np.ndarray)):
+        return np.array((a, b, c), dtype=np.float64)
+    return np.stack(np.broadcast_arrays(a, b, c), axis=-1)
+
+
+def geodetic_to_ecef(lat, lon, h) -> np.ndarray:
+    """lat/lon (độ), h (m) → ECEF (m), shape (..., 3)"""
+    lat_rad = np.radians(_f64(lat))
+    lon_rad = np.radians(_f64(lon))
+    h = _f64(h)
+    sin_lat = np.sin(lat_rad)
+    cos_lat = np.cos(lat_rad)
+
+    n = A_WGS84 / np.sqrt(1 - E2_WGS84 * sin_lat**2)
+    x = (n + h) * cos_lat * np.cos(lon_rad)
+    y = (n + h) * cos_lat * np.sin(lon_rad)
+    z = (n * (1 - E2_WGS84) + h) * sin_lat
+    return _stack3(x, y, z)
+
+
+def ecef_to_geodetic(ecef) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ECEF (..., 3) → (lat, lon, h), lời giải đóng của Heikkinen (không lặp, sai số < 1 mm)"""
+    x, y, z = _xyz(ecef)
+    a2, b2 = A_WGS84**2, B_WGS84**2
+
+    p = np.hypot(x, y)
+    f = 54 * b2 * z**2
+    g = p**2 + (1 - E2_WGS84) * z**2 - E2_WGS84 * (a2 - b2)
+    c = E2_WGS84**2 * f * p**2 / g**3
+    s = np.cbrt(1 + c + np.sqrt(c**2 + 2 * c))
+    k = s + 1 + 1 / s
+    pp = f / (3 * k**2 * g**2)
+    q = np.sqrt(1 + 2 * E2_WGS84**2 * pp)
+    r0 = (-pp * E2_WGS84 * p / (1 + q)
+          + np.sqrt(a2 / 2 * (1 + 1 / q) - pp * (1 - E2_WGS84) * z**2 / (q * (1 + q)) - pp * p**2 / 2))
+    u = np.hypot(p - E2_WGS84 * r0, z)
+    v = np.sqrt((p - E2_WGS84 * r0)**2 + (1 - E2_WGS84) * z**2)
+    z0 = b2 * z / (A_WGS84 * v)
+
+    h = u * (1 - b2 / (A_WGS84 * v))
+    lat = np.degrees(np.arctan2(z + EP2_WGS84 * z0, p))
+    lon = np.degrees(np.arctan2(y, x))
+    return lat, lon, h
+
+
+def enu_rotation(lat0, lon0) -> np.ndarray:
+    """Ma trận quay ECEF → ENU tại gốc (lat0, lon0), shape (..., 3, 3)"""
+    lat0_rad = np.radians(_f64(lat0))
+    lon0_rad = np.radians(_f64(lon0))
+    sl0, cl0 = np.sin(lon0_rad), np.cos(lon0_rad)
+    sf0, cf0 = np.sin(lat0_rad), np.cos(lat0_rad)
+    zero = np.zeros_like(sl0)
+    return np.stack([
+        np.stack([-sl0, cl0, zero], axis=-1),
+        np.stack([-sf0 * cl0, -sf0 * sl0, cf0], axis=-1),
+        np.stack([cf0 * cl0, cf0 * sl0, sf0], axis=-1)
+    ], axis=-2)
+
+
+def rotate(rotation, vectors) -> np.ndarray:
+    """rotation (..., 3, 3) @ vectors (..., 3), từng phần tử → kết quả không phụ thuộc kích thước lô"""
+    r = np.asarray(rotation, dtype=np.float64)
+    r0, r1, r2 = _xyz(r[..., 0, :]), _xyz(r[..., 1, :]), _xyz(r[..., 2, :])
+    vx, vy, vz = _xyz(vectors)
+    return _stack3(
+        r0[0] * vx + r0[1] * vy + r0[2] * vz,
+        r1[0] * vx + r1[1] * vy + r1[2] * vz,
+        r2[0] * vx + r2[1] * vy + r2[2] * vz
+    )
+
+
+def rotate_inverse(rotation, vectors) -> np.ndarray:
+    """rotation.T @ vectors (ma trận quay trực giao: nghịch đảo = chuyển vị)"""
+    return rotate(np.swapaxes(np.asarray(rotation, dtype=np.float64), -1, -2), vectors)
+
+
+def ecef_to_enu(ecef, origin_ecef, rotation) -> np.ndarray:
+    """Tọa độ ECEF (..., 3) → ENU (m) so với gốc"""
+    return rotate(rotation, np.asarray(ecef, dtype=np.float64) - np.asarray(origin_ecef, dtype=np.float64))
+
+
+def enu_to_ecef(enu, origin_ecef, rotation) -> np.ndarray:
+    return rotate_inverse(rotation, enu) + np.asarray(origin_ecef, dtype=np.float64)
+
+
+def geodetic_to_enu(lat, lon, h, lat0, lon0, h0) -> np.ndarray:
+    """WGS84 → ENU so với gốc WGS84 (lat0, lon0, h0)"""
+    return ecef_to_enu(geodetic_to_ecef(lat, lon, h), geodetic_to_ecef(lat0, lon0, h0), enu_rotation(lat0, lon0))
+
+
+def enu_to_geodetic(enu, lat0, lon0, h0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return ecef_to_geodetic(enu_to_ecef(enu, geodetic_to_ecef(lat0, lon0, h0), enu_rotation(lat0, lon0)))
+
+
+def displacement(ecef, origin_ecef, rotation) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chuyển vị so với gốc: (ENU (..., 3), khoảng cách 3D (m)).
+    Dùng cho cả từng bản tin (GNSSVelocityProcessor) lẫn tính lại hàng loạt dữ liệu đã lưu.
+    """
+    enu = ecef_to_enu(ecef, origin_ecef, rotation)
+    e, n, u = _xyz(enu)
+    return enu, np.sqrt(e**2 + n**2 + u**2)
@@ -1,28 +1,19 @@
 # backend/processors/gnss_processor.py
 import numpy as np
-import math
 import logging
-import time
-from collections import deque
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 
-logger = logging.getLogger(__name__)
-
-A_WGS84 = 6378137.0
-F_WGS84 = 1 / 298.257223563
-E2_WGS84 = 2 * F_WGS84 - F_WGS84**2
+from app.clock import system_clock
+from processors.nmea import GNSSFix, parse_fixes
+from processors.geodesy import displacement, enu_rotation, geodetic_to_ecef, rotate
+from processors.origin_estimator import DriftMonitor, OriginEstimator
 
-def haversine_3d(lat1, lon1, h1, lat2, lon2, h2):
-    R = 6371000
-    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-    a_val = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a_val), math.sqrt(1 - a_val))
-    distance_2d = R * c
-    return math.sqrt(distance_2d**2 + (h2 - h1)**2)
+logger = logging.getLogger(__name__)
 
 class GNSSVelocityProcessor:
+    # Tăng khi layout get_state() thay đổi: checkpoint cũ bị bỏ qua thay vì nạp sai
+    STATE_VERSION = 3
+
     def __init__(
         self, 
         device_id: int,
@@ -30,10 +21,15 @@ class GNSSVelocityProcessor:
         required_points=5, 
         max_spread_m=5.0, 
         filter_window_size=5, 
-        min_fix_quality=4
+        min_fix_quality=4,
+        drift_threshold_m=0.5,
+        drift_confirm=10,
+        clock=None
     ):
         self.device_id = device_id
+        # db_session_factory=None: không đọc/ghi origin trong DB (replay offline)
         self.db_session_factory = db_session_factory
+        self.clock = clock or system_clock
         
         # Cấu hình
         self.required_points = required_points
@@ -44,28 +40,49 @@ class GNSSVelocityProcessor:
         # State
         self.state = "AWAITING_CANDIDATES" 
         self.origin = None
-        self.origin_candidates = []
+        # Thu thập gốc dạng streaming (Welford), không giữ danh sách điểm
+        self.estimator = OriginEstimator(required_points, max_spread_m)
+        # Sau khi khóa: phát hiện anten bị dời (chỉ cảnh báo, relock theo yêu cầu)
+        self.drift = DriftMonitor(drift_threshold_m, drift_confirm)
         
-        # Bộ nhớ đệm
-        self.history = deque(maxlen=filter_window_size + 1)
+        # Bộ nhớ đệm: ring buffer NumPy cấp phát sẵn (window + 1 điểm → window cặp vận tốc)
+        capacity = filter_window_size + 1
+        self._ts = np.zeros(capacity)
+        self._ecef = np.zeros((capacity, 3))
+        self._wgs = np.zeros((capacity, 3))
+        self._head = 0   # Vị trí ghi điểm kế tiếp
+        self._size = 0
+        # Vận tốc ECEF của từng cặp điểm liên tiếp + tổng chạy → trung bình O(1) mỗi bản tin
+        pairs = max(1, filter_window_size)
+        self._vel = np.zeros((pairs, 3))
+        self._vel_ok = np.zeros(pairs, dtype=bool)
+        self._vel_head = 0
+        self._vel_sum = np.zeros(3)
+        self._vel_count = 0
         
         # Thống kê
         self.stats = {
             'total_processed': 0,
             'low_quality_rejected': 0,
-            'origin_resets': 0
+            'origin_resets': 0,
+            'outliers_rejected': 0,
+            'drift_events': 0,
+            'relocks': 0
         }
         
+        self.origin_load_task = None
         self._schedule_load_origin()
         
         logger.info(f"GNSS Processor init for device {device_id}: State={self.state}")
 
     def _schedule_load_origin(self):
+        if self.db_session_factory is None:
+            return
         try:
             import asyncio
             try:
                 loop = asyncio.get_running_loop()
-                loop.create_task(self._async_load_origin_task())
+                self.origin_load_task = loop.create_task(self._async_load_origin_task())
             except RuntimeError:
                 logger.warning(f"⚠️ Device {self.device_id}: Init outside event loop, origin will be collected manually.")
         except Exception as e:
@@ -120,7 +137,9 @@ class GNSSVelocityProcessor:
                     existing.lat = self.origin['lat']
                     existing.lon = self.origin['lon']
                     existing.h = self.origin['h']
-                    existing.locked_at = int(time.time())
+                    existing.locked_at = int(self.clock.time())
+                    existing.spread_meters = self.estimator.spread()
+                    existing.num_points = self.estimator.count
                     existing.rotation_matrix = rot_matrix
                     existing.ecef_origin = ecef_origin
                 else:
@@ -129,9 +148,9 @@ class GNSSVelocityProcessor:
                         lat=self.origin['lat'],
                         lon=self.origin['lon'],
                         h=self.origin['h'],
-                        locked_at=int(time.time()),
-                        spread_meters=0.0,
-                        num_points=len(self.origin_candidates),
+                        locked_at=int(self.clock.time()),
+                        spread_meters=self.estimator.spread(),
+                        num_points=self.estimator.count,
                         rotation_matrix=rot_matrix,
                         ecef_origin=ecef_origin
                     )
@@ -143,18 +162,24 @@ class GNSSVelocityProcessor:
         except Exception as e:
             logger.error(f"❌ Error saving origin to DB: {e}")
 
-    def process_gngga(self, raw_payload: str) -> Optional[Dict[str, Any]]:
+    def process_gngga(self, raw_payload: Union[GNSSFix, str], ts: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        raw_payload: GNSSFix đã parse (pipeline) hoặc chuỗi NMEA (lấy epoch GGA cuối cùng).
+        ts: timestamp của bản đo (giờ UTC trong GGA), mặc định là giờ hiện tại của clock
+        """
         try:
-            parts = raw_payload.split(',')
-            if len(parts) < 10 or not parts[2] or not parts[4]:
-                return None
+            if isinstance(raw_payload, GNSSFix):
+                fix = raw_payload
+            else:
+                fixes = parse_fixes(raw_payload)
+                if not fixes:
+                    return None
+                fix = fixes[-1]
 
-            fix_quality = int(parts[6]) if parts[6] else 0
-            
             if self.state == "AWAITING_CANDIDATES":
-                return self._handle_origin_collection(raw_payload, fix_quality)
+                return self._handle_origin_collection(fix)
             elif self.state == "ORIGIN_LOCKED":
-                return self._handle_processing(raw_payload, fix_quality)
+                return self._handle_processing(fix, ts)
             
             return None
 
@@ -162,7 +187,8 @@ class GNSSVelocityProcessor:
             logger.error(f"Error processing GNGGA: {e}")
             return None
 
-    def _handle_origin_collection(self, gngga_string, fix_quality):
+    def _handle_origin_collection(self, fix: GNSSFix):
+        fix_quality = fix.fix_quality
         if fix_quality < self.min_fix_quality:
             self.stats['low_quality_rejected'] += 1
             return {
@@ -171,114 +197,117 @@ class GNSSVelocityProcessor:
                 "message": f"Low quality fix ({fix_quality} < {self.min_fix_quality})"
             }
 
-        point = self._parse_gngga(gngga_string)
-        if not point: return None
-        
-        self.origin_candidates.append(point['wgs'])
-        
-        if len(self.origin_candidates) >= self.required_points:
-            lats = [p['lat'] for p in self.origin_candidates]
-            lons = [p['lon'] for p in self.origin_candidates]
-            hs = [p['h'] for p in self.origin_candidates]
-            
-            center_lat = np.mean(lats)
-            center_lon = np.mean(lons)
-            center_h = np.mean(hs)
-            
-            max_dist = max(
-                haversine_3d(center_lat, center_lon, center_h, p['lat'], p['lon'], p['h']) 
-                for p in self.origin_candidates
-            )
+        if not self.estimator.add(self._gngga_to_ecef(fix.lat, fix.lon, fix.h), fix.lat, fix.lon):
+            self.stats['outliers_rejected'] += 1
+
+        if self.estimator.ready():
+            return self._lock_origin()
+
+        if self.estimator.exhausted():
+            spread = self.estimator.spread()
+            self.estimator.reset()
+            self.stats['origin_resets'] += 1
+            return {
+                "type": "origin_reset",
+                "message": f"Spread too high ({spread:.2f}m > {self.max_spread_m}m)"
+            }
 
-            if max_dist <= self.max_spread_m:
-                self.origin = {
-                    'lat': center_lat, 
-                    'lon': center_lon, 
-                    'h': center_h, 
-                    'R': self._get_rotation_matrix(center_lat, center_lon),
-                    'ecef': self._gngga_to_ecef(center_lat, center_lon, center_h)
-                }
-                self.state = "ORIGIN_LOCKED"
-                logger.info(f"ORIGIN LOCKED (Device {self.device_id}): ({center_lat:.6f}, {center_lon:.6f}), Spread: {max_dist:.3f}m")
-                
-                # ✅ Save Async
-                import asyncio
-                try:
-                    loop = asyncio.get_running_loop()
-                    loop.create_task(self._save_origin_to_db())
-                except RuntimeError:
-                    logger.warning("Cannot save origin: No running event loop")
-                
-                return {
-                    "type": "origin_locked",
-                    "data": {
-                        'lat': float(center_lat),
-                        'lon': float(center_lon),
-                        'h': float(center_h)
-                    }
-                }
-            else:
-                self.origin_candidates.clear()
-                self.stats['origin_resets'] += 1
-                return {
-                    "type": "origin_reset",
-                    "message": f"Spread too high ({max_dist:.2f}m > {self.max_spread_m}m)"
-                }
-        
         return {
             "type": "origin_collecting",
-            "count": len(self.origin_candidates),
-            "target": self.required_points
+            "count": self.estimator.count,
+            "target": self.required_points,
+            "spread_m": round(self.estimator.spread(), 3),
+            "rejected": self.estimator.rejected
         }
 
-    def _handle_processing(self, gngga_string, fix_quality):
-        if fix_quality < self.min_fix_quality:
-            self.stats['low_quality_rejected'] += 1
-            return None
+    def _lock_origin(self):
+        """Khóa gốc tại trung bình hiện tại của estimator, lưu DB (async)"""
+        self.origin = self.estimator.origin()
+        self.state = "ORIGIN_LOCKED"
+        self.drift.reset()
+        spread = self.estimator.spread()
+        logger.info(
+            f"ORIGIN LOCKED (Device {self.device_id}): ({self.origin['lat']:.6f}, {self.origin['lon']:.6f}), "
+            f"Spread: max {spread:.3f}m (RMS {self.estimator.stats.rms():.3f}m) over {self.estimator.count} points"
+        )
 
-        point = self._parse_gngga(gngga_string)
-        if not point: return None
+        # ✅ Save Async
+        import asyncio
+        try:
+            loop = asyncio.get_running_loop()
+            if self.db_session_factory is not None:
+                loop.create_task(self._save_origin_to_db())
+        except RuntimeError:
+            logger.warning("Cannot save origin: No running event loop")
 
-        ts = time.time()
-        ecef_coords = self._gngga_to_ecef(
-            point['wgs']['lat'], 
-            point['wgs']['lon'], 
-            point['wgs']['h']
-        )
-        
-        self.history.append({
-            'ts': ts, 
-            'ecef': ecef_coords, 
-            'wgs': point['wgs']
-        })
+        return {
+            "type": "origin_locked",
+            "data": {
+                'lat': self.origin['lat'],
+                'lon': self.origin['lon'],
+                'h': self.origin['h']
+            }
+        }
 
-        if len(self.history) < 2: return None
+    def request_relock(self) -> Dict[str, Any]:
+        """
+        Relock gốc (VD sau khi anten được lắp lại):
+        - chưa khóa → không làm gì, tiếp tục thu thập với các điểm đã có
+        - DriftMonitor đã xác nhận bước nhảy → dùng thống kê từ lúc bắt đầu lệch, đủ điểm và đủ tập trung
+          thì khóa ngay tại trung bình đó
+        - chưa có drift → thu thập lại từ đầu; không dùng các điểm từ lúc khóa vì trung bình của chúng
+          đã hấp thụ chuyển vị chậm thật của sườn dốc
+        Ring buffer vận tốc (ECEF) không phụ thuộc gốc nên được giữ nguyên.
+        """
+        if self.state != "ORIGIN_LOCKED" or not self.origin:
+            return {"type": "origin_relock", "status": "COLLECTING", "count": self.estimator.count}
 
-        p_new = self.history[-1]
-        p_old = self.history[-2]
-        dt = p_new['ts'] - p_old['ts']
+        recent = self.drift.recent
+        if self.drift.drifted and recent.n and recent.max_distance() <= self.max_spread_m:
+            self.estimator.seed(self.origin['ecef'], self.origin['R'], recent)
+        else:
+            self.estimator.reset()
+        self.drift.reset()
+        self.stats['relocks'] += 1
+
+        if self.estimator.ready():
+            logger.info(f"🔄 Device {self.device_id}: relocking origin from {self.estimator.count} post-drift points")
+            result = self._lock_origin()
+            return {"type": "origin_relock", "status": "LOCKED", "data": result['data']}
+
+        self.state = "AWAITING_CANDIDATES"
+        logger.info(f"🔄 Device {self.device_id}: origin released, collecting ({self.estimator.count}/{self.required_points})")
+        return {"type": "origin_relock", "status": "COLLECTING", "count": self.estimator.count}
+
+    def _handle_processing(self, fix: GNSSFix, ts=None):
+        if fix.fix_quality < self.min_fix_quality:
+            self.stats['low_quality_rejected'] += 1
+            return None
+
+        if ts is None:
+            ts = self.clock.time()
+        ecef_coords = self._gngga_to_ecef(fix.lat, fix.lon, fix.h)
         
-        if dt < 0.01: return None
-            
-        v_ecef_raw = (p_new['ecef'] - p_old['ecef']) / dt
-        v_enu_raw = self.origin['R'] @ v_ecef_raw
-
-        if len(self.history) >= self.filter_window_size:
-            velocities_enu = []
-            for i in range(1, len(self.history)):
-                p1 = self.history[i]
-                p0 = self.history[i-1]
-                idt = p1['ts'] - p0['ts']
-                if idt >= 0.01:
-                    iv_ecef = (p1['ecef'] - p0['ecef']) / idt
-                    velocities_enu.append(self.origin['R'] @ iv_ecef)
-            
-            v_enu_filtered = np.mean(velocities_enu, axis=0) if velocities_enu else v_enu_raw
+        v_ecef_raw = self._push_point(ts, ecef_coords, (fix.lat, fix.lon, fix.h))
+        if v_ecef_raw is None: return None
+
+        # R tuyến tính: trung bình của R @ v_i = R @ (trung bình v_i) → một phép nhân ma trận
+        if self._size >= self.filter_window_size and self._vel_count:
+            v_enu_filtered = rotate(self.origin['R'], self._vel_sum / self._vel_count)
         else:
-            v_enu_filtered = v_enu_raw
+            v_enu_filtered = rotate(self.origin['R'], v_ecef_raw)
+
+        # Cùng hàm với xử lý theo lô (processors/geodesy.py) → kết quả giống hệt
+        pos_enu, total_displacement_m = displacement(ecef_coords, self.origin['ecef'], self.origin['R'])
+        total_displacement_m = float(total_displacement_m)
 
-        pos_enu = self.origin['R'] @ (ecef_coords - self.origin['ecef'])
-        total_displacement_m = float(np.sqrt(pos_enu[0]**2 + pos_enu[1]**2 + pos_enu[2]**2))
+        if self.drift.update(pos_enu):
+            self.stats['drift_events'] += 1
+            e, n, u = self.drift.offset()
+            logger.warning(
+                f"⚠️ Device {self.device_id}: origin drift suspected, position moved to "
+                f"E={e:.3f} N={n:.3f} U={u:.3f} m — relock if the antenna was moved"
+            )
         
         self.stats['total_processed'] += 1
         
@@ -286,9 +315,9 @@ class GNSSVelocityProcessor:
             'type': 'gnss_processed',
             'timestamp': int(ts),
             'data': {
-                'lat': point['wgs']['lat'], 
-                'lon': point['wgs']['lon'], 
-                'h': point['wgs']['h'],
+                'lat': fix.lat, 
+                'lon': fix.lon, 
+                'h': fix.h,
                 'pos_e': float(pos_enu[0]), 
                 'pos_n': float(pos_enu[1]), 
                 'pos_u': float(pos_enu[2]),
@@ -298,59 +327,120 @@ class GNSSVelocityProcessor:
                 'vel_u': float(v_enu_filtered[2]),
                 'speed_2d': float(np.sqrt(v_enu_filtered[0]**2 + v_enu_filtered[1]**2)),
                 'speed_2d_mm_s': float(np.sqrt(v_enu_filtered[0]**2 + v_enu_filtered[1]**2) * 1000),
-                'fix_quality': point['fix_quality'], 
-                'num_sats': point['num_sats'], 
-                'hdop': point['hdop']
+                'fix_quality': fix.fix_quality, 
+                'num_sats': fix.num_sats, 
+                'hdop': fix.hdop
             }
         }
 
-    def _parse_gngga(self, gngga_string):
-        try:
-            parts = gngga_string.split(',')
-            if len(parts) < 10: return None
-                
-            lat_str, lon_str = parts[2], parts[4]
-            lat_dir, lon_dir = parts[3], parts[5]
-            
-            if not lat_str or not lon_str: return None
+    def _push_point(self, ts, ecef, wgs) -> Optional[np.ndarray]:
+        """
+        Ghi điểm vào ring buffer, cập nhật tổng vận tốc trong cửa sổ.
+        Trả về vận tốc ECEF so với điểm trước, None nếu chưa có điểm trước hoặc dt < 0.01s.
+        """
+        # wgs: (lat, lon, h)
+        capacity = len(self._ts)
+        velocity = None
+        if self._size:
+            prev = (self._head - 1) % capacity
+            dt = ts - self._ts[prev]
+            if dt >= 0.01:
+                velocity = (ecef - self._ecef[prev]) / dt
 
-            h = float(parts[9]) if parts[9] else 0.0
-            
-            lat = float(lat_str[:2]) + float(lat_str[2:]) / 60.0
-            if lat_dir == 'S': lat = -lat
-            
-            lon = float(lon_str[:3]) + float(lon_str[3:]) / 60.0
-            if lon_dir == 'W': lon = -lon
-                
-            return {
-                'wgs': {'lat': lat, 'lon': lon, 'h': h},
-                'fix_quality': int(parts[6]) if parts[6] else 0, 
-                'num_sats': int(parts[7]) if parts[7] else 0, 
-                'hdop': float(parts[8]) if parts[8] else 99.9
-            }
-        except (ValueError, IndexError):
-            return None
+        i = self._head
+        self._ts[i] = ts
+        self._ecef[i] = ecef
+        self._wgs[i] = wgs
+        self._head = (i + 1) % capacity
+        had_previous = self._size > 0
+        self._size = min(self._size + 1, capacity)
+        if had_previous:
+            self._push_velocity(velocity)
+        return velocity
+
+    def _push_velocity(self, velocity: Optional[np.ndarray]):
+        # Cặp cũ nhất rời cửa sổ: trừ khỏi tổng chạy
+        j = self._vel_head
+        if self._vel_ok[j]:
+            self._vel_sum -= self._vel[j]
+            self._vel_count -= 1
+        if velocity is not None:
+            self._vel[j] = velocity
+            self._vel_sum += velocity
+            self._vel_count += 1
+        self._vel_ok[j] = velocity is not None
+        self._vel_head = (j + 1) % len(self._vel)
+        if self._vel_head == 0:
+            # Mỗi vòng ring tính lại tổng → sai số cộng/trừ dấu phẩy động không tích lũy
+            self._vel_sum = self._vel[self._vel_ok].sum(axis=0)
+
+    def _reset_history(self):
+        self._head = self._size = 0
+        self._vel_ok[:] = False
+        self._vel_head = 0
+        self._vel_sum = np.zeros(3)
+        self._vel_count = 0
+
+    def _history_order(self) -> np.ndarray:
+        """Chỉ số các điểm trong ring buffer theo thứ tự thời gian"""
+        capacity = len(self._ts)
+        return (self._head - self._size + np.arange(self._size)) % capacity
 
     def _gngga_to_ecef(self, lat, lon, h):
-        lat_rad, lon_rad = math.radians(lat), math.radians(lon)
-        sin_lat = math.sin(lat_rad)
-        cos_lat = math.cos(lat_rad)
-        
-        N = A_WGS84 / math.sqrt(1 - E2_WGS84 * sin_lat**2)
-        X = (N + h) * cos_lat * math.cos(lon_rad)
-        Y = (N + h) * cos_lat * math.sin(lon_rad)
-        Z = (N * (1 - E2_WGS84) + h) * sin_lat
-        return np.array([X, Y, Z])
+        return geodetic_to_ecef(lat, lon, h)
 
     def _get_rotation_matrix(self, lat0, lon0):
-        lat0_rad, lon0_rad = math.radians(lat0), math.radians(lon0)
-        sl0, cl0 = math.sin(lon0_rad), math.cos(lon0_rad)
-        sf0, cf0 = math.sin(lat0_rad), math.cos(lat0_rad)
-        return np.array([
-            [-sl0, cl0, 0],
-            [-sf0 * cl0, -sf0 * sl0, cf0],
-            [cf0 * cl0, cf0 * sl0, sf0]
-        ])
+        return enu_rotation(lat0, lon0)
 
     def get_stats(self):
-        return self.stats.copy()
\ No newline at end of file
+        return self.stats.copy()
+
+    # =========================================================================
+    # CHECKPOINT (warm restart)
+    # =========================================================================
+    def get_state(self) -> Dict[str, Any]:
+        """Trạng thái tối thiểu để khôi phục sau khi restart (kiểu cơ bản + mảng float64 đã copy)"""
+        origin = None
+        if self.origin:
+            origin = {
+                'lat': float(self.origin['lat']),
+                'lon': float(self.origin['lon']),
+                'h': float(self.origin['h']),
+                'R': np.array(self.origin['R'], dtype=np.float64),
+                'ecef': np.array(self.origin['ecef'], dtype=np.float64)
+            }
+        order = self._history_order()
+        return {
+            'state': self.state,
+            'origin': origin,
+            'estimator': self.estimator.get_state(),
+            'drift': self.drift.get_state(),
+            # Ring buffer theo thứ tự thời gian: ts (n,), ecef (n, 3), wgs (n, 3) = (lat, lon, h)
+            'history': {'ts': self._ts[order], 'ecef': self._ecef[order], 'wgs': self._wgs[order]},
+            'stats': dict(self.stats)
+        }
+
+    def load_state(self, snapshot: Dict[str, Any]):
+        origin = snapshot.get('origin')
+        if origin:
+            self.origin = {
+                'lat': origin['lat'],
+                'lon': origin['lon'],
+                'h': origin['h'],
+                'R': np.array(origin['R']),
+                'ecef': np.array(origin['ecef'])
+            }
+        state = snapshot.get('state', self.state)
+        # Không chuyển sang LOCKED nếu snapshot thiếu origin
+        if state != "ORIGIN_LOCKED" or self.origin:
+            self.state = state
+        self.estimator.load_state(snapshot.get('estimator', {}))
+        self.drift.load_state(snapshot.get('drift', {}))
+        self._reset_history()
+        history = snapshot.get('history') or {}
+        ts = np.asarray(history.get('ts', ()), dtype=np.float64)
+        ecef = np.asarray(history.get('ecef', ()), dtype=np.float64).reshape(-1, 3)
+        wgs = np.asarray(history.get('wgs', ()), dtype=np.float64).reshape(-1, 3)
+        for i in range(len(ts)):
+            self._push_point(float(ts[i]), ecef[i], wgs[i])
+        self.stats.update(snapshot.get('stats', {}))
\ No newline at end of file
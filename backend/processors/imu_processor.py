@@ -6,6 +6,8 @@ from typing import Optional, Dict, Any
 logger = logging.getLogger(__name__)
 
 class IMUEngine:
+    STATE_VERSION = 1  # Tăng khi layout get_state() thay đổi
+
     def __init__(self):
         self.last_valid_data = {
             "ax": 0.0, "ay": 0.0, "az": 9.8,
@@ -60,4 +62,10 @@ class IMUEngine:
         except (ValueError, TypeError) as e:
             logger.error(f"Error processing IMU data: {e}")
             # ✅ Trả về giá trị cuối cùng thay vì None
-            return self.last_valid_data.copy()
\ No newline at end of file
+            return self.last_valid_data.copy()
+
+    def get_state(self) -> Dict[str, Any]:
+        return {'last_valid_data': dict(self.last_valid_data)}
+
+    def load_state(self, snapshot: Dict[str, Any]):
+        self.last_valid_data.update(snapshot.get('last_valid_data', {}))
\ No newline at end of file
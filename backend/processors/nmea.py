@@ -0,0 +1,210 @@
+# backend/processors/nmea.py - Parser NMEA 0183 dùng chung (GGA / RMC / GST), kiểm tra checksum
+# Bản ghi là NamedTuple: tạo nhanh hơn dataclass frozen, pickle gọn khi trả về từ process pool
+import calendar
+from functools import reduce
+from operator import xor
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+
+class GGA(NamedTuple):
+    talker: str                  # GN / GP / GL / GA / GB / BD ...
+    utc: Optional[float]         # Giây trong ngày (UTC), None nếu thiếu
+    lat: float
+    lon: float
+    h: float                     # Độ cao so với mực nước biển (m)
+    fix_quality: int
+    num_sats: int
+    hdop: float
+
+
+class RMC(NamedTuple):
+    talker: str
+    utc: Optional[float]
+    valid: bool                  # Trạng thái A (hợp lệ) / V (cảnh báo)
+    lat: Optional[float]
+    lon: Optional[float]
+    speed_knots: Optional[float]
+    course: Optional[float]
+    date: Optional[int]          # Epoch (giây) của 00:00 UTC ngày đo, None nếu thiếu
+
+
+class GST(NamedTuple):
+    talker: str
+    utc: Optional[float]
+    rms: Optional[float]
+    sigma_lat: Optional[float]   # Độ lệch chuẩn (m)
+    sigma_lon: Optional[float]
+    sigma_h: Optional[float]
+
+
+class GNSSFix(NamedTuple):
+    """Một epoch đo: GGA + ngày (RMC) + độ chính xác (GST) cùng thời điểm UTC trong payload"""
+    talker: str
+    utc: Optional[float]
+    lat: float
+    lon: float
+    h: float
+    fix_quality: int
+    num_sats: int
+    hdop: float
+    date: Optional[int] = None
+    sigma_lat: Optional[float] = None
+    sigma_lon: Optional[float] = None
+    sigma_h: Optional[float] = None
+
+    @property
+    def timestamp(self) -> Optional[float]:
+        """Epoch đầy đủ khi có ngày từ RMC, None nếu chỉ có giờ trong ngày"""
+        if self.date is None or self.utc is None:
+            return None
+        return self.date + self.utc
+
+
+Sentence = Union[GGA, RMC, GST]
+
+
+def checksum(body: str) -> int:
+    """XOR các ký tự giữa '$' và '*'"""
+    return reduce(xor, body.encode('ascii'), 0)
+
+
+def _float(value: str) -> Optional[float]:
+    return float(value) if value else None
+
+
+def _utc(value: str) -> Optional[float]:
+    # hhmmss(.ss) → giây trong ngày
+    if len(value) < 6:
+        return None
+    seconds = int(value[0:2]) * 3600 + int(value[2:4]) * 60 + float(value[4:])
+    return seconds if 0 <= seconds < 86401 else None  # 86400: giây nhuận
+
+
+def _coord(value: str, hemisphere: str, limit: float) -> Optional[float]:
+    # (d)ddmm.mmmm: 2 chữ số trước dấu chấm là phút, phần trước nữa là độ
+    if not value:
+        return None
+    dot = value.find('.')
+    if dot < 0:
+        dot = len(value)
+    if dot < 3:
+        raise ValueError(f"bad coordinate {value!r}")
+    minutes = float(value[dot - 2:])
+    if minutes >= 60:
+        raise ValueError(f"bad coordinate {value!r}")
+    degrees = int(value[:dot - 2]) + minutes / 60.0
+    if degrees > limit:
+        raise ValueError(f"bad coordinate {value!r}")
+    return -degrees if hemisphere in ('S', 'W') else degrees
+
+
+def _date(value: str) -> Optional[int]:
+    # ddmmyy → epoch 00:00 UTC
+    if len(value) != 6:
+        return None
+    day, month, year = int(value[0:2]), int(value[2:4]), 2000 + int(value[4:6])
+    if not (1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]):
+        return None
+    return calendar.timegm((year, month, day, 0, 0, 0))
+
+
+def _parse_gga(talker: str, f: List[str]) -> Optional[GGA]:
+    if len(f) < 10:
+        return None
+    lat = _coord(f[2], f[3], 90.0)
+    lon = _coord(f[4], f[5], 180.0)
+    if lat is None or lon is None:
+        return None  # Chưa có fix
+    return GGA(
+        talker, _utc(f[1]), lat, lon,
+        float(f[9]) if f[9] else 0.0,
+        int(f[6]) if f[6] else 0,
+        int(f[7]) if f[7] else 0,
+        float(f[8]) if f[8] else 99.9
+    )
+
+
+def _parse_rmc(talker: str, f: List[str]) -> Optional[RMC]:
+    if len(f) < 10:
+        return None
+    return RMC(
+        talker, _utc(f[1]), f[2] == 'A',
+        _coord(f[3], f[4], 90.0), _coord(f[5], f[6], 180.0),
+        _float(f[7]), _float(f[8]), _date(f[9])
+    )
+
+
+def _parse_gst(talker: str, f: List[str]) -> Optional[GST]:
+    if len(f) < 9:
+        return None
+    return GST(talker, _utc(f[1]), _float(f[2]), _float(f[6]), _float(f[7]), _float(f[8]))
+
+
+_PARSERS: Dict[str, Callable[[str, List[str]], Optional[Sentence]]] = {
+    'GGA': _parse_gga,
+    'RMC': _parse_rmc,
+    'GST': _parse_gst,
+}
+
+
+def parse_sentence(sentence: str) -> Optional[Sentence]:
+    """
+    Một câu NMEA → GGA / RMC / GST, tách trường đúng một lần.
+    None nếu sai checksum, thiếu '*hh' (frame bị cắt), loại câu không hỗ trợ hoặc trường hỏng.
+    """
+    sentence = sentence.strip()
+    star = sentence.rfind('*')
+    if not sentence.startswith('$') or star < 6 or len(sentence) != star + 3:
+        return None
+    body = sentence[1:star]
+    try:
+        if checksum(body) != int(sentence[star + 1:], 16):
+            return None
+        fields = body.split(',')
+        head = fields[0]
+        parser = _PARSERS.get(head[2:]) if len(head) == 5 else None
+        return parser(head[:2], fields) if parser else None
+    except (ValueError, IndexError, UnicodeEncodeError):
+        return None
+
+
+def parse_sentences(payload: str) -> List[Sentence]:
+    """Payload nhiều dòng → các câu hợp lệ theo thứ tự, câu hỏng bị bỏ"""
+    records = []
+    for line in payload.splitlines():
+        record = parse_sentence(line)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def parse_fixes(payload: str) -> List[GNSSFix]:
+    """
+    Payload (một hoặc nhiều câu) → các epoch GGA theo thứ tự.
+    RMC / GST cùng thời điểm UTC trong payload bổ sung ngày và độ lệch chuẩn cho GGA tương ứng.
+    """
+    ggas: List[GGA] = []
+    dates: Dict[float, int] = {}
+    sigmas: Dict[float, GST] = {}
+    for record in parse_sentences(payload):
+        if type(record) is GGA:
+            ggas.append(record)
+        elif record.utc is None:
+            continue  # Không ghép được với GGA nào
+        elif type(record) is RMC:
+            if record.date is not None:
+                dates[record.utc] = record.date
+        else:
+            sigmas[record.utc] = record
+
+    fixes = []
+    for gga in ggas:
+        gst = sigmas.get(gga.utc)
+        fixes.append(GNSSFix(
+            gga.talker, gga.utc, gga.lat, gga.lon, gga.h, gga.fix_quality, gga.num_sats, gga.hdop,
+            dates.get(gga.utc),
+            gst.sigma_lat if gst else None,
+            gst.sigma_lon if gst else None,
+            gst.sigma_h if gst else None
+        ))
+    return fixes
@@ -0,0 +1,247 @@
+# backend/processors/origin_estimator.py - Ước lượng gốc GNSS dạng streaming + theo dõi dịch gốc (drift)
+import math
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from processors.geodesy import ecef_to_geodetic, enu_rotation, rotate, rotate_inverse
+
+
+class RunningStats:
+    """Welford: trung bình + ma trận hiệp phương sai 3D + hộp bao, bộ nhớ O(1) bất kể số mẫu"""
+    __slots__ = ('n', 'mean', 'm2', 'lo', 'hi')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = np.zeros(3)
+        self.m2 = np.zeros((3, 3))
+        self.lo = np.full(3, np.inf)
+        self.hi = np.full(3, -np.inf)
+
+    def add(self, x: np.ndarray):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta[:, None] * (x - self.mean)  # Tại chỗ: không cấp phát mảng mới mỗi epoch
+        np.minimum(self.lo, x, out=self.lo)
+        np.maximum(self.hi, x, out=self.hi)
+
+    def covariance(self) -> np.ndarray:
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros((3, 3))
+
+    def rms(self) -> float:
+        """Độ phân tán 3D (RMS khoảng cách tới trung bình, m)"""
+        return math.sqrt(max(float(np.trace(self.m2)), 0.0) / self.n) if self.n else 0.0
+
+    def max_distance(self) -> float:
+        """
+        Cận trên khoảng cách 3D xa nhất từ trung bình tới một mẫu (m), tính từ hộp bao:
+        không bao giờ nhỏ hơn khoảng cách thật nên dùng làm ngưỡng khóa không lỏng hơn max distance
+        """
+        if not self.n:
+            return 0.0
+        reach = np.maximum(self.hi - self.mean, self.mean - self.lo)
+        return math.sqrt(float(reach.dot(reach)))
+
+    def copy(self) -> 'RunningStats':
+        other = RunningStats()
+        other.n, other.mean, other.m2 = self.n, self.mean.copy(), self.m2.copy()
+        other.lo, other.hi = self.lo.copy(), self.hi.copy()
+        return other
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'n': self.n,
+            'mean': self.mean.tolist(),
+            'm2': self.m2.tolist(),
+            'lo': self.lo.tolist(),
+            'hi': self.hi.tolist()
+        }
+
+    def load_state(self, snapshot: Dict[str, Any]):
+        self.n = int(snapshot.get('n', 0))
+        self.mean = np.array(snapshot.get('mean', [0.0, 0.0, 0.0]), dtype=np.float64)
+        self.m2 = np.array(snapshot.get('m2', np.zeros((3, 3))), dtype=np.float64)
+        self.lo = np.array(snapshot.get('lo', [np.inf] * 3), dtype=np.float64)
+        self.hi = np.array(snapshot.get('hi', [-np.inf] * 3), dtype=np.float64)
+
+
+class OriginEstimator:
+    """
+    Thu thập gốc từ các epoch GNSS mà không giữ danh sách điểm:
+    - Tọa độ được đổi sang hệ ENU tạm (đặt tại điểm nhận đầu tiên hoặc gốc cũ khi relock),
+      Welford trên ENU → số nhỏ, ổn định số học
+    - Cổng ngoại lai: từ `gate_warmup` mẫu, điểm cách trung bình > max(gate_sigma * RMS, gate_min_m) bị loại
+    - Khóa khi đủ `required_points` mẫu và mọi mẫu đã nhận cách trung bình <= `max_spread_m`
+      (cận trên từ hộp bao, như max distance của bản cũ); quá `max_points` mà vẫn chưa đạt
+      thì bắt đầu lại (anten đang di chuyển)
+    """
+
+    def __init__(
+        self,
+        required_points: int = 5,
+        max_spread_m: float = 5.0,
+        max_points: Optional[int] = None,
+        gate_sigma: float = 4.0,
+        gate_min_m: float = 0.1,
+        gate_warmup: int = 5
+    ):
+        self.required_points = max(1, required_points)
+        self.max_spread_m = max_spread_m
+        self.max_points = max(max_points or 10 * self.required_points, self.required_points)
+        self.gate_sigma = gate_sigma
+        self.gate_min_m = gate_min_m
+        self.gate_warmup = gate_warmup
+
+        self.stats = RunningStats()
+        self.ref_ecef: Optional[np.ndarray] = None
+        self.ref_R: Optional[np.ndarray] = None
+        self.rejected = 0
+
+    @property
+    def count(self) -> int:
+        return self.stats.n
+
+    def reset(self):
+        self.stats.reset()
+        self.ref_ecef = self.ref_R = None
+        self.rejected = 0
+
+    def seed(self, ref_ecef: np.ndarray, ref_R: np.ndarray, stats: Optional[RunningStats] = None):
+        """Bắt đầu lại trong hệ ENU cho trước, có thể kế thừa thống kê đang chạy (relock)"""
+        self.ref_ecef = np.asarray(ref_ecef, dtype=np.float64)
+        self.ref_R = np.asarray(ref_R, dtype=np.float64)
+        self.stats = stats.copy() if stats is not None else RunningStats()
+        self.rejected = 0
+
+    def add(self, ecef: np.ndarray, lat: float, lon: float) -> bool:
+        """Thêm một epoch (ECEF + lat/lon để dựng hệ tạm ở điểm đầu). False nếu bị cổng ngoại lai loại"""
+        if self.ref_ecef is None:
+            self.seed(ecef, enu_rotation(lat, lon))
+        enu = rotate(self.ref_R, ecef - self.ref_ecef)
+
+        stats = self.stats
+        if stats.n >= self.gate_warmup:
+            gate = max(self.gate_sigma * stats.rms(), self.gate_min_m)
+            residual = enu - stats.mean
+            if residual.dot(residual) > gate * gate:
+                self.rejected += 1
+                return False
+        stats.add(enu)
+        return True
+
+    def spread(self) -> float:
+        """Khoảng cách xa nhất (cận trên) từ trung bình tới các mẫu đã nhận (m)"""
+        return self.stats.max_distance()
+
+    def ready(self) -> bool:
+        return self.stats.n >= self.required_points and self.spread() <= self.max_spread_m
+
+    def exhausted(self) -> bool:
+        return self.stats.n >= self.max_points and not self.ready()
+
+    def origin(self) -> Dict[str, Any]:
+        """Gốc từ trung bình hiện tại: {'lat', 'lon', 'h', 'R', 'ecef'} như GNSSVelocityProcessor.origin"""
+        ecef = rotate_inverse(self.ref_R, self.stats.mean) + self.ref_ecef
+        lat, lon, h = ecef_to_geodetic(ecef)
+        return {
+            'lat': float(lat),
+            'lon': float(lon),
+            'h': float(h),
+            'R': enu_rotation(lat, lon),
+            'ecef': ecef
+        }
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'stats': self.stats.get_state(),
+            'ref_ecef': None if self.ref_ecef is None else self.ref_ecef.tolist(),
+            'ref_R': None if self.ref_R is None else self.ref_R.tolist(),
+            'rejected': self.rejected
+        }
+
+    def load_state(self, snapshot: Dict[str, Any]):
+        self.reset()
+        if snapshot.get('ref_ecef') is not None and snapshot.get('ref_R') is not None:
+            stats = RunningStats()
+            stats.load_state(snapshot.get('stats', {}))
+            self.seed(np.array(snapshot['ref_ecef']), np.array(snapshot['ref_R']), stats)
+        self.rejected = snapshot.get('rejected', 0)
+
+
+class DriftMonitor:
+    """
+    Sau khi khóa gốc: phát hiện bước nhảy vị trí (anten bị dời / lắp lại) trên vị trí ENU so với gốc.
+    - EWMA nhanh vs EWMA chậm: lệch > `threshold_m` liên tục `confirm` epoch → drift (chỉ cảnh báo,
+      không tự relock vì chuyển vị thật của sườn dốc cũng là dữ liệu cần đo)
+    - `recent`: Welford các vị trí kể từ lúc khóa; khi drift được xác nhận được thay bằng thống kê
+      từ lúc bắt đầu lệch (`candidate`) → relock dùng luôn thống kê này thay vì thu thập lại từ đầu
+    """
+
+    def __init__(self, threshold_m: float = 0.5, confirm: int = 10, fast_alpha: float = 0.2, slow_alpha: float = 0.01):
+        self.threshold_m = threshold_m
+        self.confirm = max(1, confirm)
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.reset()
+
+    def reset(self):
+        self.fast: Optional[np.ndarray] = None
+        self.slow: Optional[np.ndarray] = None
+        self.streak = 0
+        self.drifted = False
+        self.recent = RunningStats()
+        self.candidate = RunningStats()
+
+    def update(self, enu: np.ndarray) -> bool:
+        """Trả về True khi một bước nhảy vừa được xác nhận"""
+        if self.fast is None:
+            self.fast = enu.copy()
+            self.slow = enu.copy()
+        else:
+            self.fast += self.fast_alpha * (enu - self.fast)
+            self.slow += self.slow_alpha * (enu - self.slow)
+
+        gap = self.fast - self.slow
+        if gap.dot(gap) > self.threshold_m ** 2:
+            if self.streak == 0:
+                self.candidate.reset()  # Có thể là vị trí mới: tích lũy riêng từ đây
+            self.streak += 1
+            self.candidate.add(enu)
+        else:
+            self.streak = 0  # Lệch ngắn (nhiễu): thống kê `recent` giữ nguyên
+        self.recent.add(enu)
+
+        if self.streak == self.confirm:
+            # Lệch đủ lâu: vị trí mới tính từ lúc bắt đầu lệch
+            self.recent = self.candidate.copy()
+            self.drifted = True
+            return True
+        return False
+
+    def offset(self) -> Tuple[float, float, float]:
+        """Độ lệch trung bình gần đây so với gốc (E, N, U)"""
+        return tuple(float(v) for v in self.recent.mean)
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'fast': None if self.fast is None else self.fast.tolist(),
+            'slow': None if self.slow is None else self.slow.tolist(),
+            'streak': self.streak,
+            'drifted': self.drifted,
+            'recent': self.recent.get_state(),
+            'candidate': self.candidate.get_state()
+        }
+
+    def load_state(self, snapshot: Dict[str, Any]):
+        self.reset()
+        if snapshot.get('fast') is not None:
+            self.fast = np.array(snapshot['fast'], dtype=np.float64)
+            self.slow = np.array(snapshot['slow'], dtype=np.float64)
+        self.streak = snapshot.get('streak', 0)
+        self.drifted = snapshot.get('drifted', False)
+        self.recent.load_state(snapshot.get('recent', {}))
+        self.candidate.load_state(snapshot.get('candidate', {}))
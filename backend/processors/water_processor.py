@@ -6,6 +6,8 @@ from typing import Optional, Dict, Any
 logger = logging.getLogger(__name__)
 
 class WaterEngine:
+    STATE_VERSION = 1  # Tăng khi layout get_state() thay đổi
+
     def __init__(self, history_size: int = 36, valid_min: float = 0.0, valid_max: float = 50.0):
         self.history = deque(maxlen=history_size)
         self.valid_min = valid_min
@@ -47,7 +49,17 @@ class WaterEngine:
                 "is_fallback": True
             }
 
+    def get_state(self) -> Dict[str, Any]:
+        return {'history': list(self.history), 'last_valid_value': self.last_valid_value}
+
+    def load_state(self, snapshot: Dict[str, Any]):
+        self.history.clear()
+        self.history.extend(tuple(p) for p in snapshot.get('history', []))
+        self.last_valid_value = snapshot.get('last_valid_value', self.last_valid_value)
+
 class RainEngine:
+    STATE_VERSION = 1  # Tăng khi layout get_state() thay đổi
+
     def __init__(self, history_size: int = 60):
         self.history = deque(maxlen=history_size)
         self.last_valid_rainfall = 0.0
@@ -99,4 +111,17 @@ class RainEngine:
                 "rainfall_mm": round(self.last_valid_rainfall, 2),
                 "intensity_mm_h": round(self.last_valid_intensity, 2),
                 "is_fallback": True
-            }
\ No newline at end of file
+            }
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'history': list(self.history),
+            'last_valid_rainfall': self.last_valid_rainfall,
+            'last_valid_intensity': self.last_valid_intensity
+        }
+
+    def load_state(self, snapshot: Dict[str, Any]):
+        self.history.clear()
+        self.history.extend(tuple(p) for p in snapshot.get('history', []))
+        self.last_valid_rainfall = snapshot.get('last_valid_rainfall', self.last_valid_rainfall)
+        self.last_valid_intensity = snapshot.get('last_valid_intensity', self.last_valid_intensity)
\ No newline at end of file
@@ -0,0 +1,198 @@
+# ==============================================================================
+# == backend/replay.py - Phát lại capture MQTT qua pipeline thật              ==
+# ==============================================================================
+# Capture: file JSONL, mỗi dòng {"t": <thời điểm nhận>, "topic": ..., "payload": ...}
+# (ghi bằng CAPTURE_PATH của bridge). Ví dụ:
+#   python replay.py capture.jsonl                        # tốc độ tối đa, ghi DB thật
+#   python replay.py capture.jsonl --speed 10 --no-db --topics topics.json
+# --topics: JSON {topic: {device_id, station_id, station_name, type, config, device_config}}, bỏ qua thì nạp từ Config DB
+# (--no-db không mở Config DB nên bắt buộc phải có --topics).
+# device_config (tùy chọn) = Device.config, VD {"encoding": "plaintext"}; bỏ qua → custom_aes.
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.capture import decode_record
+from app.clock import ReplayClock
+from app.database import ConfigSessionLocal
+from app.logging_setup import setup_logging
+from app.thresholds import compile_station_thresholds
+from app.modules.payload_decoder import decode_payload, resolve_encoding
+from mqtt_bridge import MQTTBridge
+
+logger = logging.getLogger(__name__)
+
+
+class NullWriter:
+    """Thay BulkWriter khi --no-db: chỉ đếm số bản ghi lẽ ra được ghi"""
+
+    def __init__(self):
+        self.stats = Counter()
+
+    def add_sensor_data(self, **row):
+        self.stats['sensor_rows'] += 1
+
+    def add_alert(self, **row):
+        self.stats['alert_rows'] += 1
+
+    def start(self, loop):
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+class NullHeartbeat(NullWriter):
+    def touch(self, device_id: int, station_id: int, timestamp: int):
+        self.stats['touches'] += 1
+
+
+def load_capture(path: str) -> List[tuple]:
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(decode_record(line))
+            except (ValueError, KeyError) as e:
+                logger.warning(f"⚠️ Skipping malformed capture line {line_no}: {e}")
+    # Thứ tự theo thời điểm nhận (sort ổn định: giữ thứ tự ghi khi trùng timestamp)
+    records.sort(key=lambda r: r[2])
+    return records
+
+
+async def prepare_bridge(args):
+    bridge = MQTTBridge(clock=ReplayClock(), config_session_factory=None if args.no_db else ConfigSessionLocal)
+
+    # Không đẩy WebSocket khi replay, chỉ đếm theo loại message
+    broadcasts = Counter()
+
+    async def count_broadcast(message: Dict[str, Any]):
+        broadcasts[message.get('type')] += 1
+
+    bridge.broadcast = count_broadcast
+
+    if args.no_db:
+        bridge.writer = NullWriter()
+        bridge.heartbeat = NullHeartbeat()
+        bridge.rollups = None
+
+    if args.topics:
+        with open(args.topics, 'r', encoding='utf-8') as f:
+            topic_map = json.load(f)
+        for info in topic_map.values():
+            info.setdefault('config', {})
+            info['thresholds'] = compile_station_thresholds(info['config'])
+            info['encoding'] = resolve_encoding(info.get('device_config'))
+        bridge.topic_map = topic_map
+        bridge.router.rebuild(topic_map)
+    else:
+        await bridge.reload_all_topics()
+    logger.info(f"📋 Replay topic map: {len(bridge.topic_map)} topics")
+    return bridge, broadcasts
+
+
+async def replay(args):
+    records = load_capture(args.capture)
+    if not records:
+        logger.error("❌ Capture is empty")
+        return
+
+    bridge, broadcasts = await prepare_bridge(args)
+    loop = asyncio.get_running_loop()
+    bridge.writer.start(loop)
+    bridge.heartbeat.start(loop)
+    if bridge.rollups:
+        bridge.rollups.start(loop)
+
+    t0 = records[0][2]
+    bridge.clock.now = t0
+    per_type = Counter()
+    latencies = []
+    skipped = 0
+
+    wall_start = time.perf_counter()
+    for topic, payload, received_at in records:
+        if args.speed > 0:
+            delay = (received_at - t0) / args.speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        info = bridge.router.resolve(topic)
+        if info is None:
+            skipped += 1
+            continue
+        record = decode_payload(info['type'], payload, info['encoding'])
+        if record is None:
+            skipped += 1
+            continue
+
+        bridge.clock.set(received_at)
+        started = time.perf_counter()
+        state = bridge.devices.entries.get(info['device_id'])
+        await bridge.process_pipeline(topic, record)
+        if state is None:
+            # Processor vừa được tạo: chờ nạp origin từ DB xong để kết quả không phụ thuộc timing
+            created = bridge.devices.entries.get(info['device_id'])
+            task = getattr(created.processor, 'origin_load_task', None) if created else None
+            if task is not None:
+                await task
+        latencies.append(time.perf_counter() - started)
+        per_type[info['type']] += 1
+
+    await bridge.backlog.flush_all()
+    elapsed = time.perf_counter() - wall_start
+    await bridge.writer.stop()
+    await bridge.heartbeat.stop()
+    if bridge.rollups:
+        await bridge.rollups.stop()
+
+    span = records[-1][2] - t0
+    lat_us = np.array(latencies) * 1e6 if latencies else np.zeros(1)
+    report = {
+        "messages": len(records),
+        "processed": sum(per_type.values()),
+        "skipped": skipped,
+        "per_type": dict(per_type),
+        "wall_seconds": round(elapsed, 3),
+        "capture_seconds": round(span, 3),
+        "msgs_per_second": round(len(records) / elapsed, 1) if elapsed else None,
+        "speedup": round(span / elapsed, 1) if elapsed else None,
+        "pipeline_latency_us": {
+            "p50": round(float(np.percentile(lat_us, 50)), 1),
+            "p99": round(float(np.percentile(lat_us, 99)), 1),
+            "max": round(float(lat_us.max()), 1)
+        },
+        "broadcasts": dict(broadcasts),
+        "writer": bridge.writer.get_stats()
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an MQTT capture through the ingest pipeline")
+    parser.add_argument("capture", help="File JSONL ghi bởi CAPTURE_PATH")
+    parser.add_argument("--speed", type=float, default=0.0, help="N x thời gian thực (0 = tốc độ tối đa)")
+    parser.add_argument("--topics", help="JSON topic map, bỏ qua để nạp từ Config DB")
+    parser.add_argument("--no-db", action="store_true", help="Không ghi Data DB/heartbeat, không đọc/ghi origin GNSS")
+    args = parser.parse_args()
+    if args.no_db and not args.topics:
+        parser.error("--no-db requires --topics (the topic map is otherwise loaded from the Config DB)")
+
+    setup_logging("REPLAY")
+    asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
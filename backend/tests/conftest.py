@@ -0,0 +1,5 @@
+# backend/tests/conftest.py - Chạy pytest từ backend/ hoặc thư mục gốc repo đều import được app/, processors/
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+# backend/tests/test_aes128.py - Roundtrip AES-128 tùy biến: T-table, NumPy batch, encrypt ↔ reference
+import random
+
+import pytest
+
+from aes128decrypt import (
+    BATCH_MIN_BLOCKS,
+    aes128_decrypt,
+    aes128_decrypt_base64,
+    aes128_decrypt_base64_batch,
+    aes128_decrypt_batch,
+    aes128_decrypt_reference,
+    aes128_encrypt,
+    aes128_encrypt_base64,
+    initialKey,
+)
+
+SEEDS = range(8)
+
+
+def _key(rng: random.Random, use_default: bool) -> bytes:
+    return bytes(initialKey) if use_default else bytes(rng.getrandbits(8) for _ in range(16))
+
+
+def _messages(rng: random.Random, count: int, max_len: int):
+    return [bytes(rng.getrandbits(8) for _ in range(rng.randint(0, max_len))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_table_decrypt_matches_reference(seed):
+    rng = random.Random(seed)
+    key = _key(rng, seed % 2 == 0)
+    for message in _messages(rng, 40, 100):
+        ciphertext = aes128_encrypt(message, key)
+        assert bytes(aes128_decrypt_reference(bytearray(ciphertext), key)) == message
+        assert bytes(aes128_decrypt(ciphertext, key)) == message
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_batch_numpy_path_matches_scalar(seed):
+    rng = random.Random(seed)
+    key = _key(rng, seed % 2 == 0)
+    messages = _messages(rng, 30, 100) + _messages(rng, 8, 200)
+    ciphertexts = [bytes(aes128_encrypt(m, key)) for m in messages]
+    assert sum(len(ct) for ct in ciphertexts) >= BATCH_MIN_BLOCKS * 16  # Đi nhánh NumPy
+
+    assert [bytes(p) for p in aes128_decrypt_batch(ciphertexts, key)] == messages
+
+
+def test_batch_below_threshold_uses_scalar_path():
+    messages = [b"short", b"", b"x" * 31]
+    ciphertexts = [bytes(aes128_encrypt(m)) for m in messages]
+    assert sum(len(ct) for ct in ciphertexts) < BATCH_MIN_BLOCKS * 16
+
+    assert [bytes(p) for p in aes128_decrypt_batch(ciphertexts)] == messages
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_decryptors_agree_on_random_ciphertext(seed):
+    # Padding thường không hợp lệ: mọi bộ giải mã phải cho cùng một kết quả từng byte
+    rng = random.Random(seed)
+    key = _key(rng, seed % 2 == 0)
+    small = [bytes(rng.getrandbits(8) for _ in range(16 * rng.randint(0, 6))) for _ in range(10)]
+    large = [bytes(rng.getrandbits(8) for _ in range(16 * 8)) for _ in range(BATCH_MIN_BLOCKS // 8 + 1)]
+    for batch in (small, large):
+        expected = [bytes(aes128_decrypt_reference(bytearray(ct), key)) for ct in batch]
+        assert [bytes(aes128_decrypt(ct, key)) for ct in batch] == expected
+        assert [bytes(p) for p in aes128_decrypt_batch(batch, key)] == expected
+
+
+def test_batch_invalid_length_yields_none():
+    good = bytes(aes128_encrypt(b"payload"))
+    results = aes128_decrypt_batch([good, good[:-1]] + [good] * BATCH_MIN_BLOCKS)
+    assert results[1] is None
+    assert bytes(results[0]) == b"payload"
+    assert all(bytes(r) == b"payload" for r in results[2:])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_base64_roundtrip(seed):
+    rng = random.Random(seed)
+    key = _key(rng, seed % 2 == 0)
+    texts = ["".join(chr(rng.randint(32, 0x24f)) for _ in range(rng.randint(0, 60))) for _ in range(20)]
+    encoded = [aes128_encrypt_base64(text, key) for text in texts]
+
+    assert [aes128_decrypt_base64(e, key).decode("utf-8") for e in encoded] == texts
+    assert [p.decode("utf-8") for p in aes128_decrypt_base64_batch([e.encode() for e in encoded], key)] == texts
+
+
+def test_base64_batch_invalid_item_yields_none():
+    results = aes128_decrypt_base64_batch([aes128_encrypt_base64("ok").encode(), b"abc"])  # base64 thiếu padding
+    assert bytes(results[0]) == b"ok"
+    assert results[1] is None
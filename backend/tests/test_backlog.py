@@ -0,0 +1,187 @@
+# backend/tests/test_backlog.py - Phát hiện đợt gửi dồn, flush khi im lặng, ngày UTC qua nửa đêm, thứ tự xử lý
+import asyncio
+
+import pytest
+
+from app.backlog import BacklogBuffer
+from app.clock import ReplayClock
+from app.device_time import DAY_SECONDS, utc_timestamp
+from mqtt_bridge import MQTTBridge
+
+T0 = 1_700_000_000.0
+MIDNIGHT = T0 - (T0 % DAY_SECONDS)
+
+
+async def _noop(topic, items):
+    pass
+
+
+def test_first_reading_uses_absolute_lag():
+    backlog = BacklogBuffer(_noop, lag_threshold_s=120)
+    assert not backlog.is_backlog('a', T0 - 30, T0)
+    assert backlog.is_backlog('b', T0 - 3600, T0)
+
+
+def test_lag_jump_starts_burst_and_catch_up_rate_keeps_it():
+    backlog = BacklogBuffer(_noop, lag_threshold_s=120, catchup_rate=10)
+    for i in range(5):
+        assert not backlog.is_backlog('dev', T0 + i - 1, T0 + i)
+    # Gateway kết nối lại: dữ liệu cũ 1h, giờ thiết bị tăng 60 s mỗi 0.1 s giờ nhận
+    arrival = T0 + 10
+    results = [backlog.is_backlog('dev', T0 - 3600 + 60 * i, arrival + 0.1 * i) for i in range(20)]
+    assert all(results)
+    # Đuổi kịp: trễ về dưới ngưỡng → hết đợt
+    assert not backlog.is_backlog('dev', arrival + 3, arrival + 3)
+    assert 'dev' not in backlog.bursts
+
+
+def test_steady_clock_skew_is_not_a_burst():
+    # RTC chậm cố định 10 phút: chỉ bản đo đầu tiên (chưa có lịch sử) bị coi là backlog
+    backlog = BacklogBuffer(_noop, lag_threshold_s=120, catchup_rate=10)
+    flags = [backlog.is_backlog('dev', T0 + i - 600, T0 + i) for i in range(30)]
+    assert flags[0]
+    assert not any(flags[1:])
+
+
+def test_burst_ends_when_device_time_slows_to_realtime():
+    backlog = BacklogBuffer(_noop, lag_threshold_s=120, catchup_rate=10)
+    assert backlog.is_backlog('dev', T0 - 3600, T0)
+    assert backlog.is_backlog('dev', T0 - 3000, T0 + 1)
+    # Trễ vẫn lớn nhưng giờ thiết bị chỉ tăng 1 s mỗi giây: tốc độ tính từ đầu đợt (600 s + k / k s)
+    # tụt dưới catchup_rate sau ~67 s → về nhịp realtime
+    flags = [backlog.is_backlog('dev', T0 - 3000 + k, T0 + 1 + k) for k in range(1, 100)]
+    assert all(flags[:60])
+    assert not flags[-1]
+    assert 'dev' not in backlog.bursts
+
+
+def test_quiet_timer_releases_backlog_and_held_readings_in_order():
+    batches = []
+
+    async def process_batch(topic, items):
+        batches.append((topic, [ts for ts, _ in items]))
+
+    async def scenario():
+        backlog = BacklogBuffer(process_batch, batch_size=100, quiet_s=0.2)
+        backlog.start(asyncio.get_running_loop())
+        for ts in (30.0, 10.0, 20.0):
+            backlog.add('dev', ts, {}, 100.0)
+        backlog.hold('dev', 50.0, {})
+        backlog.add('dev', 40.0, {}, 100.0)
+        await asyncio.sleep(0.05)
+        assert batches == []  # Chưa im lặng đủ lâu
+        await asyncio.sleep(0.4)
+        assert not backlog.in_burst('dev')
+        await backlog.stop()
+
+    asyncio.run(scenario())
+    assert batches == [('dev', [10.0, 20.0, 30.0, 40.0, 50.0])]
+
+
+def test_full_batch_does_not_release_held_readings():
+    batches = []
+
+    async def process_batch(topic, items):
+        batches.append([ts for ts, _ in items])
+
+    async def scenario():
+        backlog = BacklogBuffer(process_batch, batch_size=2)
+        backlog.add('dev', 1.0, {}, 100.0)
+        backlog.hold('dev', 100.0, {})
+        if backlog.add('dev', 2.0, {}, 100.0):
+            await backlog.flush('dev')
+        assert backlog.in_burst('dev')
+        backlog.add('dev', 3.0, {}, 100.0)
+        await backlog.flush_all()
+
+    asyncio.run(scenario())
+    assert batches == [[1.0, 2.0], [3.0, 100.0]]
+
+
+@pytest.mark.parametrize("seconds_of_day, reference, expected", [
+    # Bản tin 23:59:59 nhận lúc 00:00:05 → ngày hôm trước
+    (DAY_SECONDS - 1, MIDNIGHT + 5, MIDNIGHT - 1),
+    # Đồng hồ thiết bị nhanh 3 s: 00:00:01 nhận lúc 23:59:58 → ngày hôm sau
+    (1, MIDNIGHT - 2, MIDNIGHT + 1),
+    (3600, MIDNIGHT + 7200, MIDNIGHT + 3600),
+    # Vượt quá max_future_s → lùi về ngày hôm trước
+    (7200 + 400, MIDNIGHT + 7200, MIDNIGHT + 7600 - DAY_SECONDS),
+])
+def test_utc_timestamp_around_midnight(seconds_of_day, reference, expected):
+    assert utc_timestamp(seconds_of_day, reference, max_future_s=300) == expected
+
+
+def test_utc_timestamp_rejects_invalid_seconds():
+    assert utc_timestamp(None, T0) is None
+    assert utc_timestamp(-1, T0) is None
+    assert utc_timestamp(DAY_SECONDS + 1, T0) is None
+
+
+TOPIC = 'station/1/water'
+INFO = {
+    'device_id': 1, 'station_id': 1, 'station_name': 'S1', 'type': 'water',
+    'thresholds': {}, 'config': {}, 'encoding': None,
+}
+
+
+def _bridge():
+    clock = ReplayClock()
+    bridge = MQTTBridge(clock=clock, config_session_factory=None)
+    bridge.topic_map = {TOPIC: INFO}
+    bridge.router.rebuild(bridge.topic_map)
+    broadcasts = []
+
+    async def broadcast(message):
+        broadcasts.append(message)
+
+    bridge.broadcast = broadcast
+    processor = bridge.devices.get(1, 1, 'water').processor
+    seen = []
+    original = processor.process
+
+    def spy(payload, timestamp):
+        seen.append(timestamp)
+        return original(payload, timestamp)
+
+    processor.process = spy
+    return bridge, clock, seen
+
+
+async def _send(bridge, clock, arrival, ts):
+    clock.set(arrival)
+    await bridge._ingest_reading(TOPIC, INFO, {'value': 1.0, 'ts': ts})
+
+
+def test_realtime_interleaved_with_backlog_is_processed_in_order():
+    bridge, clock, seen = _bridge()
+
+    async def scenario():
+        arrival = T0
+        for i in range(5):
+            await _send(bridge, clock, arrival + 0.01 * i, T0 - 3600 + 60 * i)
+        # Bản đo realtime chen giữa đợt gửi dồn
+        await _send(bridge, clock, arrival + 0.05, T0)
+        for i in range(5, 10):
+            await _send(bridge, clock, arrival + 0.01 * i, T0 - 3600 + 60 * i)
+        assert seen == []
+        await bridge.backlog.flush_all()
+
+    asyncio.run(scenario())
+    assert len(seen) == 11
+    assert seen == sorted(seen)
+    assert seen[-1] == int(T0)
+
+
+def test_backlog_older_than_processed_reading_skips_processor():
+    bridge, clock, seen = _bridge()
+
+    async def scenario():
+        await _send(bridge, clock, T0, T0)
+        for i in range(3):
+            await _send(bridge, clock, T0 + 0.01 * (i + 1), T0 - 3600 + 60 * i)
+        await bridge.backlog.flush_all()
+        await _send(bridge, clock, T0 + 1, T0 + 1)
+
+    asyncio.run(scenario())
+    # Processor không bao giờ nhận bản đo ngược chiều thời gian (dt âm)
+    assert seen == [int(T0), int(T0 + 1)]
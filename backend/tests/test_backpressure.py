@@ -0,0 +1,92 @@
+# backend/tests/test_backpressure.py - Bản tin đã ack không bị bỏ: decode stage chờ ingest queue đầy
+import asyncio
+import json
+
+from app.decode_stage import DecodeStage
+from app.ingest_queue import IngestQueue
+from app.modules.payload_decoder import ENCODING_PLAINTEXT
+
+PLAINTEXT = (ENCODING_PLAINTEXT, None, None)
+
+
+def _payload(i: int) -> bytes:
+    return json.dumps({"seq": i}).encode()
+
+
+async def _consume(decoder: DecodeStage, count: int, topics):
+    # Giống MQTTBridge._consume_messages: chờ chỗ rồi mới nhận, chỉ ack bản tin được nhận
+    acked = []
+    for i in range(count):
+        if decoder.full():
+            await decoder.wait_for_room()
+        topic = topics[i % len(topics)]
+        if decoder.submit(topic, 'water', _payload(i), PLAINTEXT):
+            acked.append((topic, i))
+    return acked
+
+
+def test_full_ingest_queue_backpressures_instead_of_dropping():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        release = asyncio.Event()
+        processed = []
+
+        async def handler(topic, record):
+            await release.wait()
+            processed.append((topic, record['seq']))
+
+        ingest = IngestQueue(handler, num_workers=2, max_size=8, overflow_policy='drop_oldest')
+        decoder = DecodeStage(
+            lambda topic, record: ingest.put(topic, (topic, record)),
+            workers=0, batch_size=4, batch_interval_ms=1, max_pending=8
+        )
+        ingest.start(loop)
+        decoder.start(loop)
+
+        topics = ['dev/a', 'dev/b', 'dev/c']
+        consumer = loop.create_task(_consume(decoder, 200, topics))
+        await asyncio.sleep(0.2)
+        # Handler bị chặn: ingest queue đầy, decode stage đầy, consumer phải đang chờ
+        assert not consumer.done()
+        assert decoder.full()
+        assert ingest.stats['waits'] > 0
+
+        release.set()
+        acked = await asyncio.wait_for(consumer, timeout=5.0)
+        await decoder.stop()
+        await ingest.stop()
+        return acked, processed, ingest.stats, decoder.stats
+
+    acked, processed, ingest_stats, decoder_stats = asyncio.run(scenario())
+    assert len(acked) == 200
+    assert ingest_stats['dropped'] == 0
+    assert decoder_stats['dropped'] == 0
+    assert sorted(processed) == sorted(acked)
+    # Thứ tự theo từng topic được giữ nguyên
+    for topic in ('dev/a', 'dev/b', 'dev/c'):
+        assert [i for t, i in processed if t == topic] == [i for t, i in acked if t == topic]
+
+
+def test_put_nowait_sink_still_applies_overflow_policy():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        release = asyncio.Event()
+
+        async def handler(topic, record):
+            await release.wait()
+
+        ingest = IngestQueue(handler, num_workers=1, max_size=4, overflow_policy='drop_oldest')
+        decoder = DecodeStage(lambda topic, record: ingest.put_nowait(topic, (topic, record)), workers=0, batch_size=1)
+        ingest.start(loop)
+        decoder.start(loop)
+        for i in range(20):
+            decoder.submit('dev/a', 'water', _payload(i), PLAINTEXT)
+        await asyncio.sleep(0.05)
+        release.set()
+        await decoder.stop()
+        await ingest.stop()
+        return ingest.stats
+
+    stats = asyncio.run(scenario())
+    assert stats['dropped'] > 0
+    assert stats['waits'] == 0
@@ -0,0 +1,45 @@
+# backend/tests/test_bridge_wiring.py - MQTTBridge dùng đúng các điểm inject (replay offline)
+import asyncio
+
+import pytest
+
+from app.config import settings
+from mqtt_bridge import MQTTBridge
+
+
+class _Result:
+    def all(self):
+        return []
+
+
+class _FakeSession:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.calls.append(statement)
+        return _Result()
+
+
+def test_query_devices_uses_injected_session_factory():
+    calls = []
+    bridge = MQTTBridge(config_session_factory=lambda: _FakeSession(calls))
+    assert asyncio.run(bridge._query_devices()) == []
+    assert len(calls) == 1
+
+
+def test_query_devices_without_config_db_fails_fast():
+    bridge = MQTTBridge(config_session_factory=None)
+    with pytest.raises(RuntimeError):
+        asyncio.run(bridge._query_devices())
+
+
+def test_shard_workers_decode_inline():
+    assert MQTTBridge(shard_index=1, shard_count=4, config_session_factory=None).decoder.workers == 0
+    assert MQTTBridge(config_session_factory=None).decoder.workers == max(0, settings.DECODE_WORKERS)
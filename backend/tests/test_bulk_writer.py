@@ -0,0 +1,132 @@
+# backend/tests/test_bulk_writer.py - Bulk writer: chia lô, lỗi tạm thời trả lô về đầu buffer, giới hạn buffer
+import asyncio
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.bulk_writer import BulkWriter
+
+
+class _FakeConnection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def execute(self, statement, rows):
+        if self.engine.failures:
+            error = self.engine.failures.pop(0)
+            if error is not None:
+                raise error
+        self.engine.batches.append((statement.table.name, [row['seq'] for row in rows]))
+
+
+class _FakeBegin:
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def __aenter__(self):
+        return _FakeConnection(self.engine)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _FakeEngine:
+    """engine.begin() → connection ghi lại từng INSERT; `failures` = lỗi lần lượt cho các lần execute"""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.batches = []
+
+    def begin(self):
+        return _FakeBegin(self)
+
+
+def _transient():
+    return OperationalError("INSERT", {}, ConnectionError("server closed the connection"))
+
+
+def _writer(engine, **kwargs) -> BulkWriter:
+    writer = BulkWriter(engine, **kwargs)
+    writer._flush_lock = asyncio.Lock()  # Như start() nhưng không chạy task định kỳ
+    return writer
+
+
+def _add_sensor(writer: BulkWriter, count: int, start: int = 0):
+    for seq in range(start, start + count):
+        writer.add_sensor_data(seq=seq, station_id=1, timestamp=seq, sensor_type='water', data={})
+
+
+def test_flush_splits_buffer_into_max_batch_rows_chunks():
+    engine = _FakeEngine()
+    writer = _writer(engine, max_batch_rows=5)
+    _add_sensor(writer, 12)
+    writer.add_alert(seq=100, station_id=1, timestamp=1)
+
+    asyncio.run(writer.flush())
+    assert engine.batches == [
+        ('sensor_data', [0, 1, 2, 3, 4]),
+        ('sensor_data', [5, 6, 7, 8, 9]),
+        ('sensor_data', [10, 11]),
+        ('alerts', [100]),
+    ]
+    assert writer.pending() == 0
+    assert writer.stats['sensor_rows_written'] == 12
+    assert writer.stats['alert_rows_written'] == 1
+    assert writer.stats['flushes'] == 4
+
+
+def test_transient_error_puts_chunk_back_at_head():
+    # Lô đầu thành công, lô thứ hai lỗi tạm thời
+    engine = _FakeEngine(failures=[None, _transient()])
+    writer = _writer(engine, max_batch_rows=4)
+    _add_sensor(writer, 10)
+
+    asyncio.run(writer.flush())
+    assert engine.batches == [('sensor_data', [0, 1, 2, 3])]
+    assert [row['seq'] for row in writer.sensor_rows] == list(range(4, 10))
+    assert writer.stats['retries'] == 1
+    assert writer._failures == 1
+
+    # Bản ghi mới đến trong lúc DB lỗi nằm sau phần được trả lại
+    _add_sensor(writer, 2, start=10)
+    asyncio.run(writer.flush())
+    assert engine.batches[1:] == [('sensor_data', [4, 5, 6, 7]), ('sensor_data', [8, 9, 10, 11])]
+    assert writer.pending() == 0
+    assert writer._failures == 0
+
+
+def test_permanent_error_drops_only_that_chunk():
+    engine = _FakeEngine(failures=[IntegrityError("INSERT", {}, Exception("bad row"))])
+    writer = _writer(engine, max_batch_rows=3)
+    _add_sensor(writer, 6)
+
+    asyncio.run(writer.flush())
+    assert engine.batches == [('sensor_data', [3, 4, 5])]
+    assert writer.stats['rows_dropped'] == 3
+    assert writer.pending() == 0
+
+
+def test_buffer_limit_drops_oldest_sensor_rows_and_keeps_alerts():
+    engine = _FakeEngine()
+    writer = _writer(engine, max_batch_rows=2, max_buffer_rows=5)
+    writer.add_alert(seq=100, station_id=1, timestamp=0)
+    _add_sensor(writer, 8)
+
+    assert writer.pending() == 5
+    assert [row['seq'] for row in writer.sensor_rows] == [4, 5, 6, 7]
+    assert [row['seq'] for row in writer.alert_rows] == [100]
+    assert writer.stats['rows_dropped'] == 4
+
+    asyncio.run(writer.flush())
+    assert engine.batches == [('sensor_data', [4, 5]), ('sensor_data', [6, 7]), ('alerts', [100])]
+
+
+def test_full_batch_wakes_flush_task():
+    async def scenario():
+        writer = _writer(_FakeEngine(), max_batch_rows=3)
+        writer._wakeup = asyncio.Event()
+        _add_sensor(writer, 2)
+        assert not writer._wakeup.is_set()
+        _add_sensor(writer, 1, start=2)
+        return writer._wakeup.is_set()
+
+    assert asyncio.run(scenario())
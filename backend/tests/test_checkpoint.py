@@ -0,0 +1,145 @@
+# backend/tests/test_checkpoint.py - Checkpoint warm restart: định dạng an toàn, roundtrip, từ chối version lệch
+import asyncio
+import json
+import pickle
+
+import numpy as np
+import pytest
+
+from app import checkpoint as checkpoint_module
+from app.checkpoint import CHECKPOINT_VERSION, StateCheckpointer
+from app.device_state import DeviceStateRegistry
+from app.landslide_analyzer import LandslideAnalyzer
+from processors.geodesy import enu_to_geodetic
+from processors.gnss_processor import GNSSVelocityProcessor
+from processors.nmea import GNSSFix
+from processors.water_processor import WaterEngine
+
+ORIGIN = (21.0205750, 105.8446483, 25.123)
+
+
+def _factory(device_id, sensor_type):
+    if sensor_type == 'gnss':
+        return GNSSVelocityProcessor(device_id, None, required_points=5, max_spread_m=0.05, filter_window_size=3)
+    return WaterEngine()
+
+
+class _Bridge:
+    def __init__(self, path):
+        self.analyzer = LandslideAnalyzer()
+        self.checkpoint = StateCheckpointer(self, str(path))
+        self.devices = DeviceStateRegistry(_factory, on_create=self.checkpoint.restore_device)
+
+
+def _feed_gnss(processor: GNSSVelocityProcessor, count: int):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        lat, lon, h = enu_to_geodetic(rng.normal(0.0, 0.003, 3) + [0.001 * i, 0, 0], *ORIGIN)
+        processor.process_gngga(GNSSFix("GN", 0.0, float(lat), float(lon), float(h), 4, 18, 0.7), ts=1000.0 + i)
+
+
+def _saved_bridge(path):
+    bridge = _Bridge(path)
+    gnss = bridge.devices.get(1, 10, 'gnss')
+    _feed_gnss(gnss.processor, 12)  # 5 điểm khóa gốc + 7 điểm → ring buffer (4 ô) đã quay vòng
+    gnss.last_save_time = 1234.5
+    water = bridge.devices.get(2, 10, 'water')
+    water.processor.process({"value": 1.25}, 1000.0)
+    bridge.analyzer.alert_counters[10]['rain'] = {'count': 2, 'last_level': 'WARNING'}
+    asyncio.run(bridge.checkpoint.save())
+    assert bridge.checkpoint.stats['saves'] == 1
+    return bridge
+
+
+def test_roundtrip_restores_processor_state(tmp_path):
+    path = tmp_path / "state.ckpt"
+    saved = _saved_bridge(path)
+    before = saved.devices.entries[1].processor.get_state()
+
+    restored = _Bridge(path)
+    restored.checkpoint.load()
+    assert restored.analyzer.alert_counters[10]['rain'] == {'count': 2, 'last_level': 'WARNING'}
+
+    gnss = restored.devices.get(1, 10, 'gnss')
+    assert gnss.last_save_time == 1234.5
+    after = gnss.processor.get_state()
+    assert after['state'] == "ORIGIN_LOCKED"
+    for key in ('ts', 'ecef', 'wgs'):
+        np.testing.assert_array_equal(after['history'][key], before['history'][key])
+    np.testing.assert_array_equal(after['origin']['ecef'], before['origin']['ecef'])
+    assert after['estimator'] == before['estimator']
+    assert after['stats'] == before['stats']
+
+    water = restored.devices.get(2, 10, 'water')
+    assert water.processor.last_valid_value == 1.25
+    assert restored.checkpoint.stats['restored_processors'] == 2
+
+
+def test_file_is_npz_without_pickle(tmp_path):
+    path = tmp_path / "state.ckpt"
+    _saved_bridge(path)
+    with np.load(path, allow_pickle=False) as archive:
+        assert set(archive.files) == {'meta', 'data'}
+        meta = json.loads(archive['meta'].tobytes())
+        assert archive['data'].dtype == np.float64
+    assert meta['version'] == CHECKPOINT_VERSION
+    entry = meta['processors']['device_1']
+    assert entry['kind'] == 'GNSSVelocityProcessor'
+    assert entry['version'] == GNSSVelocityProcessor.STATE_VERSION
+
+
+_EXECUTED = []
+
+
+class _Payload:
+    def __reduce__(self):
+        return (_EXECUTED.append, ("pwned",))
+
+
+def test_pickle_file_is_not_executed(tmp_path):
+    path = tmp_path / "state.ckpt"
+    path.write_bytes(pickle.dumps({'version': CHECKPOINT_VERSION, 'payload': _Payload()}))
+    bridge = _Bridge(path)
+    bridge.checkpoint.load()
+    assert _EXECUTED == []
+    assert bridge.checkpoint.pending_processors == {}
+
+
+def test_checkpoint_version_mismatch_is_rejected(tmp_path, monkeypatch):
+    path = tmp_path / "state.ckpt"
+    _saved_bridge(path)
+    monkeypatch.setattr(checkpoint_module, 'CHECKPOINT_VERSION', CHECKPOINT_VERSION + 1)
+    bridge = _Bridge(path)
+    bridge.checkpoint.load()
+    assert bridge.checkpoint.pending_processors == {}
+    assert 10 not in bridge.analyzer.alert_counters
+
+
+def test_processor_state_version_mismatch_is_rejected(tmp_path, monkeypatch):
+    path = tmp_path / "state.ckpt"
+    _saved_bridge(path)
+    monkeypatch.setattr(GNSSVelocityProcessor, 'STATE_VERSION', GNSSVelocityProcessor.STATE_VERSION + 1)
+
+    bridge = _Bridge(path)
+    bridge.checkpoint.load()
+    gnss = bridge.devices.get(1, 10, 'gnss')
+    assert gnss.processor.state == "AWAITING_CANDIDATES"
+    assert gnss.processor.estimator.count == 0
+    assert bridge.checkpoint.stats['rejected_processors'] == 1
+    # Processor khác không bị ảnh hưởng
+    assert bridge.devices.get(2, 10, 'water').processor.last_valid_value == 1.25
+
+
+def test_stale_checkpoint_is_ignored(tmp_path):
+    path = tmp_path / "state.ckpt"
+    _saved_bridge(path)
+    bridge = _Bridge(path)
+    bridge.checkpoint.max_age_s = -1
+    bridge.checkpoint.load()
+    assert bridge.checkpoint.pending_processors == {}
+
+
+@pytest.mark.parametrize("value", [{1: 'int key'}, object()])
+def test_unsupported_values_fail_to_pack(value):
+    with pytest.raises(TypeError):
+        checkpoint_module._ArrayPacker().pack({'state': value})
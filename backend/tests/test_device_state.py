@@ -0,0 +1,113 @@
+# backend/tests/test_device_state.py - Registry trạng thái thiết bị: LRU, retain theo topic map, TTL im lặng
+from app import device_state
+from app.device_state import DeviceStateRegistry, deep_sizeof
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _registry(monkeypatch, **kwargs):
+    clock = _Clock()
+    monkeypatch.setattr(device_state.time, 'monotonic', clock.monotonic)
+    created = []
+
+    def factory(device_id, sensor_type):
+        if sensor_type == 'unknown':
+            return None
+        created.append(device_id)
+        return {'device_id': device_id, 'type': sensor_type}
+
+    return DeviceStateRegistry(factory, **kwargs), clock, created
+
+
+def test_get_creates_lazily_and_reuses_state(monkeypatch):
+    registry, _, created = _registry(monkeypatch)
+    first = registry.get(1, 10, 'gnss')
+    assert registry.get(1, 10, 'gnss') is first
+    assert created == [1]
+    assert registry.get(2, 10, 'unknown') is None
+    assert len(registry) == 1
+
+
+def test_sensor_type_or_station_change_recreates_state(monkeypatch):
+    registry, _, created = _registry(monkeypatch)
+    first = registry.get(1, 10, 'gnss')
+    assert registry.get(1, 10, 'rain') is not first
+    assert registry.get(1, 11, 'rain').station_id == 11
+    assert created == [1, 1, 1]
+    assert len(registry) == 1
+
+
+def test_lru_evicts_least_recently_used(monkeypatch):
+    registry, _, _ = _registry(monkeypatch, max_devices=3)
+    for device_id in (1, 2, 3):
+        registry.get(device_id, 10, 'water')
+    registry.get(1, 10, 'water')  # 1 vừa được dùng → 2 là cũ nhất
+    registry.get(4, 10, 'water')
+    assert list(registry.entries) == [3, 1, 4]
+    registry.get(5, 10, 'water')
+    assert list(registry.entries) == [1, 4, 5]
+    assert registry.stats['evicted_lru'] == 2
+
+
+def test_retain_keeps_only_active_devices(monkeypatch):
+    registry, _, _ = _registry(monkeypatch)
+    for device_id in range(1, 6):
+        registry.get(device_id, 10, 'water')
+    assert registry.retain([2, 4, 99]) == 3
+    assert list(registry.entries) == [2, 4]
+    assert registry.stats['evicted_removed'] == 3
+    assert registry.retain(iter([2, 4])) == 0
+
+
+def test_evict_idle_uses_ttl_from_last_seen(monkeypatch):
+    registry, clock, created = _registry(monkeypatch, idle_ttl_s=60)
+    registry.get(1, 10, 'water')
+    clock.now += 30
+    registry.get(2, 10, 'water')
+    clock.now += 20
+    registry.get(3, 10, 'water')
+    clock.now += 20
+    registry.get(2, 10, 'water')  # Được dùng lại: thứ tự [1, 3, 2]
+
+    # Ngay tại ngưỡng (last_seen == cutoff) vẫn được giữ
+    clock.now = 1060.0
+    assert registry.evict_idle() == 0
+    clock.now = 1061.0
+    assert registry.evict_idle() == 1
+    assert list(registry.entries) == [3, 2]
+
+    clock.now = 1000.0 + 50 + 61
+    assert registry.evict_idle() == 1
+    assert list(registry.entries) == [2]
+    assert registry.stats['evicted_idle'] == 2
+
+    # Thiết bị bị xóa vì im lặng được tạo lại khi có dữ liệu
+    registry.get(1, 10, 'water')
+    assert created == [1, 2, 3, 1]
+
+
+def test_evict_idle_disabled_with_zero_ttl(monkeypatch):
+    registry, clock, _ = _registry(monkeypatch, idle_ttl_s=0)
+    registry.get(1, 10, 'water')
+    clock.now += 10 ** 9
+    assert registry.evict_idle() == 0
+    assert len(registry) == 1
+
+
+def test_on_create_hook_and_memory_report(monkeypatch):
+    registry, _, _ = _registry(monkeypatch)
+    hooked = []
+    registry.on_create = lambda state: hooked.append(state.device_id)
+    registry.get(1, 10, 'water')
+    registry.get(1, 10, 'water')
+    assert hooked == [1]
+
+    report = registry.memory_report()
+    assert report['dict']['count'] == 1
+    assert report['dict']['bytes'] >= deep_sizeof(registry.entries[1].processor)
@@ -0,0 +1,86 @@
+# backend/tests/test_geodesy.py - WGS84 ↔ ECEF ↔ ENU: roundtrip, một điểm == cùng điểm trong lô
+import numpy as np
+import pytest
+
+from processors.geodesy import (
+    A_WGS84,
+    B_WGS84,
+    displacement,
+    ecef_to_enu,
+    ecef_to_geodetic,
+    enu_rotation,
+    enu_to_ecef,
+    enu_to_geodetic,
+    geodetic_to_ecef,
+    geodetic_to_enu,
+)
+
+ORIGIN = (21.0205750, 105.8446483, 25.123)
+
+
+def _points(seed: int, count: int):
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(-89.0, 89.0, count)
+    lon = rng.uniform(-180.0, 180.0, count)
+    h = rng.uniform(-100.0, 5000.0, count)
+    return lat, lon, h
+
+
+def test_ecef_reference_points():
+    np.testing.assert_allclose(geodetic_to_ecef(0.0, 0.0, 0.0), [A_WGS84, 0.0, 0.0], atol=1e-9)
+    np.testing.assert_allclose(geodetic_to_ecef(90.0, 0.0, 0.0), [0.0, 0.0, B_WGS84], atol=1e-6)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_geodetic_ecef_roundtrip(seed):
+    lat, lon, h = _points(seed, 500)
+    lat2, lon2, h2 = ecef_to_geodetic(geodetic_to_ecef(lat, lon, h))
+    np.testing.assert_allclose(lat2, lat, atol=1e-9)
+    np.testing.assert_allclose(lon2, lon, atol=1e-9)
+    np.testing.assert_allclose(h2, h, atol=1e-6)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_enu_roundtrip(seed):
+    rng = np.random.default_rng(seed)
+    enu = rng.uniform(-500.0, 500.0, (200, 3))
+    lat, lon, h = enu_to_geodetic(enu, *ORIGIN)
+    np.testing.assert_allclose(geodetic_to_enu(lat, lon, h, *ORIGIN), enu, atol=1e-6)
+
+    origin_ecef = geodetic_to_ecef(*ORIGIN)
+    rotation = enu_rotation(ORIGIN[0], ORIGIN[1])
+    np.testing.assert_allclose(
+        ecef_to_enu(enu_to_ecef(enu, origin_ecef, rotation), origin_ecef, rotation), enu, atol=1e-8
+    )
+
+
+def test_enu_rotation_is_orthonormal():
+    rotation = enu_rotation(ORIGIN[0], ORIGIN[1])
+    np.testing.assert_allclose(rotation @ rotation.T, np.eye(3), atol=1e-15)
+
+
+def test_single_point_is_bit_identical_to_batch():
+    lat, lon, h = _points(7, 1000)
+    origin_ecef = geodetic_to_ecef(*ORIGIN)
+    rotation = enu_rotation(ORIGIN[0], ORIGIN[1])
+
+    ecef_batch = geodetic_to_ecef(lat, lon, h)
+    enu_batch, dist_batch = displacement(ecef_batch, origin_ecef, rotation)
+    lat_batch, lon_batch, h_batch = ecef_to_geodetic(ecef_batch)
+    for i in (0, 1, 499, 999):
+        ecef = geodetic_to_ecef(lat[i], lon[i], h[i])
+        assert np.array_equal(ecef, ecef_batch[i])
+        enu, dist = displacement(ecef, origin_ecef, rotation)
+        assert np.array_equal(enu, enu_batch[i])
+        assert dist == dist_batch[i]
+        assert ecef_to_geodetic(ecef) == (lat_batch[i], lon_batch[i], h_batch[i])
+
+
+def test_displacement_distance_is_enu_norm():
+    origin_ecef = geodetic_to_ecef(*ORIGIN)
+    rotation = enu_rotation(ORIGIN[0], ORIGIN[1])
+    enu_expected = np.array([[3.0, 4.0, 0.0], [0.0, 0.0, -2.0], [0.0, 0.0, 0.0]])
+
+    enu, dist = displacement(enu_to_ecef(enu_expected, origin_ecef, rotation), origin_ecef, rotation)
+    np.testing.assert_allclose(enu, enu_expected, atol=1e-8)
+    np.testing.assert_allclose(dist, [5.0, 2.0, 0.0], atol=1e-8)
@@ -0,0 +1,96 @@
+# backend/tests/test_gnss_filter.py - Bộ lọc vận tốc GNSS: ring buffer + tổng chạy khớp cách duyệt deque cũ
+from collections import deque
+
+import numpy as np
+import pytest
+
+from processors.geodesy import enu_to_geodetic, geodetic_to_ecef
+from processors.gnss_processor import GNSSVelocityProcessor
+from processors.nmea import GNSSFix
+
+ORIGIN = (21.0205750, 105.8446483, 25.123)
+
+
+def _fix(enu) -> GNSSFix:
+    lat, lon, h = enu_to_geodetic(np.asarray(enu, dtype=np.float64), *ORIGIN)
+    return GNSSFix("GN", 0.0, float(lat), float(lon), float(h), 4, 18, 0.7)
+
+
+class _DequeFilter:
+    """Bộ lọc trước khi chuyển sang ring buffer: duyệt lại cả deque ở mỗi bản đo"""
+
+    def __init__(self, window: int, R):
+        self.window = window
+        self.R = R
+        self.history = deque(maxlen=window + 1)
+
+    def push(self, ts, ecef):
+        self.history.append({'ts': ts, 'ecef': ecef})
+        if len(self.history) < 2:
+            return None
+        p_new, p_old = self.history[-1], self.history[-2]
+        dt = p_new['ts'] - p_old['ts']
+        if dt < 0.01:
+            return None
+        v_enu_raw = self.R @ ((p_new['ecef'] - p_old['ecef']) / dt)
+        if len(self.history) < self.window:
+            return v_enu_raw
+        velocities = []
+        for i in range(1, len(self.history)):
+            p1, p0 = self.history[i], self.history[i - 1]
+            idt = p1['ts'] - p0['ts']
+            if idt >= 0.01:
+                velocities.append(self.R @ ((p1['ecef'] - p0['ecef']) / idt))
+        return np.mean(velocities, axis=0) if velocities else v_enu_raw
+
+
+def _locked(window: int) -> GNSSVelocityProcessor:
+    processor = GNSSVelocityProcessor(1, None, required_points=5, max_spread_m=0.05, filter_window_size=window)
+    noise = np.random.default_rng(0).normal(0.0, 0.002, (5, 3))
+    results = [processor.process_gngga(_fix(enu), ts=float(i)) for i, enu in enumerate(noise)]
+    assert results[-1]['type'] == 'origin_locked'
+    return processor
+
+
+@pytest.mark.parametrize("window", [1, 3, 5, 8])
+def test_ring_buffer_matches_deque_filter_across_wraparound(window):
+    processor = _locked(window)
+    reference = _DequeFilter(window, processor.origin['R'])
+    rng = np.random.default_rng(window)
+
+    ts = 100.0
+    compared = 0
+    for i in range(20 * (window + 1)):
+        # Bước thời gian không đều, thỉnh thoảng trùng timestamp (dt < 0.01 → bỏ cặp vận tốc đó)
+        ts += 0.0 if i % 7 == 3 else float(rng.uniform(0.5, 2.0))
+        enu = np.array([0.002 * i, -0.001 * i, 0.0]) + rng.normal(0.0, 0.003, 3)
+        fix = _fix(enu)
+
+        result = processor.process_gngga(fix, ts=ts)
+        expected = reference.push(ts, geodetic_to_ecef(fix.lat, fix.lon, fix.h))
+        if expected is None:
+            assert result is None
+            continue
+        data = result['data']
+        np.testing.assert_allclose([data['vel_e'], data['vel_n'], data['vel_u']], expected, rtol=1e-9, atol=1e-12)
+        compared += 1
+    assert compared > 10 * (window + 1)
+
+
+def test_running_sum_does_not_drift_over_long_runs():
+    processor = GNSSVelocityProcessor(1, None, filter_window_size=5)
+    rng = np.random.default_rng(1)
+    worst = 0.0
+    for i in range(100_000):
+        # Đợt nhiễu cực lớn (1e8) xen giữa các đoạn dài vận tốc nhỏ (1e-3): cộng/trừ liên tục để lại
+        # phần dư cỡ ulp(1e8) trong tổng chạy nếu không tính lại tổng theo chu kỳ
+        phase = i % 50
+        scale = 1e8 if phase < 6 else 1e-3
+        velocity = None if i % 13 == 0 else rng.normal(0.0, scale, 3)
+        processor._push_velocity(velocity)
+        if phase >= 20:  # Cửa sổ chỉ còn vận tốc nhỏ
+            exact = processor._vel[processor._vel_ok].sum(axis=0)
+            assert processor._vel_count == int(processor._vel_ok.sum())
+            worst = max(worst, float(np.abs(processor._vel_sum - exact).max()))
+    # Sai số chỉ cỡ ulp của vận tốc nhỏ, không mang phần dư của các đợt lớn và không tăng theo thời gian
+    assert worst < 1e-12
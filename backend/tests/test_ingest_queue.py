@@ -0,0 +1,140 @@
+# backend/tests/test_ingest_queue.py - Overflow policy, shard crc32 giữ thứ tự theo topic, drain khi dừng
+import asyncio
+import time
+import zlib
+
+import pytest
+
+from app.ingest_queue import IngestQueue
+
+
+def _blocked_queue(policy: str, max_size: int = 3):
+    release = asyncio.Event()
+    processed = []
+
+    async def handler(topic, seq):
+        await release.wait()
+        processed.append(seq)
+
+    queue = IngestQueue(handler, num_workers=1, max_size=max_size, overflow_policy=policy)
+    return queue, release, processed
+
+
+@pytest.mark.parametrize("policy, expected", [
+    # Worker giữ bản tin 0; hàng đợi 3 chỗ nhận 1..9
+    ('drop_oldest', [0, 7, 8, 9]),
+    ('drop_newest', [0, 1, 2, 3]),
+])
+def test_overflow_policy(policy, expected):
+    async def scenario():
+        queue, release, processed = _blocked_queue(policy)
+        queue.start(asyncio.get_running_loop())
+        queue.put_nowait('dev/a', ('dev/a', 0))
+        await asyncio.sleep(0)  # Worker lấy bản tin 0 rồi chờ handler
+        for seq in range(1, 10):
+            queue.put_nowait('dev/a', ('dev/a', seq))
+        assert queue.depth() == 3
+        release.set()
+        await queue.stop()
+        return processed, queue.stats
+
+    processed, stats = asyncio.run(scenario())
+    assert processed == expected
+    assert stats['dropped'] == 6
+    assert stats['processed'] == 4
+
+
+def test_invalid_policy_is_rejected():
+    with pytest.raises(ValueError):
+        IngestQueue(lambda *a: None, overflow_policy='block')
+
+
+def test_topics_are_sharded_by_crc32_and_keep_order():
+    topics = [f"station/{i}/gnss" for i in range(12)]
+    processed = []
+
+    async def handler(topic, seq):
+        await asyncio.sleep(0.001 * (seq % 3))  # Thời gian xử lý khác nhau giữa các bản tin
+        processed.append((topic, seq))
+
+    async def scenario():
+        queue = IngestQueue(handler, num_workers=4, max_size=1000)
+        for topic in topics:
+            assert queue._shard(topic) == zlib.crc32(topic.encode('utf-8')) % 4
+        assert len({queue._shard(topic) for topic in topics}) > 1
+        queue.start(asyncio.get_running_loop())
+        for seq in range(20):
+            for topic in topics:
+                queue.put_nowait(topic, (topic, seq))
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert len(processed) == 20 * len(topics)
+    for topic in topics:
+        assert [seq for t, seq in processed if t == topic] == list(range(20))
+
+
+def test_shard_is_stable_across_instances():
+    first = IngestQueue(lambda *a: None, num_workers=8)
+    second = IngestQueue(lambda *a: None, num_workers=8)
+    assert [first._shard(f"t/{i}") for i in range(50)] == [second._shard(f"t/{i}") for i in range(50)]
+
+
+def test_stop_drains_pending_messages():
+    processed = []
+
+    async def handler(topic, seq):
+        await asyncio.sleep(0.001)
+        processed.append(seq)
+
+    async def scenario():
+        queue = IngestQueue(handler, num_workers=2, max_size=100)
+        queue.start(asyncio.get_running_loop())
+        for seq in range(50):
+            queue.put_nowait(f"dev/{seq % 5}", (f"dev/{seq % 5}", seq))
+        await queue.stop(drain_timeout=5.0)
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert sorted(processed) == list(range(50))
+    assert queue.workers == []
+
+
+def test_stop_gives_up_after_drain_timeout():
+    async def handler(topic, seq):
+        await asyncio.Event().wait()  # Không bao giờ xong
+
+    async def scenario():
+        queue = IngestQueue(handler, num_workers=1, max_size=10)
+        queue.start(asyncio.get_running_loop())
+        for seq in range(3):
+            queue.put_nowait('dev/a', ('dev/a', seq))
+        started = time.monotonic()
+        await queue.stop(drain_timeout=0.1)
+        return queue, time.monotonic() - started
+
+    queue, elapsed = asyncio.run(scenario())
+    assert elapsed < 1.0
+    assert queue.workers == []
+    assert queue.stats['processed'] == 0
+
+
+def test_handler_errors_are_counted_and_worker_continues():
+    processed = []
+
+    async def handler(topic, seq):
+        if seq == 1:
+            raise RuntimeError("boom")
+        processed.append(seq)
+
+    async def scenario():
+        queue = IngestQueue(handler, num_workers=1, max_size=10)
+        queue.start(asyncio.get_running_loop())
+        for seq in range(3):
+            queue.put_nowait('dev/a', ('dev/a', seq))
+        await queue.stop()
+        return queue.stats
+
+    stats = asyncio.run(scenario())
+    assert processed == [0, 2]
+    assert stats['errors'] == 1
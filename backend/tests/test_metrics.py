@@ -0,0 +1,96 @@
+# backend/tests/test_metrics.py - Text exposition Prometheus + gộp metrics relay từ worker shard
+import asyncio
+import io
+import json
+
+from app import sharding
+from app.metrics import MetricsRegistry
+from app.sharding import RelayWriter, ShardRelay
+
+
+def _registry(depth: int) -> MetricsRegistry:
+    registry = MetricsRegistry()
+    counter = registry.counter('test_readings_total', 'Readings', ('sensor_type',))
+    counter.inc('gnss', amount=3)
+    histogram = registry.histogram('test_stage_seconds', 'Stage time', ('stage',), buckets=(0.1, 1.0))
+    histogram.observe(0.5, 'parse')
+    registry.gauge('test_queue_depth', 'Depth', ('queue',), lambda: [(("ingest",), depth)])
+    registry.gauge('test_clients', 'Clients', (), lambda: [((), 2)])
+    return registry
+
+
+def _families(text: str):
+    return [line.split()[2] for line in text.splitlines() if line.startswith('# TYPE')]
+
+
+def test_render_without_shards():
+    text = _registry(5).render()
+    assert 'test_readings_total{sensor_type="gnss"} 3' in text
+    assert 'test_stage_seconds_bucket{stage="parse",le="1"} 1' in text
+    assert 'test_stage_seconds_count{stage="parse"} 1' in text
+    assert 'test_clients 2' in text
+
+
+def test_render_merges_shard_snapshots_with_shard_label():
+    api = MetricsRegistry()
+    api.gauge('test_queue_depth', 'Depth', ('queue',), lambda: [(("ws_buffer",), 1)])
+    shards = {0: _registry(7).snapshot(), 1: _registry(9).snapshot()}
+    # Qua pipe dưới dạng JSON
+    shards = json.loads(json.dumps(shards))
+    shards = {int(k): v for k, v in shards.items()}
+
+    text = api.render(shards)
+    families = _families(text)
+    assert len(families) == len(set(families))  # Mỗi họ metric chỉ một cặp HELP/TYPE
+    assert 'test_queue_depth{queue="ws_buffer"} 1' in text
+    assert 'test_queue_depth{shard="0",queue="ingest"} 7' in text
+    assert 'test_queue_depth{shard="1",queue="ingest"} 9' in text
+    assert 'test_clients{shard="1"} 2' in text
+    assert 'test_stage_seconds_bucket{shard="0",stage="parse",le="+Inf"} 1' in text
+
+    # Sample của một họ nằm liền nhau ngay sau HELP/TYPE của họ đó
+    lines = text.splitlines()
+    start = lines.index('# TYPE test_queue_depth gauge')
+    assert [line.split('{')[0] for line in lines[start + 1:start + 4]] == ['test_queue_depth'] * 3
+
+
+def test_failing_gauge_does_not_break_render():
+    registry = _registry(1)
+    registry.gauge('test_broken', 'Broken', (), lambda: 1 / 0)
+    text = registry.render({0: registry.snapshot()})
+    assert '# ERROR test_broken' in text
+    assert 'test_clients 2' in text
+
+
+def test_relay_writer_and_shard_relay_roundtrip(monkeypatch):
+    stream = io.BytesIO()
+    writer = RelayWriter(stream)
+    writer.publish({'type': 'sensor_data', 'value': 1})
+    writer.publish_metrics(_registry(4).snapshot())
+    writer.queue.put_nowait(None)
+    writer._run()
+
+    broadcasts = []
+
+    async def fake_broadcast(message):
+        broadcasts.append(message)
+
+    monkeypatch.setattr(sharding.manager, 'broadcast', fake_broadcast)
+    relay = ShardRelay()
+    seen_during_run = {}
+
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(stream.getvalue())
+        task = asyncio.get_running_loop().create_task(relay.consume(3, reader))
+        await asyncio.sleep(0.01)
+        seen_during_run.update(relay.shard_metrics)
+        reader.feed_eof()
+        await task
+
+    asyncio.run(scenario())
+    assert broadcasts == [{'type': 'sensor_data', 'value': 1}]
+    assert relay.stats == {'relayed': 1, 'invalid': 0, 'metrics_updates': 1}
+    assert 'test_queue_depth{shard="3",queue="ingest"} 4' in MetricsRegistry().render(seen_during_run)
+    # Worker thoát: snapshot cũ không còn được xuất
+    assert relay.shard_metrics == {}
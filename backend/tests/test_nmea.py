@@ -0,0 +1,98 @@
+# backend/tests/test_nmea.py - Parser NMEA: checksum, câu hỏng, ghép GGA + RMC + GST theo UTC
+import calendar
+
+import pytest
+
+from processors.nmea import GGA, GST, RMC, checksum, parse_fixes, parse_sentence, parse_sentences
+
+
+def _frame(body: str) -> str:
+    return f"${body}*{checksum(body):02X}"
+
+
+GGA_1 = "GNGGA,021530.00,2101.2345,N,10550.6789,E,4,18,0.7,25.123,M,-28.0,M,1.0,0000"
+GGA_2 = "GNGGA,021531.00,2101.2346,N,10550.6790,E,4,18,0.7,25.125,M,-28.0,M,1.0,0000"
+RMC_1 = "GNRMC,021530.00,A,2101.2345,N,10550.6789,E,0.01,12.5,150326,,,R"
+GST_1 = "GNGST,021530.00,0.012,0.020,0.015,35.0,0.008,0.009,0.014"
+
+UTC_1 = 2 * 3600 + 15 * 60 + 30.0
+DATE_1 = calendar.timegm((2026, 3, 15, 0, 0, 0))
+
+
+def test_checksum_matches_known_sentence():
+    # Câu mẫu kinh điển trong tài liệu NMEA 0183
+    body = "GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,"
+    assert checksum(body) == 0x47
+
+
+def test_parse_gga_fields():
+    record = parse_sentence(_frame(GGA_1))
+    assert type(record) is GGA
+    assert record.talker == "GN"
+    assert record.utc == pytest.approx(UTC_1)
+    assert record.lat == pytest.approx(21 + 1.2345 / 60)
+    assert record.lon == pytest.approx(105 + 50.6789 / 60)
+    assert record.h == pytest.approx(25.123)
+    assert (record.fix_quality, record.num_sats, record.hdop) == (4, 18, 0.7)
+
+
+def test_parse_southern_western_hemisphere():
+    body = GGA_1.replace(",N,", ",S,").replace(",E,", ",W,")
+    record = parse_sentence(_frame(body))
+    assert record.lat < 0 and record.lon < 0
+
+
+@pytest.mark.parametrize("sentence", [
+    "$" + GGA_1 + "*00",                     # Sai checksum
+    "$" + GGA_1,                             # Thiếu '*hh'
+    _frame(GGA_1)[:-1],                      # Frame bị cắt giữa checksum
+    _frame(GGA_1)[1:],                       # Thiếu '$'
+    _frame("GNGGA,021530.00,2101.2345,N"),   # Thiếu trường
+    _frame("GNVTG,12.5,T,,M,0.01,N,0.02,K"),  # Loại câu không hỗ trợ
+    _frame(GGA_1.replace("2101.2345", "2175.0000")),  # Phút >= 60
+])
+def test_parse_sentence_rejects_bad_frames(sentence):
+    assert parse_sentence(sentence) is None
+
+
+def test_parse_gga_without_fix_is_dropped():
+    assert parse_sentence(_frame("GNGGA,021530.00,,,,,0,00,99.9,,M,,M,,")) is None
+
+
+def test_parse_rmc_and_gst():
+    rmc = parse_sentence(_frame(RMC_1))
+    gst = parse_sentence(_frame(GST_1))
+    assert type(rmc) is RMC and rmc.valid and rmc.date == DATE_1
+    assert type(gst) is GST
+    assert (gst.sigma_lat, gst.sigma_lon, gst.sigma_h) == (0.008, 0.009, 0.014)
+
+
+def test_parse_sentences_skips_broken_lines():
+    payload = "\r\n".join([_frame(GGA_1), "$" + GGA_2 + "*00", "garbage", _frame(RMC_1)])
+    assert [type(r) for r in parse_sentences(payload)] == [GGA, RMC]
+
+
+def test_parse_fixes_merges_rmc_date_and_gst_sigmas_by_utc():
+    payload = "\n".join(_frame(s) for s in (GGA_1, RMC_1, GST_1))
+    (fix,) = parse_fixes(payload)
+    assert fix.utc == pytest.approx(UTC_1)
+    assert fix.date == DATE_1
+    assert fix.timestamp == pytest.approx(DATE_1 + UTC_1)
+    assert (fix.sigma_lat, fix.sigma_lon, fix.sigma_h) == (0.008, 0.009, 0.014)
+
+
+def test_parse_fixes_without_rmc_has_no_timestamp():
+    (fix,) = parse_fixes(_frame(GGA_1))
+    assert fix.date is None
+    assert fix.timestamp is None
+    assert fix.sigma_lat is None
+
+
+def test_parse_fixes_multiple_epochs_keep_order_and_pairing():
+    # RMC / GST chỉ có cho epoch đầu; epoch thứ hai không được mượn dữ liệu của epoch khác
+    payload = "\n".join(_frame(s) for s in (GST_1, GGA_1, GGA_2, RMC_1))
+    first, second = parse_fixes(payload)
+    assert first.utc < second.utc
+    assert first.date == DATE_1 and first.sigma_h == 0.014
+    assert second.date is None and second.sigma_h is None
+    assert second.h == pytest.approx(25.125)
@@ -0,0 +1,182 @@
+# backend/tests/test_origin_estimator.py - Ước lượng gốc streaming: cổng ngoại lai, khóa, drift, relock
+import numpy as np
+import pytest
+
+from processors.geodesy import enu_rotation, enu_to_geodetic, geodetic_to_ecef
+from processors.gnss_processor import GNSSVelocityProcessor
+from processors.nmea import GNSSFix
+from processors.origin_estimator import DriftMonitor, OriginEstimator, RunningStats
+
+ORIGIN = (21.0205750, 105.8446483, 25.123)
+ORIGIN_ECEF = geodetic_to_ecef(*ORIGIN)
+ORIGIN_R = enu_rotation(ORIGIN[0], ORIGIN[1])
+
+
+def _feed(estimator: OriginEstimator, enu_points):
+    accepted = []
+    for enu in enu_points:
+        lat, lon, h = enu_to_geodetic(enu, *ORIGIN)
+        accepted.append(estimator.add(geodetic_to_ecef(lat, lon, h), float(lat), float(lon)))
+    return accepted
+
+
+def _fix(enu) -> GNSSFix:
+    lat, lon, h = enu_to_geodetic(np.asarray(enu, dtype=np.float64), *ORIGIN)
+    return GNSSFix("GN", 0.0, float(lat), float(lon), float(h), 4, 18, 0.7)
+
+
+def _noise(seed: int, count: int, sigma: float = 0.005, center=(0.0, 0.0, 0.0)):
+    return np.random.default_rng(seed).normal(0.0, sigma, (count, 3)) + np.asarray(center)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_running_stats_matches_numpy(seed):
+    points = np.random.default_rng(seed).normal(3.0, 2.0, (200, 3))
+    stats = RunningStats()
+    for p in points:
+        stats.add(p)
+    np.testing.assert_allclose(stats.mean, points.mean(axis=0), atol=1e-12)
+    np.testing.assert_allclose(stats.covariance(), np.cov(points, rowvar=False), atol=1e-10)
+    centered = points - points.mean(axis=0)
+    assert stats.rms() == pytest.approx(np.sqrt((centered ** 2).sum(axis=1).mean()))
+
+    restored = RunningStats()
+    restored.load_state(stats.get_state())
+    np.testing.assert_array_equal(restored.mean, stats.mean)
+
+
+def test_gate_rejects_far_points_after_warmup():
+    estimator = OriginEstimator(required_points=50, max_spread_m=1.0, gate_warmup=5)
+    # Trước warmup: điểm xa vẫn được nhận
+    assert _feed(estimator, [(0, 0, 0), (5.0, 0, 0)]) == [True, True]
+
+    estimator.reset()
+    assert all(_feed(estimator, _noise(0, 10)))
+    assert _feed(estimator, [(3.0, 0.0, 0.0)]) == [False]
+    assert estimator.rejected == 1
+    assert estimator.count == 10
+    assert _feed(estimator, [(0.01, 0.0, 0.0)]) == [True]
+
+
+def test_ready_locks_at_mean():
+    estimator = OriginEstimator(required_points=20, max_spread_m=0.05)
+    _feed(estimator, _noise(1, 19))
+    assert not estimator.ready()
+    _feed(estimator, _noise(2, 1))
+    assert estimator.ready()
+
+    origin = estimator.origin()
+    np.testing.assert_allclose(origin['ecef'], ORIGIN_ECEF, atol=0.01)
+    assert set(origin) == {'lat', 'lon', 'h', 'R', 'ecef'}
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_max_distance_bounds_true_max_distance(seed):
+    points = np.random.default_rng(seed).normal(0.0, 1.0, (50, 3))
+    stats = RunningStats()
+    for p in points:
+        stats.add(p)
+    true_max = np.linalg.norm(points - points.mean(axis=0), axis=1).max()
+    assert true_max <= stats.max_distance() <= np.sqrt(3) * true_max + 1e-12
+
+
+def test_single_outlier_beyond_max_spread_blocks_lock():
+    # RMS của 20 điểm chụm + 1 điểm xa 8 m ≈ 1.7 m (< 5 m) nhưng điểm xa vượt khoảng cách tối đa
+    estimator = OriginEstimator(required_points=20, max_spread_m=5.0, gate_warmup=1000)
+    _feed(estimator, np.concatenate([_noise(20, 1), [(8.0, 0.0, 0.0)], _noise(21, 19)]))
+    assert estimator.count == 21
+    assert estimator.stats.rms() < 5.0
+    assert estimator.spread() > 5.0
+    assert not estimator.ready()
+
+    clean = OriginEstimator(required_points=20, max_spread_m=5.0, gate_warmup=1000)
+    _feed(clean, _noise(22, 20, sigma=0.5))
+    assert clean.ready()
+
+
+def test_exhausted_when_spread_stays_too_high():
+    estimator = OriginEstimator(required_points=5, max_spread_m=0.05, max_points=20, gate_warmup=1000)
+    _feed(estimator, _noise(3, 19, sigma=1.0))
+    assert not estimator.exhausted()
+    _feed(estimator, _noise(4, 1, sigma=1.0))
+    assert not estimator.ready()
+    assert estimator.exhausted()
+
+
+def test_estimator_state_roundtrip():
+    estimator = OriginEstimator(required_points=10)
+    _feed(estimator, _noise(5, 8))
+    restored = OriginEstimator(required_points=10)
+    restored.load_state(estimator.get_state())
+    assert restored.count == estimator.count
+    np.testing.assert_array_equal(restored.stats.mean, estimator.stats.mean)
+
+
+def test_drift_monitor_ignores_noise_and_short_spikes():
+    drift = DriftMonitor(threshold_m=0.5, confirm=10)
+    for enu in _noise(6, 300):
+        assert not drift.update(enu)
+    for _ in range(3):
+        assert not drift.update(np.array([2.0, 0.0, 0.0]))
+    for enu in _noise(7, 50):
+        assert not drift.update(enu)
+    assert not drift.drifted
+
+
+def test_drift_monitor_confirms_step_and_keeps_post_step_stats():
+    drift = DriftMonitor(threshold_m=0.5, confirm=10)
+    for enu in _noise(8, 200):
+        drift.update(enu)
+    confirmed = [drift.update(enu) for enu in _noise(9, 40, center=(1.0, 0.0, 0.0))]
+    assert confirmed.count(True) == 1
+    assert drift.drifted
+    # Thống kê `recent` chỉ gồm các điểm sau bước nhảy
+    e, n, u = drift.offset()
+    assert e == pytest.approx(1.0, abs=0.01)
+    assert drift.recent.n <= 40
+
+
+def _locked_processor(**kwargs) -> GNSSVelocityProcessor:
+    processor = GNSSVelocityProcessor(1, None, required_points=10, max_spread_m=0.05, **kwargs)
+    results = [processor.process_gngga(_fix(enu), ts=float(i)) for i, enu in enumerate(_noise(10, 10))]
+    assert results[-1]['type'] == 'origin_locked'
+    return processor
+
+
+def test_relock_while_collecting_keeps_points():
+    processor = GNSSVelocityProcessor(1, None, required_points=10, max_spread_m=0.05)
+    for i, enu in enumerate(_noise(11, 4)):
+        processor.process_gngga(_fix(enu), ts=float(i))
+
+    result = processor.request_relock()
+    assert result == {"type": "origin_relock", "status": "COLLECTING", "count": 4}
+    assert processor.estimator.count == 4
+    assert processor.stats['relocks'] == 0
+
+
+def test_relock_without_drift_restarts_collection():
+    processor = _locked_processor(drift_confirm=5)
+    # Chuyển vị chậm thật (không phải bước nhảy): không được nhập vào gốc mới
+    for i in range(200):
+        processor.process_gngga(_fix((i * 0.001, 0.0, 0.0)), ts=100.0 + i)
+    assert not processor.drift.drifted
+
+    result = processor.request_relock()
+    assert result == {"type": "origin_relock", "status": "COLLECTING", "count": 0}
+    assert processor.state == "AWAITING_CANDIDATES"
+    assert processor.stats['relocks'] == 1
+
+
+def test_relock_after_drift_locks_at_new_position():
+    processor = _locked_processor(drift_confirm=5)
+    points = np.concatenate([_noise(12, 100), _noise(13, 60, center=(1.0, 0.5, 0.0))])
+    for i, enu in enumerate(points):
+        processor.process_gngga(_fix(enu), ts=100.0 + i)
+    assert processor.drift.drifted
+
+    result = processor.request_relock()
+    assert result['status'] == "LOCKED"
+    assert processor.state == "ORIGIN_LOCKED"
+    new_origin = geodetic_to_ecef(result['data']['lat'], result['data']['lon'], result['data']['h'])
+    enu = ORIGIN_R @ (new_origin - ORIGIN_ECEF)
+    np.testing.assert_allclose(enu, [1.0, 0.5, 0.0], atol=0.01)
@@ -0,0 +1,95 @@
+# backend/tests/test_payload_decoder.py - Giải mã payload MQTT (bytes) → bản rõ / bản ghi, kiểu mã hóa theo thiết bị
+import base64
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+from aes128decrypt import aes128_encrypt_base64
+from app.modules.payload_decoder import (
+    DEFAULT_ENCODING,
+    ENCODING_AES_CBC,
+    ENCODING_CUSTOM_AES,
+    ENCODING_PLAINTEXT,
+    decode_batch,
+    decode_payload,
+    decrypt_payload,
+    decrypt_payloads,
+    resolve_encoding,
+)
+
+GNGGA = "$GNGGA,021530.00,2101.2345,N,10550.6789,E,4,18,0.7,25.123,M,-28.0,M,1.0,0000*40\r\n"
+# Bản tin thật thiết bị gửi (key mặc định), giữ cố định để bắt lỗi ở cả hai chiều mã hóa/giải mã
+GNGGA_CIPHERTEXT = (
+    b"d+nTxqZDZDw9WBmtSOmBMw2Mh87c+yRlKfC+8ToJZTcCnu5QzAMHe8QNtEtvyXBAeXcCi1Nyr7uMtEoESz/PCFLtrZcjUknv5HA5SWg9X+LPMg1j15h1tw/sEaSIxi3P"
+)
+
+
+def test_fixture_matches_device_encryption():
+    assert aes128_encrypt_base64(GNGGA).encode('ascii') == GNGGA_CIPHERTEXT
+
+
+@pytest.mark.parametrize("payload", [GNGGA_CIPHERTEXT, bytearray(GNGGA_CIPHERTEXT)])
+def test_base64_bytes_payload_decrypts_to_gngga(payload):
+    assert decrypt_payload(payload, DEFAULT_ENCODING) == GNGGA
+    assert decrypt_payloads([payload]) == [GNGGA]
+
+
+def test_decode_payload_returns_gnss_fix():
+    fixes = decode_payload('gnss', GNGGA_CIPHERTEXT)
+    assert len(fixes) == 1
+    assert fixes[0].talker == "GN"
+    assert fixes[0].lat == pytest.approx(21 + 1.2345 / 60)
+    assert decode_batch([('gnss', GNGGA_CIPHERTEXT, DEFAULT_ENCODING)]) == [fixes]
+
+
+def test_binary_and_corrupt_payloads_are_rejected():
+    assert decrypt_payload(bytes([0xD3, 0x00, 0x13, 0x3E, 0xD0])) is None  # RTCM
+    assert decrypt_payload(GNGGA_CIPHERTEXT[:-8]) is None
+    assert decode_payload('gnss', b"") is None
+
+
+KEY_HEX = "000102030405060708090a0b0c0d0e0f"
+IV_HEX = "f0e0d0c0b0a090807060504030201000"
+
+
+def test_resolve_encoding_defaults_to_custom_aes():
+    assert resolve_encoding(None) == DEFAULT_ENCODING
+    assert resolve_encoding({}) == DEFAULT_ENCODING
+    assert resolve_encoding({"encoding": " Custom_AES "}) == DEFAULT_ENCODING
+    assert resolve_encoding({"encoding": "custom_aes", "aes_key": KEY_HEX}) == (
+        ENCODING_CUSTOM_AES, bytes.fromhex(KEY_HEX), None
+    )
+
+
+def test_resolve_encoding_plaintext():
+    assert resolve_encoding({"encoding": "plaintext", "aes_key": KEY_HEX}) == (ENCODING_PLAINTEXT, None, None)
+
+
+def test_resolve_encoding_aes_cbc_hex_key_and_iv():
+    spec = resolve_encoding({"encoding": "aes_cbc", "aes_key": KEY_HEX.upper(), "aes_iv": IV_HEX})
+    assert spec == (ENCODING_AES_CBC, bytes.fromhex(KEY_HEX), bytes.fromhex(IV_HEX))
+
+    cipher = AES.new(spec[1], AES.MODE_CBC, spec[2])
+    payload = base64.b64encode(cipher.encrypt(pad(GNGGA.encode(), AES.block_size)))
+    assert decrypt_payload(payload, spec) == GNGGA
+    assert decrypt_payloads([payload, GNGGA_CIPHERTEXT], [spec, DEFAULT_ENCODING]) == [GNGGA, GNGGA]
+
+
+@pytest.mark.parametrize("config", [
+    {"encoding": "aes_cbc", "aes_key": KEY_HEX},                       # Thiếu IV
+    {"encoding": "aes_cbc", "aes_key": "zz" * 16, "aes_iv": IV_HEX},   # Không phải hex
+    {"encoding": "aes_cbc", "aes_key": KEY_HEX[:30], "aes_iv": IV_HEX},  # 15 byte
+    {"encoding": "custom_aes", "aes_key": KEY_HEX + "00"},             # 17 byte
+    {"encoding": "rot13"},
+])
+def test_resolve_encoding_rejects_invalid_config(config):
+    with pytest.raises(ValueError):
+        resolve_encoding(config)
+
+
+def test_plaintext_device_skips_decryption():
+    spec = resolve_encoding({"encoding": "plaintext"})
+    assert decrypt_payload(GNGGA.encode(), spec) == GNGGA
+    assert decode_payload('water', b'{"value": 1.5}', spec) == {"value": 1.5}
+    assert decrypt_payload(bytes([0xD3, 0xFF, 0xFE]), spec) is None
@@ -0,0 +1,143 @@
+# backend/tests/test_rollups.py - Rollup flush: gộp trùng key, thử lại sau lỗi tạm thời không cộng trùng
+import asyncio
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.clock import ReplayClock
+from app.rollups import RollupAggregator
+
+
+class _FakeConnection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def execute(self, statement, rows):
+        self.engine.statements.append([dict(row) for row in rows])
+
+
+class _FakeBegin:
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def __aenter__(self):
+        if self.engine.failures:
+            raise self.engine.failures.pop(0)
+        return _FakeConnection(self.engine)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _FakeEngine:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.statements = []
+
+    def begin(self):
+        return _FakeBegin(self)
+
+
+def _key(row):
+    return (row['station_id'], row['device_id'], row['sensor_type'], row['metric'], row['resolution'], row['bucket_start'])
+
+
+def _aggregator(engine, **kwargs):
+    clock = ReplayClock()
+    clock.set(1000.0)
+    return RollupAggregator(engine, grace_s=0, clock=clock, **kwargs), clock
+
+
+def _water(aggregator, ts, value, device_id=7):
+    aggregator.add(1, device_id, 'water', ts, {'water_level': value})
+
+
+def _rows_1m(engine):
+    rows = [row for statement in engine.statements for row in statement if row['resolution'] == '1m']
+    return {row['bucket_start']: row for row in rows}
+
+
+def _close_all(aggregator, clock):
+    clock.set(clock.time() + 86400 * 2)
+    aggregator._close_expired()
+
+
+def test_reopened_bucket_is_merged_into_one_row():
+    engine = _FakeEngine()
+    aggregator, clock = _aggregator(engine)
+    _water(aggregator, 60, 1.0)
+    _water(aggregator, 70, 3.0)
+    _close_all(aggregator, clock)
+    # Dữ liệu tới muộn mở lại cùng bucket 1 phút
+    _water(aggregator, 65, 5.0)
+    _close_all(aggregator, clock)
+
+    asyncio.run(aggregator.flush())
+    row = _rows_1m(engine)[60]
+    assert (row['count'], row['min'], row['max'], row['sum'], row['mean']) == (3, 1.0, 5.0, 9.0, 3.0)
+    assert (row['last'], row['last_ts']) == (3.0, 70)
+
+
+def test_no_statement_upserts_the_same_key_twice():
+    engine = _FakeEngine()
+    aggregator, clock = _aggregator(engine, chunk_size=2)
+    for round_ in range(3):
+        for ts in range(0, 300, 20):
+            _water(aggregator, ts, float(round_))
+        _close_all(aggregator, clock)
+
+    asyncio.run(aggregator.flush())
+    assert len(engine.statements) > 1
+    keys = [_key(row) for statement in engine.statements for row in statement]
+    assert len(keys) == len(set(keys))
+
+
+def test_retry_after_transient_error_is_idempotent():
+    clean = _FakeEngine()
+    expected, clean_clock = _aggregator(clean)
+    failing = _FakeEngine(failures=[OperationalError("INSERT", {}, ConnectionError("db down"))] * 2)
+    aggregator, clock = _aggregator(failing)
+
+    for target, target_clock in ((expected, clean_clock), (aggregator, clock)):
+        for ts in (60, 80, 130):
+            _water(target, ts, ts / 10)
+        _close_all(target, target_clock)
+
+    asyncio.run(aggregator.flush())
+    asyncio.run(aggregator.flush())
+    assert failing.statements == []
+    assert aggregator.stats['errors'] == 2
+    assert aggregator.get_stats()['pending_buckets'] == len(aggregator.closed)
+
+    # Dữ liệu muộn của cùng bucket đến trước lần thử lại thành công
+    for target, target_clock in ((expected, clean_clock), (aggregator, clock)):
+        _water(target, 90, 20.0)
+        _close_all(target, target_clock)
+
+    asyncio.run(aggregator.flush())
+    asyncio.run(expected.flush())
+    assert failing.statements and not aggregator.closed
+    assert _rows_1m(failing) == _rows_1m(clean)
+    assert _rows_1m(failing)[60]['count'] == 3
+
+
+def test_permanent_error_drops_buckets():
+    engine = _FakeEngine(failures=[IntegrityError("INSERT", {}, Exception("bad"))])
+    aggregator, clock = _aggregator(engine)
+    _water(aggregator, 60, 1.0)
+    _close_all(aggregator, clock)
+
+    asyncio.run(aggregator.flush())
+    assert aggregator.closed == []
+    assert aggregator.stats['dropped'] == 3  # 1m / 1h / 1d
+
+
+def test_retry_queue_is_bounded():
+    engine = _FakeEngine(failures=[OperationalError("INSERT", {}, ConnectionError("db down"))])
+    aggregator, clock = _aggregator(engine, max_pending=4)
+    for ts in range(0, 600, 60):
+        _water(aggregator, ts, 1.0)
+    _close_all(aggregator, clock)
+
+    asyncio.run(aggregator.flush())
+    assert len(aggregator.closed) == 4
+    assert aggregator.stats['dropped'] == 10 + 1 + 1 - 4
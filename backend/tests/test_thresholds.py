@@ -0,0 +1,99 @@
+# backend/tests/test_thresholds.py - VelocityClassifier cho cùng kết quả với cách duyệt bảng cũ
+import math
+
+import numpy as np
+import pytest
+
+from app.thresholds import DEFAULT_VELOCITY_CLASSIFICATION, STABLE, VelocityClassifier
+
+
+def _legacy_classify(velocity_mm_s, classification_table):
+    # Bản sao LandslideAnalyzer._classify_velocity_extended trước khi biên dịch ngưỡng
+    if not classification_table:
+        classification_table = DEFAULT_VELOCITY_CLASSIFICATION
+    normalized_table = []
+    for cls in classification_table:
+        thresh = float(cls.get('threshold', 0))
+        unit = cls.get('unit', 'mm/s')
+        thresh_mm_s = thresh
+        if unit == 'mm/year': thresh_mm_s = thresh / 31536000
+        elif unit == 'mm/day': thresh_mm_s = thresh / 86400
+        elif unit == 'm/s': thresh_mm_s = thresh * 1000
+        normalized_table.append({"name": cls.get('name', 'Unknown'), "threshold_mm_s": thresh_mm_s})
+
+    sorted_classes = sorted(normalized_table, key=lambda x: x['threshold_mm_s'], reverse=True)
+    for cls in sorted_classes:
+        if velocity_mm_s >= cls['threshold_mm_s']:
+            return cls['name']
+    return "Stable"
+
+
+MIXED_UNITS = [
+    {"name": "Fast", "threshold": 0.05, "unit": "m/s"},
+    {"name": "Daily", "threshold": 17, "unit": "mm/day"},
+    {"name": "Yearly", "threshold": 16, "unit": "mm/year"},
+    {"name": "Creep", "threshold": 1e-9},  # Không có đơn vị → mm/s
+    {"name": "Odd unit", "threshold": 3, "unit": "furlong/fortnight"},
+]
+# Ngưỡng trùng nhau sau khi đổi đơn vị: lớp khai báo trước thắng
+TIES = [
+    {"name": "B", "threshold": 1, "unit": "mm/s"},
+    {"name": "A", "threshold": 86400, "unit": "mm/day"},
+    {"name": "C", "threshold": 0.001, "unit": "m/s"},
+    {"name": "Zero", "threshold": 0},
+]
+TABLES = [[], DEFAULT_VELOCITY_CLASSIFICATION, MIXED_UNITS, TIES]
+
+
+def _probe_velocities(table):
+    classifier = VelocityClassifier.compile(table)
+    values = [-1.0, 0.0, math.inf, -math.inf, math.nan]
+    for t in classifier.bounds:
+        values += [t, np.nextafter(t, -math.inf), np.nextafter(t, math.inf), t * 2]
+    rng = np.random.default_rng(0)
+    values += list(10.0 ** rng.uniform(-10, 4, 200))
+    return values
+
+
+@pytest.mark.parametrize("table", TABLES)
+def test_classify_matches_legacy_table_walk(table):
+    classifier = VelocityClassifier.compile(table)
+    for v in _probe_velocities(table):
+        assert classifier.classify(float(v)) == _legacy_classify(float(v), table), v
+
+
+@pytest.mark.parametrize("table", TABLES)
+def test_vectorized_path_matches_scalar(table):
+    classifier = VelocityClassifier.compile(table)
+    values = np.array(_probe_velocities(table), dtype=np.float64)
+    names = classifier.classify_many(values)
+    assert list(names) == [_legacy_classify(float(v), table) for v in values]
+    levels = classifier.levels_many(values)
+    assert list(levels) == [classifier.levels[classifier.index(float(v))] for v in values]
+
+
+def test_unit_normalisation_is_exact_on_boundaries():
+    classifier = VelocityClassifier.compile(MIXED_UNITS)
+    assert classifier.classify(16 / 31536000) == "Yearly"
+    assert classifier.classify(17 / 86400) == "Daily"
+    assert classifier.classify(50.0) == "Fast"
+    assert classifier.classify(3.0) == "Odd unit"
+
+
+def test_ties_prefer_first_declared_class():
+    classifier = VelocityClassifier.compile(TIES)
+    assert classifier.classify(1.0) == "B"
+    assert classifier.classify(0.5) == "Zero"
+
+
+def test_nan_and_negative_are_stable():
+    classifier = VelocityClassifier.compile([])
+    assert classifier.classify(math.nan) == STABLE
+    assert classifier.classify(-0.1) == STABLE
+    assert list(classifier.classify_many([math.nan, -0.1, 0.0])) == [STABLE, STABLE, "Extremely Slow"]
+
+
+def test_invalid_rows_are_skipped():
+    table = [{"name": "Bad", "threshold": "fast"}, {"name": "NaN", "threshold": math.nan}, {"name": "Ok", "threshold": 1}]
+    classifier = VelocityClassifier.compile(table)
+    assert classifier.names == ("Ok", STABLE)
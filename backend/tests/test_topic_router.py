@@ -0,0 +1,105 @@
+# backend/tests/test_topic_router.py - Topic trie (+, #, quy tắc '$'), filter_covers, router
+import pytest
+
+from app.topic_router import TopicRouter, TopicTrie, filter_covers, has_wildcard
+
+
+def _trie(*filters) -> TopicTrie:
+    trie = TopicTrie()
+    for f in filters:
+        trie.insert(f, f)
+    return trie
+
+
+FILTERS = ('sensor/1/gnss', 'sensor/+/gnss', 'sensor/#', 'sensor/+/#', '+/+/gnss', '#')
+
+
+@pytest.mark.parametrize("topic, expected", [
+    ('sensor/1/gnss', {'sensor/1/gnss', 'sensor/+/gnss', 'sensor/#', 'sensor/+/#', '+/+/gnss', '#'}),
+    ('sensor/2/rain', {'sensor/#', 'sensor/+/#', '#'}),
+    ('sensor/1', {'sensor/#', 'sensor/+/#', '#'}),  # '#' khớp cả cấp cha
+    ('sensor', {'sensor/#', '#'}),
+    ('other/1/gnss', {'+/+/gnss', '#'}),
+    ('sensor/1/gnss/extra', {'sensor/#', 'sensor/+/#', '#'}),
+])
+def test_match_returns_every_matching_filter(topic, expected):
+    matches = _trie(*FILTERS).match(topic)
+    assert set(matches) == expected
+    assert len(matches) == len(expected)
+
+
+def test_plus_matches_exactly_one_level_including_empty():
+    trie = _trie('a/+/c')
+    assert trie.match('a/b/c') == ['a/+/c']
+    assert trie.match('a//c') == ['a/+/c']
+    assert trie.match('a/b/x/c') == []
+    assert trie.match('a/c') == []
+
+
+def test_dollar_topics_skip_wildcards_at_first_level():
+    trie = _trie('#', '+/monitor/clients', '$SYS/#', '$SYS/+/clients')
+    assert set(trie.match('$SYS/monitor/clients')) == {'$SYS/#', '$SYS/+/clients'}
+    # Chỉ cấp đầu bị chặn
+    assert set(trie.match('sys/monitor/clients')) == {'#', '+/monitor/clients'}
+
+
+def test_insert_replaces_value_and_counts_unique_filters():
+    trie = TopicTrie()
+    trie.insert('a/+', 1)
+    trie.insert('a/+', 2)
+    trie.insert('a/#', 3)
+    assert len(trie) == 2
+    assert sorted(trie.match('a/b')) == [2, 3]
+
+
+@pytest.mark.parametrize("topic_filter, topic, covered", [
+    ('sensor/#', 'sensor/1/gnss', True),
+    ('sensor/#', 'sensor', True),
+    ('sensor/+/gnss', 'sensor/1/gnss', True),
+    ('sensor/+/gnss', 'sensor/1/rain', False),
+    ('sensor/+', 'sensor/1/gnss', False),
+    ('sensor/1/gnss', 'sensor/1/gnss', True),
+    ('sensor/1/gnss', 'sensor/1', False),
+    # Topic cũng là filter: chỉ được che khi filter rộng hơn
+    ('sensor/#', 'sensor/+/gnss', True),
+    ('sensor/+/gnss', 'sensor/+/gnss', True),
+    ('sensor/+/+', 'sensor/#', False),
+    ('sensor/+', 'sensor/#', False),
+    ('#', 'anything/#', True),
+])
+def test_filter_covers(topic_filter, topic, covered):
+    assert filter_covers(topic_filter, topic) is covered
+
+
+def test_has_wildcard():
+    assert has_wildcard('a/+/b') and has_wildcard('a/#')
+    assert not has_wildcard('a/b')
+
+
+def test_router_resolves_exact_before_wildcard():
+    router = TopicRouter()
+    exact_info, wildcard_info = {'device_id': 1}, {'device_id': 2}
+    router.rebuild({'st/1/gnss': exact_info, 'st/+/gnss': wildcard_info})
+    assert router.resolve('st/1/gnss') is exact_info
+    assert router.resolve('st/9/gnss') is wildcard_info
+    assert router.resolve('st/9/rain') is None
+
+
+def test_rebuild_swaps_exact_and_trie_together():
+    router = TopicRouter()
+    router.rebuild({'a/b': {'v': 1}, 'a/+': {'v': 2}})
+    before = router.routes
+    router.rebuild({'x/y': {'v': 3}})
+    assert router.routes is not before
+    assert router.resolve('a/b') is None and router.resolve('a/c') is None
+    assert router.resolve('x/y') == {'v': 3}
+    # Bảng cũ (có thể đang được một thread khác đọc) không bị sửa
+    assert before.exact == {'a/b': {'v': 1}, 'a/+': {'v': 2}}
+    assert before.trie.match('a/c') == [{'v': 2}]
+
+
+def test_subscriptions_for_uses_filters_and_uncovered_topics():
+    router = TopicRouter(['sensor/#', ' ', ''])
+    assert router.wildcard_mode
+    assert router.subscriptions_for(['sensor/1/gnss', 'legacy/1/rain']) == {'sensor/#', 'legacy/1/rain'}
+    assert TopicRouter().subscriptions_for(['a', 'b']) == {'a', 'b'}